@@ -0,0 +1,327 @@
+import asyncio
+import bisect
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, request, session
+
+from metrics import ADMISSION_SHED, ADMISSION_WAIT_SECONDS
+
+# Endpoint -> route class; endpoints starting with admin_ not listed here
+# are 'admin', anything else (static files, media, logout, the metrics
+# scrape, the turnout stream and exports including the roster CSV, which
+# have their own TURNOUT_MAX_STREAMS / EXPORT_MAX_CONCURRENT caps) is not
+# admission-controlled
+ROUTE_CLASSES = {
+    'cast_vote': 'vote',
+    'voter_login': 'login',
+    'voter_register': 'login',
+    'admin_login': 'login',
+    'voter_dashboard': 'ballot',
+    'voter_elections': 'ballot',
+    'voter_candidates': 'ballot',
+    'voter_results_select': 'results',
+    'voter_results': 'results',
+}
+EXEMPT = {'admin_metrics', 'admin_turnout_stream', 'admin_export', 'admin_export_manifest',
+          'admin_voters_export'}
+
+
+def route_class(endpoint):
+    if endpoint is None or endpoint in EXEMPT:
+        return None
+    if endpoint in ROUTE_CLASSES:
+        return ROUTE_CLASSES[endpoint]
+    return 'admin' if endpoint.startswith('admin_') else None
+
+
+class AdmissionControl:
+    """Concurrency budgets per route class with one priority wait queue.
+
+    At most ``total`` requests run at once, and at most ``limit`` of any
+    one class. A request that finds no free slot waits in the queue (at
+    most ``queue`` per class, ``max_wait`` seconds); whenever a slot frees
+    up, the waiting request of the highest-priority class whose own budget
+    allows it goes first, FIFO within a class. A full queue or a wait that
+    runs out sheds the request. Threads wait with acquire(), coroutines on
+    the ASGI event loop with acquire_async().
+    """
+
+    def __init__(self, classes, total, max_wait=2.0):
+        self.total = total
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        # sorted (priority, ticket, class name)
+        self._waiters = []
+        # waiter -> (event loop, asyncio.Event) for acquire_async()
+        self._async_waiters = {}
+        self._running = 0
+        self._classes = {
+            name: {
+                'priority': spec['priority'],
+                'limit': spec['limit'],
+                'queue': spec['queue'],
+                'running': 0,
+                'queued': 0,
+                'admitted': 0,
+                'waited': 0,
+                'shed_queue_full': 0,
+                'shed_timeout': 0,
+            }
+            for name, spec in classes.items()
+        }
+
+    def _next_waiter(self):
+        if self._running >= self.total:
+            return None
+        for waiter in self._waiters:
+            cls = self._classes[waiter[2]]
+            if cls['running'] < cls['limit']:
+                return waiter
+        return None
+
+    def _wake(self):
+        self._cond.notify_all()
+        for loop, event in self._async_waiters.values():
+            loop.call_soon_threadsafe(event.set)
+
+    def _take(self, cls):
+        self._running += 1
+        cls['running'] += 1
+        cls['admitted'] += 1
+
+    def _enter(self, name):
+        # Called with the lock held: admits at once (None), sheds
+        # ('queue_full') or queues the request and returns its waiter
+        cls = self._classes[name]
+        if not self._waiters and self._running < self.total and cls['running'] < cls['limit']:
+            self._take(cls)
+            return None
+        if cls['queued'] >= cls['queue']:
+            cls['shed_queue_full'] += 1
+            return 'queue_full'
+        waiter = (cls['priority'], next(self._tickets), name)
+        bisect.insort(self._waiters, waiter)
+        cls['queued'] += 1
+        return waiter
+
+    def _try_admit(self, waiter):
+        if self._next_waiter() is not waiter:
+            return False
+        cls = self._classes[waiter[2]]
+        self._take(cls)
+        cls['waited'] += 1
+        return True
+
+    def _leave(self, waiter, admitted):
+        self._waiters.remove(waiter)
+        self._async_waiters.pop(waiter, None)
+        cls = self._classes[waiter[2]]
+        cls['queued'] -= 1
+        if not admitted:
+            cls['shed_timeout'] += 1
+        # Whoever is next may be eligible now that this one left
+        self._wake()
+
+    def acquire(self, name):
+        """Admit a request of class ``name``; returns None, 'queue_full' or 'timeout'."""
+        start = time.monotonic()
+        with self._cond:
+            waiter = self._enter(name)
+            if waiter is None or waiter == 'queue_full':
+                return waiter
+            admitted = False
+            try:
+                while True:
+                    admitted = self._try_admit(waiter)
+                    remaining = start + self.max_wait - time.monotonic()
+                    if admitted or remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            finally:
+                self._leave(waiter, admitted)
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start, name)
+        return None if admitted else 'timeout'
+
+    async def acquire_async(self, name):
+        """acquire() for a coroutine: waits on the event loop instead of a thread."""
+        start = time.monotonic()
+        event = asyncio.Event()
+        with self._cond:
+            waiter = self._enter(name)
+            if waiter is None or waiter == 'queue_full':
+                return waiter
+            self._async_waiters[waiter] = (asyncio.get_running_loop(), event)
+        admitted = False
+        try:
+            while True:
+                with self._cond:
+                    admitted = self._try_admit(waiter)
+                    event.clear()
+                remaining = start + self.max_wait - time.monotonic()
+                if admitted or remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._leave(waiter, admitted)
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start, name)
+        return None if admitted else 'timeout'
+
+    def release(self, name):
+        with self._cond:
+            self._running -= 1
+            self._classes[name]['running'] -= 1
+            self._wake()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'total': self.total,
+                'running': self._running,
+                'queued': len(self._waiters),
+                'classes': {name: dict(cls) for name, cls in self._classes.items()},
+            }
+
+
+class TokenBuckets:
+    """Token-bucket rate limits per key (voter id, client address).
+
+    Each key may make ``burst`` requests at once and ``rate`` per second
+    after that. Buckets live in an LRU of at most ``max_keys`` entries; the
+    one evicted is the longest idle, which would have refilled anyway.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.limited = 0
+        self.evicted = 0
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+            return allowed
+
+    def retry_after(self):
+        return max(1, round(1 / self.rate))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._buckets),
+                'max_keys': self.max_keys,
+                'limited': self.limited,
+                'evicted': self.evicted,
+            }
+
+
+def _rate_limited(name):
+    admission = current_app.extensions['admission']
+    limits = [('ip', admission['ip'], request.remote_addr)]
+    if 'voter_id' in session:
+        limits.append(('voter', admission['voter'], session['voter_id']))
+    for kind, buckets, key in limits:
+        if not buckets.allow(key):
+            ADMISSION_SHED.inc(1, name, f'rate_{kind}')
+            return ('Too many requests, please slow down.', 429,
+                    {'Retry-After': str(buckets.retry_after())})
+    return None
+
+
+def _admitted(name, shed):
+    if shed is not None:
+        ADMISSION_SHED.inc(1, name, shed)
+        return ('The server is busy, please try again shortly.', 503,
+                {'Retry-After': str(current_app.config['ADMISSION_RETRY_AFTER'])})
+    g.admission_class = name
+    return None
+
+
+def admit():
+    """Admit the current request, or return the response that turns it away."""
+    name = route_class(request.endpoint)
+    if name is None or 'admission' not in current_app.extensions:
+        return None
+    return _rate_limited(name) or _admitted(
+        name, current_app.extensions['admission']['control'].acquire(name))
+
+
+async def admit_async():
+    """admit() for the ASGI app's async views."""
+    request.environ['voting.admitted'] = True
+    name = route_class(request.endpoint)
+    if name is None or 'admission' not in current_app.extensions:
+        return None
+    return _rate_limited(name) or _admitted(
+        name, await current_app.extensions['admission']['control'].acquire_async(name))
+
+
+def init_admission(app):
+    if not app.config['ADMISSION_ENABLED']:
+        return
+    voter_rate, voter_burst = app.config['RATE_LIMIT_VOTER']
+    ip_rate, ip_burst = app.config['RATE_LIMIT_IP']
+    control = AdmissionControl(app.config['ADMISSION_CLASSES'], app.config['ADMISSION_TOTAL'],
+                               app.config['ADMISSION_MAX_WAIT'])
+    app.extensions['admission'] = {
+        'control': control,
+        'voter': TokenBuckets(voter_rate, voter_burst, app.config['RATE_LIMIT_MAX_KEYS']),
+        'ip': TokenBuckets(ip_rate, ip_burst, app.config['RATE_LIMIT_MAX_KEYS']),
+    }
+
+    @app.before_request
+    def _admit():
+        # The ASGI app admits its async views itself, waiting on the event loop
+        if not request.environ.get('voting.admitted'):
+            return admit()
+
+    @app.teardown_request
+    def _release(exc=None):
+        name = g.pop('admission_class', None)
+        if name is not None:
+            control.release(name)
+
+
+def get_admission():
+    return current_app.extensions.get('admission')
+
+
+def admission_stats():
+    admission = get_admission()
+    if admission is None:
+        return {'enabled': False}
+    stats = admission['control'].stats()
+    stats['rate_limits'] = {'voter': admission['voter'].stats(), 'ip': admission['ip'].stats()}
+    return stats
+
+
+def admission_gauges():
+    """admission_stats() flattened for REGISTRY.add_gauges (vote_queued, rate_ip_limited, ...)."""
+    stats = admission_stats()
+    gauges = {key: value for key, value in stats.items() if not isinstance(value, dict)}
+    for name, values in stats.get('classes', {}).items():
+        gauges.update({f'{name}_{key}': value for key, value in values.items()})
+    for kind, values in stats.get('rate_limits', {}).items():
+        gauges.update({f'rate_{kind}_{key}': value for key, value in values.items()})
+    return gauges
@@ -1,28 +1,128 @@
-import os
-import MySQLdb
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+import csv
+import io
+from datetime import datetime
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, make_response
 from config import Config
+from db import (init_pool, get_db, get_read_db, release_db, read_from_replica, get_pool, get_replicas,
+                PoolTimeout, DictCursor, IntegrityError, is_duplicate)
+import schema
+import tallies
+import archive
+import exports
+import jobs
+from results_cache import init_results_cache, get_results_cache
+from election_index import init_election_index, get_election_index
+from page_cache import init_page_cache, get_page_cache, FLASH_SLOT
+from passwords import init_hasher, get_hasher, KdfBusy
+import media
+import voter_import
+from metrics import REGISTRY, init_metrics
+from turnout import init_turnout, get_turnout, TURNOUT_STREAM_HEADERS
+from vote_guard import init_vote_guard, get_vote_guard
+from vote_journal import init_vote_journal, get_vote_journal, journal_directory, wait_for_writers
+from admission import init_admission, admission_stats, admission_gauges
+from shared_store import init_shared_store, get_shared_store
 
 app = Flask(__name__)
 app.config.from_object(Config)
+# Deployment overrides: a Python file of UPPERCASE settings
+app.config.from_envvar('VOTING_SETTINGS', silent=True)
 Config.init_app(app)
 
-# Database connection
-def get_db():
-    return MySQLdb.connect(
-        host=app.config['MYSQL_HOST'],
-        user=app.config['MYSQL_USER'],
-        password=app.config['MYSQL_PASSWORD'],
-        db=app.config['MYSQL_DB']
-    )
+# Database connection pool (one pooled connection per request)
+init_pool(app)
+
+# Request, SQL, template and KDF timings for /admin/metrics
+init_metrics(app)
+
+# Concurrency budgets per route class, votes first, and per-voter/IP rate limits
+init_admission(app)
+
+@app.errorhandler(PoolTimeout)
+def pool_exhausted(e):
+    return 'The server is busy, please try again shortly.', 503
+
+app.cli.add_command(schema.db_cli)
+app.cli.add_command(tallies.tallies_cli)
+app.cli.add_command(archive.archive_cli)
+app.cli.add_command(exports.export_cli)
+app.cli.add_command(voter_import.voters_cli)
+app.cli.add_command(jobs.jobs_cli)
+
+# Streaming auditor exports (results and vote ledgers), a few at a time
+exports.init_exports(app)
+
+# Versioned state shared by the worker processes on this host
+init_shared_store(app)
+
+# Heavy admin operations run as background jobs
+jobs.init_jobs(app)
+
+# Dashboard counters, sampled once per interval for every viewer
+init_turnout(app)
+
+# Per-election bitmaps of voters who already voted
+init_vote_guard(app)
+
+# Write-behind vote journal (only when VOTE_INGEST_MODE is 'journal')
+init_vote_journal(app)
+
+# Password hashing runs on its own bounded pool
+init_hasher(app)
+
+@app.errorhandler(KdfBusy)
+def kdf_busy(e):
+    return 'Too many sign-ins right now, please try again shortly.', 503
+
+# Results cache (live LRU + frozen snapshots of completed elections)
+init_results_cache(app)
+
+# Active elections and their candidates, indexed by voting window
+init_election_index(app)
+
+# Rendered ballot and election list pages, keyed by the data they show
+init_page_cache(app)
 
 # Allowed file extensions
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+# Serve a page with an ETag so repeat views can be answered with 304
+def conditional_page(etag, template, **context):
+    # Pages carrying flash messages are one-off and must not be cached
+    if '_flashes' in session:
+        return render_template(template, **context)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render_template(template, **context))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Serve a page every voter sees the same way from the page cache; only the
+# flash messages are rendered per request
+def cached_page(key, version, template, load):
+    entry = get_page_cache().render(key, version, template, load)
+    if '_flashes' in session:
+        return entry['html'].replace(FLASH_SLOT, render_template('includes/flashes.html'), 1)
+    if request.if_none_match.contains(entry['etag']):
+        response = Response(status=304)
+    else:
+        response = make_response(entry['html'].replace(FLASH_SLOT, '', 1))
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Candidate media: content-addressed uploads with resized variants
+app.cli.add_command(media.media_cli)
+app.jinja_env.globals['media_url'] = media.media_url
+
+@app.route('/media/<path:filename>')
+def media_file(filename):
+    return media.serve_media(filename)
+
 # Home route
 @app.route('/')
 def home():
@@ -37,7 +137,7 @@ def voter_register():
         full_name = request.form['full_name']
         voter_id = request.form['voter_id']
         email = request.form['email']
-        password = generate_password_hash(request.form['password'])
+        password = get_hasher().hash(request.form['password'])
         
         conn = get_db()
         cursor = conn.cursor()
@@ -47,14 +147,14 @@ def voter_register():
                 "INSERT INTO voters (full_name, voter_id, email, password) VALUES (%s, %s, %s, %s)",
                 (full_name, voter_id, email, password)
             )
+            tallies.bump_counter(cursor, 'voters')
             conn.commit()
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('voter_login'))
-        except MySQLdb.IntegrityError:
+        except IntegrityError:
             flash('Voter ID or Email already exists!', 'danger')
         finally:
             cursor.close()
-            conn.close()
     
     return render_template('voter/register.html')
 
@@ -65,17 +165,27 @@ def voter_login():
         identifier = request.form['identifier']
         password = request.form['password']
         
-        conn = get_db()
-        cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+        cursor = get_db().cursor(DictCursor)
         cursor.execute(
             "SELECT * FROM voters WHERE email = %s OR voter_id = %s",
             (identifier, identifier)
         )
         voter = cursor.fetchone()
         cursor.close()
-        conn.close()
-        
-        if voter and check_password_hash(voter['password'], password):
+        # No connection is held while the KDF runs
+        release_db()
+
+        hasher = get_hasher()
+        if voter and hasher.verify(voter['password'], password):
+            # Upgrade hashes made with older KDF settings
+            if hasher.needs_rehash(voter['password']):
+                pwhash = hasher.hash(password)
+                conn = get_db()
+                cursor = conn.cursor()
+                cursor.execute("UPDATE voters SET password = %s WHERE id = %s", (pwhash, voter['id']))
+                conn.commit()
+                cursor.close()
+                hasher.note_rehash()
             session['voter_id'] = voter['id']
             session['voter_name'] = voter['full_name']
             return redirect(url_for('voter_dashboard'))
@@ -90,28 +200,27 @@ def voter_dashboard():
     if 'voter_id' not in session:
         return redirect(url_for('voter_login'))
     
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute("SELECT has_voted FROM voters WHERE id = %s", (session['voter_id'],))
-    voter = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    # Bitmaps answer most voters; the rest need one indexed lookup
+    has_voted = get_vote_guard().voted_in_any(session['voter_id'])
+    if not has_voted:
+        cursor = get_read_db().cursor()
+        # Votes of archived elections may have moved to votes_archive
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM votes WHERE voter_id = %s) "
+                       "OR EXISTS (SELECT 1 FROM votes_archive WHERE voter_id = %s)",
+                       (session['voter_id'], session['voter_id']))
+        has_voted = bool(cursor.fetchone()[0])
+        cursor.close()
     
-    return render_template('voter/dashboard.html', voter=voter)
+    return render_template('voter/dashboard.html', voter={'has_voted': has_voted})
 
 @app.route('/voter/elections')
 def voter_elections():
     if 'voter_id' not in session:
         return redirect(url_for('voter_login'))
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    from datetime import datetime
-    now = datetime.now()
-    cursor.execute("SELECT * FROM elections WHERE is_active = TRUE AND start_time <= %s AND end_time >= %s", (now, now))
-    elections = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return render_template('voter/elections.html', elections=elections)
+    index = get_election_index()
+    elections = index.open_elections(datetime.now())
+    version = tuple((election['id'], index.fingerprint(election['id'])) for election in elections)
+    return cached_page(('elections',), version, 'voter/elections.html', lambda: {'elections': elections})
 
 # View Candidates
 @app.route('/voter/candidates/<int:election_id>')
@@ -119,37 +228,32 @@ def voter_candidates(election_id):
     if 'voter_id' not in session:
         return redirect(url_for('voter_login'))
 
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    # Check if election is active and within time
-    from datetime import datetime
-    now = datetime.now()
-    cursor.execute("SELECT * FROM elections WHERE id = %s AND is_active = TRUE AND start_time <= %s AND end_time >= %s", (election_id, now, now))
-    election = cursor.fetchone()
+    # Check if election is active and within time; candidates come with it
+    index = get_election_index()
+    election, candidates = index.ballot(election_id, datetime.now())
     if not election:
         flash('This election is not active or not within the voting time!', 'warning')
-        cursor.close()
-        conn.close()
         return redirect(url_for('voter_elections'))
 
-    # Get candidates for this election
-    cursor.execute("SELECT * FROM candidates WHERE election_id = %s", (election_id,))
-    candidates = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return render_template('voter/candidates.html', candidates=candidates, election=election)
+    return cached_page(('candidates', election_id), index.fingerprint(election_id), 'voter/candidates.html',
+                       lambda: {'candidates': candidates, 'election': election})
 
 @app.route('/voter/results/select')
 def voter_results_select():
     if 'voter_id' not in session:
         return redirect(url_for('voter_login'))
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute("SELECT * FROM elections WHERE is_active = FALSE ORDER BY end_time DESC")
-    elections = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return render_template('voter/results_select.html', elections=elections)
+
+    def load():
+        cursor = get_read_db().cursor(DictCursor)
+        cursor.execute("SELECT * FROM elections WHERE is_active = FALSE ORDER BY end_time DESC")
+        elections = cursor.fetchall()
+        cursor.close()
+        return {'elections': elections}
+
+    # Completing an election invalidates the index, so its generation moves
+    # on; a page rendered from a lagging replica lasts at most one index TTL
+    return cached_page(('results_select',), get_election_index().generation(),
+                       'voter/results_select.html', load)
 
 
 # Cast Vote
@@ -158,91 +262,136 @@ def cast_vote(candidate_id):
     if 'voter_id' not in session:
         return redirect(url_for('voter_login'))
 
-    election_id = request.form.get('election_id')
+    election_id = request.form.get('election_id', type=int)
     if not election_id:
         flash('Election not specified!', 'danger')
         return redirect(url_for('voter_dashboard'))
 
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-
-    # Check if voter has already voted in this election
-    cursor.execute(
-        "SELECT * FROM votes WHERE voter_id = %s AND election_id = %s",
-        (session['voter_id'], election_id)
-    )
-    already_voted = cursor.fetchone()
-    if already_voted:
+    # Only open elections get as far as the vote guard, which keeps a
+    # bitmap for every election it is asked about
+    election, _ = get_election_index().ballot(election_id, datetime.now())
+    if election is None:
+        flash('This election is not active or not within the voting time!', 'warning')
+        return redirect(url_for('voter_elections'))
+
+    # Check if voter has already voted in this election (in memory; the
+    # UNIQUE (voter_id, election_id) constraint catches anything it misses)
+    guard = get_vote_guard()
+    if guard.has_voted(session['voter_id'], election_id):
         flash('You have already voted in this election!', 'danger')
-        cursor.close()
-        conn.close()
         return redirect(url_for('voter_dashboard'))
 
+    journal = get_vote_journal()
+    if journal is not None:
+        return _journal_vote(journal, guard, candidate_id, election_id)
+
+    conn = get_db()
+    cursor = conn.cursor(DictCursor)
     try:
         # Record vote
-        cursor.execute(
-            "INSERT INTO votes (voter_id, candidate_id, election_id) VALUES (%s, %s, %s)",
-            (session['voter_id'], candidate_id, election_id)
-        )
-        # Update voter status (optional: if you want to track per-election voting, adjust schema)
-        cursor.execute(
-            "UPDATE voters SET has_voted = 1 WHERE id = %s",
-            (session['voter_id'],)
-        )
+        cursor.execute(tallies.INSERT_VOTE_SQL, (session['voter_id'], candidate_id, election_id))
+        if not cursor.rowcount:
+            flash('This election is not active or not within the voting time!', 'warning')
+            return redirect(url_for('voter_elections'))
+        tallies.record_vote(cursor, election_id, candidate_id)
         conn.commit()
+        guard.mark(session['voter_id'], election_id)
+        get_results_cache().invalidate(election_id)
         flash('Vote cast successfully!', 'success')
+    except IntegrityError as e:
+        conn.rollback()
+        if not is_duplicate(e):
+            flash(f'Error: {str(e)}', 'danger')
+            return redirect(url_for('voter_dashboard'))
+        guard.mark(session['voter_id'], election_id)
+        flash('You have already voted in this election!', 'danger')
+        return redirect(url_for('voter_dashboard'))
     except Exception as e:
         conn.rollback()
         flash(f'Error: {str(e)}', 'danger')
     finally:
         cursor.close()
-        conn.close()
 
     return redirect(url_for('voter_results', election_id=election_id))
 
 
+def _journal_vote(journal, guard, candidate_id, election_id):
+    # Nothing checks the vote against the database before it is
+    # acknowledged, so validate the ballot here
+    election, candidates = get_election_index().ballot(election_id, datetime.now())
+    if not election or candidate_id not in {candidate['id'] for candidate in candidates}:
+        flash('This election is not active or not within the voting time!', 'warning')
+        return redirect(url_for('voter_elections'))
+
+    if not guard.claim(session['voter_id'], election_id):
+        flash('You have already voted in this election!', 'danger')
+        return redirect(url_for('voter_dashboard'))
+    try:
+        journal.append(session['voter_id'], candidate_id, election_id)
+    except OSError as e:
+        guard.release(session['voter_id'], election_id)
+        app.logger.exception('Could not journal vote')
+        flash(f'Error: {str(e)}', 'danger')
+        return redirect(url_for('voter_dashboard'))
+    flash('Vote cast successfully!', 'success')
+    return redirect(url_for('voter_results', election_id=election_id))
+
+
 # View Results
+def results_published():
+    cache = get_results_cache()
+    published = cache.published()
+    if published is None:
+        version = cache.published_version()
+        cursor = get_db().cursor(DictCursor)
+        cursor.execute("SELECT results_published FROM admin_settings WHERE id = 1")
+        settings = cursor.fetchone()
+        cursor.close()
+        published = bool(settings and settings['results_published'])
+        cache.set_published(published, version)
+    return published
+
+
+def results_snapshot(election_id):
+    """Frozen results of a completed election, or None if it is not completed."""
+    # A frozen snapshot exists only for completed elections, so it can be
+    # served without touching the database
+    cache = get_results_cache()
+    entry = cache.get(election_id)
+    if entry is None or not entry['frozen']:
+        version = cache.version(election_id)
+        # Snapshots are kept for good, so build them from the primary
+        cursor = get_db().cursor(DictCursor)
+        # Check if election exists and is completed
+        cursor.execute("SELECT * FROM elections WHERE id = %s AND is_active = FALSE", (election_id,))
+        completed_election = cursor.fetchone()
+        if not completed_election:
+            cursor.close()
+            return None
+        results, total_votes = (archive.load_results(cursor, election_id)
+                                or tallies.fetch_results(cursor, election_id))
+        cursor.close()
+        entry = cache.freeze(election_id, version, results, total_votes)
+    return entry
+
+
 @app.route('/voter/results/<int:election_id>')
 def voter_results(election_id):
     if 'voter_id' not in session:
         return redirect(url_for('voter_login'))
     
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute("SELECT results_published FROM admin_settings WHERE id = 1")
-    settings = cursor.fetchone()
-    if not settings or not settings['results_published']:
+    if not results_published():
         flash('Results are not published yet!', 'warning')
-        cursor.close()
-        conn.close()
         return redirect(url_for('voter_dashboard'))
-    
-    # Check if election exists and is completed
-    cursor.execute("SELECT * FROM elections WHERE id = %s AND is_active = FALSE", (election_id,))
-    completed_election = cursor.fetchone()
-    if not completed_election:
+
+    entry = results_snapshot(election_id)
+    if entry is None:
         flash('Election not found or not completed!', 'warning')
-        cursor.close()
-        conn.close()
         return redirect(url_for('voter_results_select'))
-    
-    cursor.execute("""
-    SELECT c.id, c.candidate_name, c.party_name, c.photo_path, c.symbol_path, COUNT(v.id) AS vote_count
-    FROM candidates c
-    LEFT JOIN votes v ON c.id = v.candidate_id AND v.election_id = %s
-    WHERE c.election_id = %s
-    GROUP BY c.id
-    """, (election_id, election_id))
-    
-    results = cursor.fetchall()
-    total_votes = sum(candidate['vote_count'] for candidate in results) if results else 0
-    for candidate in results:
-        candidate['percentage'] = round((candidate['vote_count'] / total_votes) * 100, 2) if total_votes > 0 else 0
-    
-    cursor.close()
-    conn.close()
-    
-    return render_template('voter/results.html', results=results, total_votes=total_votes)
+
+    return conditional_page(entry['etag'], 'voter/results.html',
+                            results=entry['results'], total_votes=entry['total_votes'])
+
 # --------------------- Admin Routes ---------------------
 
 # Admin Login
@@ -253,11 +402,10 @@ def admin_login():
         password = request.form['password']
         
         conn = get_db()
-        cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+        cursor = conn.cursor(DictCursor)
         cursor.execute("SELECT * FROM admins WHERE username = %s", (username,))
         admin = cursor.fetchone()
         cursor.close()
-        conn.close()
         
         if admin and admin['password'] == password:
             session['admin_id'] = admin['id']
@@ -273,26 +421,29 @@ def admin_dashboard():
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Get counts
-    cursor.execute("SELECT COUNT(*) FROM voters")
-    voters_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM candidates")
-    candidates_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM votes")
-    votes_count = cursor.fetchone()[0]
-    
-    cursor.close()
-    conn.close()
-    
+    # Counts come from the shared turnout snapshot, not from the database
+    _, turnout = get_turnout().snapshot()
     return render_template('admin/dashboard.html', 
-                          voters_count=voters_count,
-                          candidates_count=candidates_count,
-                          votes_count=votes_count)
+                          voters_count=turnout['voters'],
+                          candidates_count=turnout['candidates'],
+                          votes_count=turnout['votes'],
+                          elections=turnout['elections'])
+
+# Live turnout stream (server-sent events) for open dashboards. Each stream
+# holds this worker thread until the viewer leaves, so at most
+# TURNOUT_MAX_STREAMS run at once; in production this route belongs on the
+# ASGI server (asgi.py serves it on the event loop)
+@app.route('/admin/turnout/stream')
+def admin_turnout_stream():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    monitor = get_turnout()
+    if not monitor.acquire_stream():
+        return 'Too many live dashboards are open, please try again shortly.', 503
+    response = Response(monitor.stream(app.config['TURNOUT_KEEPALIVE']), mimetype='text/event-stream',
+                        headers=TURNOUT_STREAM_HEADERS)
+    response.call_on_close(monitor.release_stream)
+    return response
 
 #add election
 @app.route('/admin/election/add', methods=['GET', 'POST'])
@@ -302,8 +453,13 @@ def add_election():
     if request.method == 'POST':
         election_name = request.form['election_name']
         area = request.form['area']
-        start_time = request.form['start_time']
-        end_time = request.form['end_time']
+        # Parsed here so every backend stores the same DATETIME value
+        try:
+            start_time = datetime.fromisoformat(request.form['start_time'])
+            end_time = datetime.fromisoformat(request.form['end_time'])
+        except ValueError:
+            flash('Invalid start or end time!', 'danger')
+            return render_template('admin/add_elections.html')
         conn = get_db()
         cursor = conn.cursor()
         cursor.execute(
@@ -312,7 +468,7 @@ def add_election():
         )
         conn.commit()
         cursor.close()
-        conn.close()
+        get_election_index().invalidate()
         flash('Election created!', 'success')
         return redirect(url_for('admin_elections'))
     return render_template('admin/add_elections.html')
@@ -322,12 +478,10 @@ def add_election():
 def admin_elections():
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+    cursor = get_read_db().cursor(DictCursor)
     cursor.execute("SELECT * FROM elections")
     elections = cursor.fetchall()
     cursor.close()
-    conn.close()
     return render_template('admin/elections.html', elections=elections)
 
 @app.route('/admin/election/complete/<int:election_id>', methods=['POST'])
@@ -335,13 +489,58 @@ def complete_election(election_id):
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE elections SET is_active = FALSE WHERE id = %s", (election_id,))
+    cursor = conn.cursor(DictCursor)
+    # completed_at: journaled votes from before now are still recorded (see
+    # complete_election_job), so it is the app's clock, like their voted_at
+    cursor.execute("UPDATE elections SET is_active = FALSE, completed_at = %s WHERE id = %s",
+                   (datetime.now().isoformat(sep=' ', timespec='seconds'), election_id))
     conn.commit()
     cursor.close()
-    conn.close()
+    get_election_index().invalidate()
+    get_results_cache().invalidate(election_id)
+
+    # Voting stops now; archiving and freezing the results run in the background
+    job_id = jobs.enqueue('complete_election', election_id=election_id)
     flash('Voting completed for this election!', 'success')
-    return redirect(url_for('admin_elections'))
+    return redirect(url_for('admin_job', job_id=job_id))
+
+
+@jobs.job('complete_election')
+def complete_election_job(ctx, election_id):
+    # Votes acknowledged before voting stopped may still be in a journal;
+    # the archive and the final results must include them. Everything
+    # journaled from now on is later than completed_at, so it is refused.
+    # Raises (and the job is retried) if the writers do not catch up in time
+    wait_for_writers(journal_directory(app), app.config['VOTE_JOURNAL_DRAIN_TIMEOUT'],
+                     lambda: ctx.progress(0, message='Waiting for journaled votes to be written'))
+
+    conn = get_db()
+    cursor = conn.cursor()
+    archived = archive.archive_info(cursor, election_id)
+    cursor.close()
+    conn.commit()
+    warning = None
+    if app.config['ARCHIVE_ON_COMPLETE'] and not archived:
+        ctx.progress(0, message='Archiving the vote ledger')
+        try:
+            rows, _ = archive.archive_election(conn, election_id, progress=lambda rows: ctx.progress(
+                rows, message='Archiving the vote ledger'))
+            archived = True
+            # Storing a large ledger takes a while after its last row is reported
+            ctx.progress(rows, message='Vote ledger archived')
+        except archive.ArchiveError as e:
+            warning = f'Election completed but not archived: {e}'
+    if archived and app.config['ARCHIVE_MOVE_VOTES']:
+        def moved_chunk(moved):
+            ctx.progress(moved, message='Moving votes to votes_archive')
+            ctx.breathe()
+        archive.move_election_votes(conn, election_id, app.config['ARCHIVE_CHUNK_SIZE'], moved_chunk)
+
+    # Freeze the final results now so voters never trigger the first read
+    ctx.progress(0, message='Freezing results')
+    get_results_cache().invalidate(election_id)
+    results_snapshot(election_id)
+    ctx.progress(1, 1, (warning or 'Results frozen')[:255])
 
 
 
@@ -352,7 +551,7 @@ def add_candidate(election_id):
         return redirect(url_for('admin_login'))
 
     conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+    cursor = conn.cursor(DictCursor)
     # Get the current election info
     cursor.execute("SELECT id, name FROM elections WHERE id = %s", (election_id,))
     election = cursor.fetchone()
@@ -366,30 +565,32 @@ def add_candidate(election_id):
         photo_path = None
         symbol_path = None
 
-        # Save photo
-        if photo and allowed_file(photo.filename):
-            filename = secure_filename(photo.filename)
-            photo.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            photo_path = filename
+        try:
+            # Save photo
+            if photo and allowed_file(photo.filename):
+                photo_path = media.store_upload(photo)
 
-        # Save symbol
-        if symbol and allowed_file(symbol.filename):
-            filename = secure_filename(symbol.filename)
-            symbol.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            symbol_path = filename
+            # Save symbol
+            if symbol and allowed_file(symbol.filename):
+                symbol_path = media.store_upload(symbol)
+        except media.MediaError as e:
+            cursor.close()
+            flash(str(e), 'danger')
+            return render_template('admin/add_candidates.html', election=election, election_id=election_id)
 
         cursor.execute(
             "INSERT INTO candidates (candidate_name, party_name, photo_path, symbol_path, election_id) VALUES (%s, %s, %s, %s, %s)",
             (candidate_name, party_name, photo_path, symbol_path, election_id)
         )
+        tallies.bump_counter(cursor, 'candidates')
         conn.commit()
+        get_results_cache().invalidate(election_id)
+        get_election_index().invalidate()
         flash('Candidate added successfully!', 'success')
         cursor.close()
-        conn.close()
         return redirect(url_for('admin_candidates', election_id=election_id))
 
     cursor.close()
-    conn.close()
     # Pass only the current election to the template
     return render_template('admin/add_candidates.html', election=election, election_id=election_id)
 
@@ -397,12 +598,10 @@ def add_candidate(election_id):
 def admin_candidates(election_id):
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+    cursor = get_read_db().cursor(DictCursor)
     cursor.execute("SELECT * FROM candidates WHERE election_id = %s", (election_id,))
     candidates = cursor.fetchall()
     cursor.close()
-    conn.close()
     return render_template('admin/candidates.html', candidates=candidates, election_id=election_id)
 
 # Edit Candidate
@@ -412,7 +611,7 @@ def edit_candidate(id):
         return redirect(url_for('admin_login'))
     
     conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+    cursor = conn.cursor(DictCursor)
     
     if request.method == 'POST':
         candidate_name = request.form['candidate_name']
@@ -428,32 +627,32 @@ def edit_candidate(id):
         photo_path = candidate['photo_path']
         symbol_path = candidate['symbol_path']
         
-        # Update photo if provided
-        if photo and allowed_file(photo.filename):
-            filename = secure_filename(photo.filename)
-            new_photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            photo.save(new_photo_path)
-            photo_path = filename
-        
-        # Update symbol if provided
-        if symbol and allowed_file(symbol.filename):
-            filename = secure_filename(symbol.filename)
-            new_symbol_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            symbol.save(new_symbol_path)
-            symbol_path = filename
+        try:
+            # Update photo if provided
+            if photo and allowed_file(photo.filename):
+                photo_path = media.store_upload(photo)
+
+            # Update symbol if provided
+            if symbol and allowed_file(symbol.filename):
+                symbol_path = media.store_upload(symbol)
+        except media.MediaError as e:
+            cursor.close()
+            flash(str(e), 'danger')
+            return render_template('admin/edit_candidate.html', candidate=candidate)
         
         cursor.execute(
             "UPDATE candidates SET candidate_name = %s, party_name = %s, photo_path = %s, symbol_path = %s WHERE id = %s",
             (candidate_name, party_name, photo_path, symbol_path, id)
         )
         conn.commit()
+        get_results_cache().invalidate(election_id)
+        get_election_index().invalidate()
         flash('Candidate updated successfully!', 'success')
         return redirect(url_for('admin_candidates', election_id=election_id))
     
     cursor.execute("SELECT * FROM candidates WHERE id = %s", (id,))
     candidate = cursor.fetchone()
     cursor.close()
-    conn.close()
     
     return render_template('admin/edit_candidate.html', candidate=candidate)
 
@@ -463,53 +662,158 @@ def delete_candidate(id):
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
     
+    # The candidate's votes are deleted in the background, a chunk per transaction
+    job_id = jobs.enqueue('delete_candidate', candidate_id=id)
+    flash('Deleting the candidate and their votes.', 'info')
+    return redirect(url_for('admin_job', job_id=job_id))
+
+
+@jobs.job('delete_candidate')
+def delete_candidate_job(ctx, candidate_id):
     conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    # Get the election_id before deleting
-    cursor.execute("SELECT election_id FROM candidates WHERE id = %s", (id,))
+    cursor = conn.cursor()
+    cursor.execute("SELECT election_id FROM candidates WHERE id = %s", (candidate_id,))
     candidate = cursor.fetchone()
-    election_id = candidate['election_id'] if candidate else None
+    if candidate is None:
+        conn.commit()
+        cursor.close()
+        ctx.progress(0, 0, 'Candidate already deleted')
+        return
+    election_id = candidate[0]
+    cursor.execute("SELECT COUNT(*) FROM votes WHERE candidate_id = %s", (candidate_id,))
+    total = cursor.fetchone()[0]
+    conn.commit()
+    ctx.progress(0, total, 'Deleting votes')
 
-    # First, delete votes for this candidate
-    cursor2 = conn.cursor()
-    cursor2.execute("DELETE FROM votes WHERE candidate_id = %s", (id,))
-    # Then, delete the candidate
-    cursor2.execute("DELETE FROM candidates WHERE id = %s", (id,))
+    # Short transactions so cast_vote never waits long behind the delete
+    deleted = 0
+    while True:
+        cursor.execute("SELECT id FROM votes WHERE candidate_id = %s ORDER BY id LIMIT %s",
+                       (candidate_id, ctx.chunk_size))
+        ids = [row[0] for row in cursor.fetchall()]
+        if len(ids) < ctx.chunk_size:
+            conn.commit()
+            break
+        cursor.execute(f"DELETE FROM votes WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        conn.commit()
+        deleted += len(ids)
+        ctx.progress(deleted, max(total, deleted))
+        ctx.breathe()
+
+    # The last few votes (and any cast meanwhile) go with the candidate
+    cursor.execute("DELETE FROM votes WHERE candidate_id = %s", (candidate_id,))
+    deleted += cursor.rowcount
+    tallies.forget_candidate(cursor, candidate_id)
+    cursor.execute("DELETE FROM candidates WHERE id = %s", (candidate_id,))
+    if cursor.rowcount:
+        tallies.bump_counter(cursor, 'candidates', -1)
     conn.commit()
     cursor.close()
-    cursor2.close()
-    conn.close()
-    
-    flash('Candidate deleted successfully!', 'success')
-    # Redirect with election_id
-    return redirect(url_for('admin_candidates', election_id=election_id))
+    get_results_cache().invalidate(election_id)
+    get_vote_guard().forget_election(election_id)
+    get_election_index().invalidate()
+    ctx.progress(deleted, max(total, deleted), f'Deleted the candidate and {deleted} vote(s)')
 
 # View Voters
-# In your admin_voters route:
+def _roster_filters():
+    """Read the election/status filters shared by the roster page and its CSV export."""
+    election_id = request.args.get('election_id', type=int)
+    status = request.args.get('status', '')
+    if status not in ('voted', 'not_voted'):
+        status = ''
+    return election_id, status
+
+
+def fetch_voter_roster(cursor, election_id, status='', after_id=0, limit=50):
+    # One keyset-paginated query; voted status comes from the
+    # UNIQUE (voter_id, election_id) index instead of a query per voter.
+    query = """
+        SELECT v.id, v.full_name, v.voter_id, v.email, (vo.id IS NOT NULL) AS has_voted
+        FROM voters v
+        LEFT JOIN {votes} vo ON vo.voter_id = v.id AND vo.election_id = %s
+        WHERE v.id > %s
+    """.format(votes=archive.votes_table(cursor, election_id))
+    if status == 'voted':
+        query += " AND vo.id IS NOT NULL"
+    elif status == 'not_voted':
+        query += " AND vo.id IS NULL"
+    query += " ORDER BY v.id LIMIT %s"
+    cursor.execute(query, (election_id, after_id, limit))
+    return cursor.fetchall()
+
+
+def _default_election_id(cursor):
+    # Get active election
+    cursor.execute("SELECT id FROM elections WHERE is_active = TRUE LIMIT 1")
+    active_election = cursor.fetchone()
+    return active_election['id'] if active_election else None
+
+
 @app.route('/admin/voters')
 def admin_voters():
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
 
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    cursor.execute("SELECT * FROM voters")
-    voters = cursor.fetchall()
+    election_id, status = _roster_filters()
+    after_id = request.args.get('after', 0, type=int)
+    page_size = app.config['VOTERS_PAGE_SIZE']
 
-    # Get active election
-    cursor.execute("SELECT id FROM elections WHERE is_active = TRUE LIMIT 1")
-    active_election = cursor.fetchone()
-    election_id = active_election['id'] if active_election else None
+    cursor = get_read_db().cursor(DictCursor)
+    if election_id is None:
+        election_id = _default_election_id(cursor)
 
-    # For each voter, check if they have voted in the current election
-    for voter in voters:
-        cursor.execute("SELECT id FROM votes WHERE voter_id = %s AND election_id = %s", (voter['id'], election_id))
-        voter['has_voted'] = bool(cursor.fetchone())
+    # Fetch one extra row to know whether there is a next page
+    voters = fetch_voter_roster(cursor, election_id, status, after_id, page_size + 1)
+    next_after = voters[page_size - 1]['id'] if len(voters) > page_size else None
+    voters = voters[:page_size]
 
+    cursor.execute("SELECT id, name FROM elections ORDER BY id DESC")
+    elections = cursor.fetchall()
     cursor.close()
-    conn.close()
 
-    return render_template('admin/voters.html', voters=voters)
+    return render_template('admin/voters.html', voters=voters, elections=elections,
+                           election_id=election_id, status=status, next_after=next_after)
+
+
+# Export the filtered voter roster as CSV, streamed page by page
+@app.route('/admin/voters/export.csv')
+def admin_voters_export():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+
+    election_id, status = _roster_filters()
+    batch_size = app.config['VOTERS_EXPORT_BATCH_SIZE']
+
+    def generate():
+        cursor = get_read_db().cursor(DictCursor)
+        try:
+            roster_election = election_id if election_id is not None else _default_election_id(cursor)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(['id', 'full_name', 'voter_id', 'email', 'has_voted'])
+            after_id = 0
+            while True:
+                rows = fetch_voter_roster(cursor, roster_election, status, after_id, batch_size)
+                for row in rows:
+                    writer.writerow([row['id'], row['full_name'], row['voter_id'], row['email'],
+                                     'yes' if row['has_voted'] else 'no'])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+                if len(rows) < batch_size:
+                    break
+                after_id = rows[-1]['id']
+        finally:
+            cursor.close()
+
+    # Shares the election exports' cap instead of holding an admission slot while it streams
+    slots = exports.export_slots()
+    if not slots.acquire(blocking=False):
+        return 'Too many exports are running, please try again shortly.', 503
+    response = Response(stream_with_context(generate()), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=voters.csv'})
+    response.call_on_close(slots.release)
+    return response
 
 # Admin Results
 @app.route('/admin/results/<int:election_id>')
@@ -517,43 +821,237 @@ def admin_results(election_id):
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
     
-    conn = get_db()
-    cursor = conn.cursor(MySQLdb.cursors.DictCursor)
-    
-    # Get vote counts
-    cursor.execute("""
-        SELECT c.id, c.candidate_name, c.party_name, c.photo_path, c.symbol_path, COUNT(v.id) AS vote_count
-        FROM candidates c
-        LEFT JOIN votes v ON c.id = v.candidate_id AND v.election_id = %s
-        WHERE c.election_id = %s
-        GROUP BY c.id
-    """, (election_id, election_id))
-    results = cursor.fetchall()
-    
-    # Calculate total votes
-    total_votes = sum(candidate['vote_count'] for candidate in results) if results else 0
-    
-    # Calculate percentages
-    for candidate in results:
-        candidate['percentage'] = round((candidate['vote_count'] / total_votes) * 100, 2) if total_votes > 0 else 0
-    
+    cache = get_results_cache()
+    entry = cache.get(election_id)
+    if entry is None:
+        version = cache.version(election_id)
+        cursor = get_read_db().cursor(DictCursor)
+        # Archived elections read the archive; the rest the maintained tallies
+        results, total_votes = (archive.load_results(cursor, election_id)
+                                or tallies.fetch_results(cursor, election_id))
+        cursor.close()
+        if read_from_replica():
+            # May be missing the last few votes; show it but don't cache it
+            entry = {'results': results, 'total_votes': total_votes}
+        else:
+            entry = cache.put(election_id, version, results, total_votes)
+
+    return render_template('admin/results.html', results=entry['results'],
+                           total_votes=entry['total_votes'], election_id=election_id)
+
+def _export_request(election_id):
+    """Check the election and read format/gzip from the query string; returns its Exports."""
+    conn = get_read_db()
+    exports.find_election(conn, election_id)
+    return exports.election_exports(conn, election_id, request.args.get('format', 'csv'),
+                                    request.args.get('gzip', type=int, default=0) == 1,
+                                    app.config['EXPORT_CHUNK_SIZE'])
+
+
+# Stream one dataset (results or votes) of an election for auditors
+@app.route('/admin/export/<int:election_id>/<dataset>')
+def admin_export(election_id, dataset):
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    try:
+        export = next((e for e in _export_request(election_id) if e.dataset == dataset), None)
+    except exports.ExportError as e:
+        return str(e), 400
+    if export is None:
+        return f'Unknown dataset {dataset!r}.', 404
+    slots = exports.export_slots()
+    if not slots.acquire(blocking=False):
+        return 'Too many exports are running, please try again shortly.', 503
+    response = Response(stream_with_context(iter(export)), mimetype=export.mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={export.filename}'})
+    response.call_on_close(slots.release)
+    return response
+
+# Row counts and checksums of the files admin_export serves for the same
+# format/gzip; computed by streaming every dataset once. Only for archived
+# elections: any other election's exports can change between this request
+# and a download, so the checksums would identify nothing
+@app.route('/admin/export/<int:election_id>/manifest.json')
+def admin_export_manifest(election_id):
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    try:
+        election_exports = _export_request(election_id)
+    except exports.ExportError as e:
+        return str(e), 400
+    cursor = get_read_db().cursor()
+    archived = archive.archive_info(cursor, election_id)
     cursor.close()
-    conn.close()
-    
-    return render_template('admin/results.html', results=results, total_votes=total_votes, election_id=election_id)
+    if not archived:
+        return ('Manifests are only served for archived elections; `flask export election` '
+                'writes the files and their manifest together for any election.', 409)
+    slots = exports.export_slots()
+    if not slots.acquire(blocking=False):
+        return 'Too many exports are running, please try again shortly.', 503
+    try:
+        for export in election_exports:
+            for _ in export:
+                pass
+    finally:
+        slots.release()
+    return jsonify(exports.build_manifest(get_read_db(), election_id, election_exports))
 
 @app.route('/admin/publish_results/<int:election_id>', methods=['POST'])
 def publish_results(election_id):
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
+    job_id = jobs.enqueue('publish_results', election_id=election_id)
+    flash('Publishing results.', 'info')
+    return redirect(url_for('admin_job', job_id=job_id))
+
+
+@jobs.job('publish_results')
+def publish_results_job(ctx, election_id):
+    # Freeze every completed election's results first, so the voters who
+    # arrive once the flag flips all hit the cache
+    cursor = get_db().cursor()
+    cursor.execute("SELECT id FROM elections WHERE is_active = FALSE ORDER BY id")
+    completed = [row[0] for row in cursor.fetchall()]
+    get_db().commit()
+    cursor.close()
+    get_results_cache().invalidate(election_id)
+    total = len(completed) + 1
+    for n, completed_id in enumerate(completed):
+        # A heartbeat before each snapshot: one large election can take a while
+        ctx.progress(n, total, 'Freezing results')
+        results_snapshot(completed_id)
+    ctx.progress(len(completed), total, 'Publishing results')
+
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute("UPDATE admin_settings SET results_published = TRUE WHERE id = 1")
     conn.commit()
     cursor.close()
-    conn.close()
-    flash('Results published!', 'success')
-    return redirect(url_for('admin_results', election_id=election_id))
+    get_results_cache().set_published(True)
+    ctx.progress(total, total, 'Results published')
+
+
+# Background job status
+@app.route('/admin/jobs')
+def admin_jobs():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    cursor = get_db().cursor(DictCursor)
+    recent = jobs.recent_jobs(cursor)
+    cursor.close()
+    return render_template('admin/jobs.html', jobs=recent)
+
+@app.route('/admin/job/<int:job_id>')
+def admin_job(job_id):
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    cursor = get_db().cursor(DictCursor)
+    job = jobs.fetch_job(cursor, job_id)
+    cursor.close()
+    if job is None:
+        flash('Job not found!', 'warning')
+        return redirect(url_for('admin_jobs'))
+    if request.args.get('format') == 'json':
+        return jsonify(job)
+    return render_template('admin/job.html', job=job)
+
+# Prometheus metrics (admin session or METRICS_TOKEN bearer token)
+REGISTRY.add_gauges('voting_db_pool', 'Connection pool state.', lambda: get_pool().stats())
+REGISTRY.add_gauges('voting_db_replicas', 'Read replica routing.',
+                    lambda: get_replicas().stats() if get_replicas() else {})
+REGISTRY.add_gauges('voting_kdf', 'Password hashing executor state.', lambda: get_hasher().stats())
+REGISTRY.add_gauges('voting_results_cache', 'Results cache state.', lambda: get_results_cache().stats())
+REGISTRY.add_gauges('voting_vote_guard', 'Voted-set bitmaps.', lambda: get_vote_guard().stats())
+REGISTRY.add_gauges('voting_election_index', 'Active election index state.', lambda: get_election_index().stats())
+REGISTRY.add_gauges('voting_jobs', 'Background job runner in this process.', lambda: jobs.get_job_runner().stats())
+REGISTRY.add_gauges('voting_shared_store', 'Cross-process shared store.', lambda: get_shared_store().stats())
+REGISTRY.add_gauges('voting_turnout', 'Live dashboard streams.', lambda: get_turnout().stats())
+REGISTRY.add_gauges('voting_page_cache', 'Rendered voter page cache.', lambda: get_page_cache().stats())
+REGISTRY.add_gauges('voting_admission', 'Admission control: running, queued and shed requests.',
+                    admission_gauges)
+REGISTRY.add_gauges('voting_vote_journal', 'Write-behind vote journal and writer lag.',
+                    lambda: get_vote_journal().stats() if get_vote_journal() else {})
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    token = app.config['METRICS_TOKEN']
+    authorized = 'admin_id' in session or (
+        token and request.headers.get('Authorization') == f'Bearer {token}')
+    if not authorized:
+        return redirect(url_for('admin_login'))
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Connection pool stats
+@app.route('/admin/pool')
+def admin_pool_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify(get_pool().stats())
+
+# Read replica lag and routing
+@app.route('/admin/replicas')
+def admin_replica_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    replicas = get_replicas()
+    return jsonify(replicas.stats() if replicas else {'replicas': {}})
+
+# Active election index stats
+@app.route('/admin/election_index')
+def admin_election_index_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify(get_election_index().stats())
+
+# Rendered voter page cache stats
+@app.route('/admin/page_cache')
+def admin_page_cache_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify(get_page_cache().stats())
+
+# Password hashing stats
+@app.route('/admin/kdf')
+def admin_kdf_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify(get_hasher().stats())
+
+# Voted-set stats, including memory per million voters
+@app.route('/admin/vote_guard')
+def admin_vote_guard_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify(get_vote_guard().stats())
+
+# Vote journal stats: votes acknowledged but not yet in the votes table
+@app.route('/admin/vote_journal')
+def admin_vote_journal_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    journal = get_vote_journal()
+    return jsonify(journal.stats() if journal else {'mode': app.config['VOTE_INGEST_MODE']})
+
+# Admission control: per-class running/queued/shed counts and rate limits
+@app.route('/admin/admission')
+def admin_admission_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify(admission_stats())
+
+# Shared store stats (this worker's view)
+@app.route('/admin/shared_store')
+def admin_shared_store_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify(get_shared_store().stats())
+
+# Results cache stats
+@app.route('/admin/results_cache')
+def admin_results_cache_stats():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    return jsonify(get_results_cache().stats())
 
 
 # Logout
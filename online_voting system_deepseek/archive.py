@@ -0,0 +1,331 @@
+import hashlib
+import json
+import zlib
+from collections import Counter
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from db import get_db, DictCursor, SSCursor, IntegrityError
+import tallies
+
+# Completed elections are archived into election_archives: the final
+# per-candidate tallies plus a compressed, checksummed ledger of every vote.
+# The ledger is CSV, one vote per line in id order, and the checksum is the
+# SHA-256 of the uncompressed bytes, so it can be re-derived from votes (or
+# votes_archive) at any time.
+#
+# The compressed ledger is stored in election_archive_ledger, in pieces of
+# LEDGER_PIECE bytes, and read back a piece at a time: no statement carries
+# more than one piece, so max_allowed_packet (64 MB by default on MySQL 8,
+# 4 MB on 5.7) only needs to exceed LEDGER_PIECE. The compressed ledger of
+# an election (about 10 bytes a vote) is still built in memory before it is
+# stored. Format 1 archives hold the whole ledger in election_archives.ledger.
+
+FORMAT = 2
+LEDGER_HEADER = b'vote_id,voter_id,candidate_id,voted_at\n'
+LEDGER_PIECE = 1 << 20
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def ledger_line(row):
+    vote_id, voter_id, candidate_id, voted_at = row
+    voted_at = voted_at.isoformat(sep=' ') if voted_at is not None else ''
+    return f'{vote_id},{voter_id},{candidate_id},{voted_at}\n'.encode('ascii')
+
+
+def build_ledger(conn, election_id, table='votes', progress=None, every=10000):
+    """Stream an election's votes into (compressed ledger, sha256, per-candidate counts).
+
+    ``progress(rows)`` is called every ``every`` rows, from the middle of
+    the stream, so it must not use ``conn``.
+    """
+    compressor = zlib.compressobj(9)
+    digest = hashlib.sha256(LEDGER_HEADER)
+    chunks = [compressor.compress(LEDGER_HEADER)]
+    counts = Counter()
+    # Unbuffered: the whole election never sits in memory uncompressed
+    cursor = conn.cursor(SSCursor)
+    cursor.execute(
+        f"SELECT id, voter_id, candidate_id, voted_at FROM {table} WHERE election_id = %s ORDER BY id",
+        (election_id,)
+    )
+    for n, row in enumerate(cursor, 1):
+        line = ledger_line(row)
+        digest.update(line)
+        chunks.append(compressor.compress(line))
+        counts[row[2]] += 1
+        if progress is not None and n % every == 0:
+            progress(n)
+    cursor.close()
+    chunks.append(compressor.flush())
+    return b''.join(chunks), digest.hexdigest(), counts
+
+
+def ledger_pieces(conn, election_id):
+    """Yield an archived election's compressed ledger, one stored piece at a time."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT format, ledger FROM election_archives WHERE election_id = %s", (election_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    if row is None:
+        raise ArchiveError(f'Election {election_id} is not archived.')
+    if row[0] == 1:
+        yield row[1]
+        return
+    # Unbuffered: one piece in memory at a time
+    cursor = conn.cursor(SSCursor)
+    try:
+        cursor.execute("SELECT data FROM election_archive_ledger WHERE election_id = %s ORDER BY seq",
+                       (election_id,))
+        for (data,) in cursor:
+            yield data
+    finally:
+        cursor.close()
+
+
+def read_ledger(pieces):
+    """Decompress a ledger from its compressed pieces, yielding the raw bytes as they come."""
+    decompressor = zlib.decompressobj()
+    for piece in pieces:
+        yield decompressor.decompress(piece)
+    yield decompressor.flush()
+
+
+def scan_ledger(pieces):
+    """(sha256, votes, per-candidate counts) of a ledger, without holding it in memory."""
+    digest = hashlib.sha256()
+    counts = Counter()
+    rest = b''
+    for raw in read_ledger(pieces):
+        digest.update(raw)
+        lines = (rest + raw).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            if line != LEDGER_HEADER[:-1]:
+                counts[int(line.split(b',')[2])] += 1
+    return digest.hexdigest(), sum(counts.values()), counts
+
+
+def archive_info(cursor, election_id):
+    cursor.execute(
+        "SELECT election_id, vote_count, ledger_sha256, archived_at, votes_moved_at "
+        "FROM election_archives WHERE election_id = %s",
+        (election_id,)
+    )
+    row = cursor.fetchone()
+    if row is None or isinstance(row, dict):
+        return row
+    return dict(zip(('election_id', 'vote_count', 'ledger_sha256', 'archived_at', 'votes_moved_at'), row))
+
+
+def votes_table(cursor, election_id):
+    """The table holding an election's vote rows: votes, or votes_archive once moved."""
+    info = archive_info(cursor, election_id)
+    return 'votes_archive' if info and info['votes_moved_at'] else 'votes'
+
+
+def load_results(cursor, election_id):
+    """(results, total_votes) from the archive, shaped like tallies.fetch_results(), or None."""
+    cursor.execute("SELECT tallies, vote_count FROM election_archives WHERE election_id = %s", (election_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    if isinstance(row, dict):
+        row = (row['tallies'], row['vote_count'])
+    return json.loads(row[0]), row[1]
+
+
+def archive_election(conn, election_id, move_votes=False, chunk_size=5000, progress=None):
+    """Write the archive of a completed election; optionally move its votes out.
+
+    ``progress(rows)`` is called as the ledger is built, see build_ledger().
+    """
+    cursor = conn.cursor(DictCursor)
+    cursor.execute("SELECT is_active FROM elections WHERE id = %s", (election_id,))
+    election = cursor.fetchone()
+    if election is None or election['is_active']:
+        cursor.close()
+        raise ArchiveError(f'Election {election_id} is not completed.')
+    if archive_info(cursor, election_id):
+        cursor.close()
+        raise ArchiveError(f'Election {election_id} is already archived.')
+    results, total_votes = tallies.fetch_results(cursor, election_id)
+    cursor.close()
+
+    ledger, digest, counted = build_ledger(conn, election_id, progress=progress)
+    drift = [(c['id'], c['vote_count'], counted.get(c['id'], 0))
+             for c in results if c['vote_count'] != counted.get(c['id'], 0)]
+    if drift or sum(counted.values()) != total_votes:
+        raise ArchiveError(f'Tallies do not match votes for election {election_id} '
+                           f'(candidate, stored, counted): {drift}; run `flask tallies rebuild` first.')
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO election_archives (election_id, format, vote_count, tallies, ledger, ledger_sha256) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (election_id, FORMAT, total_votes, json.dumps(results), b'', digest)
+        )
+        # One piece per statement, whatever the size of the ledger
+        for seq, start in enumerate(range(0, len(ledger), LEDGER_PIECE)):
+            cursor.execute("INSERT INTO election_archive_ledger (election_id, seq, data) VALUES (%s, %s, %s)",
+                           (election_id, seq, ledger[start:start + LEDGER_PIECE]))
+        conn.commit()
+    except IntegrityError:
+        conn.rollback()
+        raise ArchiveError(f'Election {election_id} is already archived.')
+    finally:
+        cursor.close()
+
+    if move_votes:
+        move_election_votes(conn, election_id, chunk_size)
+    return total_votes, len(ledger)
+
+
+def move_election_votes(conn, election_id, chunk_size=5000, progress=None):
+    """Move an archived election's rows from votes to votes_archive, one chunk per transaction.
+
+    ``progress(moved)`` is called after each chunk is committed.
+    """
+    cursor = conn.cursor()
+    moved = 0
+    last_voter = 0
+    while True:
+        # Walks idx_votes_election_voter, so each chunk is an index range
+        cursor.execute(
+            "SELECT voter_id FROM votes WHERE election_id = %s AND voter_id > %s ORDER BY voter_id LIMIT %s",
+            (election_id, last_voter, chunk_size)
+        )
+        voters = [row[0] for row in cursor.fetchall()]
+        if not voters:
+            break
+        bounds = (election_id, voters[0], voters[-1])
+        cursor.execute(
+            "INSERT INTO votes_archive (id, voter_id, candidate_id, election_id, voted_at) "
+            "SELECT id, voter_id, candidate_id, election_id, voted_at FROM votes "
+            "WHERE election_id = %s AND voter_id BETWEEN %s AND %s",
+            bounds
+        )
+        cursor.execute("DELETE FROM votes WHERE election_id = %s AND voter_id BETWEEN %s AND %s", bounds)
+        conn.commit()
+        moved += len(voters)
+        last_voter = voters[-1]
+        if progress is not None:
+            progress(moved)
+    cursor.execute("UPDATE election_archives SET votes_moved_at = CURRENT_TIMESTAMP WHERE election_id = %s",
+                   (election_id,))
+    conn.commit()
+    cursor.close()
+    return moved
+
+
+def verify_archive(conn, election_id):
+    """Audit one archive; returns a list of problems (empty when it checks out)."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT vote_count, tallies, ledger_sha256 FROM election_archives "
+                   "WHERE election_id = %s", (election_id,))
+    row = cursor.fetchone()
+    if row is None:
+        cursor.close()
+        return [f'election {election_id} has no archive']
+    vote_count, archived_tallies, digest = row
+    problems = []
+
+    ledger_digest, ledger_votes, ledger_counts = scan_ledger(ledger_pieces(conn, election_id))
+    if ledger_digest != digest:
+        problems.append('ledger checksum does not match')
+    if ledger_votes != vote_count:
+        problems.append(f'ledger has {ledger_votes} votes, archive says {vote_count}')
+
+    archived = {c['id']: c['vote_count'] for c in json.loads(archived_tallies)}
+    for candidate_id in sorted(set(archived) | set(ledger_counts)):
+        if archived.get(candidate_id, 0) != ledger_counts.get(candidate_id, 0):
+            problems.append(f'candidate {candidate_id}: archived tally {archived.get(candidate_id, 0)}, '
+                            f'ledger {ledger_counts.get(candidate_id, 0)}')
+
+    # The live tables should still agree with the ledger
+    cursor.execute("SELECT candidate_id, vote_count FROM vote_tallies WHERE election_id = %s", (election_id,))
+    live_tallies = {r[0]: r[1] for r in cursor.fetchall() if r[1]}
+    if live_tallies != {k: v for k, v in ledger_counts.items() if v}:
+        problems.append('vote_tallies differ from the ledger')
+    table = votes_table(cursor, election_id)
+    _, live_digest, _ = build_ledger(conn, election_id, table)
+    if live_digest != digest:
+        problems.append(f'rows in {table} differ from the ledger')
+    cursor.close()
+    return problems
+
+
+# --------------------- CLI: flask archive ... ---------------------
+
+archive_cli = AppGroup('archive', help='Archive and audit completed elections.')
+
+
+@archive_cli.command('election')
+@click.argument('election_id', type=int)
+@click.option('--move-votes/--keep-votes', default=None,
+              help='Move the vote rows to votes_archive (default: ARCHIVE_MOVE_VOTES).')
+def archive_command(election_id, move_votes):
+    """Archive a completed election."""
+    if move_votes is None:
+        move_votes = current_app.config['ARCHIVE_MOVE_VOTES']
+    try:
+        votes, size = archive_election(get_db(), election_id, move_votes,
+                                       current_app.config['ARCHIVE_CHUNK_SIZE'])
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Archived election {election_id}: {votes} votes, ledger {size} bytes compressed.')
+
+
+@archive_cli.command('move-votes')
+@click.argument('election_id', type=int)
+def move_command(election_id):
+    """Move an archived election's vote rows to votes_archive."""
+    conn = get_db()
+    cursor = conn.cursor()
+    info = archive_info(cursor, election_id)
+    cursor.close()
+    if not info:
+        raise click.ClickException(f'Election {election_id} is not archived.')
+    moved = move_election_votes(conn, election_id, current_app.config['ARCHIVE_CHUNK_SIZE'])
+    click.echo(f'Moved {moved} votes.')
+
+
+@archive_cli.command('verify')
+@click.option('--election', 'election_id', type=int, default=None, help='Only audit this election.')
+def verify_command(election_id):
+    """Check archives against their ledgers and the live tables."""
+    conn = get_db()
+    cursor = conn.cursor()
+    if election_id is None:
+        cursor.execute("SELECT election_id FROM election_archives ORDER BY election_id")
+        election_ids = [row[0] for row in cursor.fetchall()]
+    else:
+        election_ids = [election_id]
+    cursor.close()
+    failed = 0
+    for eid in election_ids:
+        problems = verify_archive(conn, eid)
+        for problem in problems:
+            click.echo(f'election {eid}: {problem}')
+        failed += bool(problems)
+    if failed:
+        raise SystemExit(f'{failed} archive(s) failed verification')
+    click.echo(f'{len(election_ids)} archive(s) verified.')
+
+
+@archive_cli.command('ledger')
+@click.argument('election_id', type=int)
+@click.argument('output', type=click.File('wb'))
+def ledger_command(election_id, output):
+    """Write an election's uncompressed vote ledger (CSV) for an external audit."""
+    try:
+        for raw in read_ledger(ledger_pieces(get_db(), election_id)):
+            output.write(raw)
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
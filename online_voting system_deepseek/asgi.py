@@ -0,0 +1,395 @@
+"""ASGI entry point: async voter routes, everything else through the Flask app.
+
+    uvicorn asgi:application --workers 1
+
+Login, the election list, ballots, cast_vote and results run as coroutines
+on the event loop, talking to MySQL through an aiomysql pool and awaiting
+the KDF executor, so a waiting request holds no thread. They run inside an
+ordinary Flask request context, so sessions, flash messages, templates,
+url_for and the in-process caches behave as in app.py. Cache misses that
+go through the blocking database helpers run on a worker thread. All other
+routes are handed to the WSGI app on asgiref's thread pool; with
+DB_BACKEND = 'sqlite' (no async driver) every route is, except the admin
+turnout stream.
+
+The turnout stream (/admin/turnout/stream) should always be served from
+here: under WSGI each open dashboard pins a worker thread for as long as it
+stays open, while here it is a coroutine awaiting the shared sampler.
+"""
+import asyncio
+import io
+import sys
+import time
+from datetime import datetime
+
+import aiomysql
+from asgiref.wsgi import WsgiToAsgi
+from flask import Response, flash, redirect, render_template, request, session, url_for
+from pymysql.constants.ER import DUP_ENTRY as ER_DUP_ENTRY
+from werkzeug.exceptions import HTTPException
+
+import tallies
+from admission import admit_async
+from app import (app, cached_page, conditional_page, results_published, results_snapshot,
+                 _journal_vote)
+from db import note_commit
+from election_index import get_election_index
+from metrics import SQL_SECONDS, SQL_ROWS, statement_label
+from passwords import get_hasher
+from results_cache import get_results_cache
+from turnout import get_turnout, TURNOUT_STREAM_HEADERS
+from vote_guard import get_vote_guard
+from vote_journal import get_vote_journal
+
+_pool = None
+
+
+async def _execute(cursor, sql, args=None):
+    start = time.perf_counter()
+    try:
+        return await cursor.execute(sql, args)
+    finally:
+        label = statement_label(sql)
+        SQL_SECONDS.observe(time.perf_counter() - start, label)
+        SQL_ROWS.inc(max(cursor.rowcount, 0), label)
+
+
+# --------------------- Async voter routes ---------------------
+
+async def voter_login():
+    if request.method == 'POST':
+        identifier = request.form['identifier']
+        password = request.form['password']
+
+        async with _pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await _execute(cursor, "SELECT * FROM voters WHERE email = %s OR voter_id = %s",
+                               (identifier, identifier))
+                voter = await cursor.fetchone()
+
+        # No connection is held while the KDF runs
+        hasher = get_hasher()
+        if voter and await hasher.verify_async(voter['password'], password):
+            # Upgrade hashes made with older KDF settings
+            if hasher.needs_rehash(voter['password']):
+                pwhash = await hasher.hash_async(password)
+                async with _pool.acquire() as conn:
+                    async with conn.cursor() as cursor:
+                        await _execute(cursor, "UPDATE voters SET password = %s WHERE id = %s",
+                                       (pwhash, voter['id']))
+                    await conn.commit()
+                note_commit()
+                hasher.note_rehash()
+            session['voter_id'] = voter['id']
+            session['voter_name'] = voter['full_name']
+            return redirect(url_for('voter_dashboard'))
+        flash('Invalid credentials!', 'danger')
+
+    return render_template('voter/login.html')
+
+
+async def voter_elections():
+    if 'voter_id' not in session:
+        return redirect(url_for('voter_login'))
+    index = get_election_index()
+    elections = await asyncio.to_thread(index.open_elections, datetime.now())
+    version = tuple((election['id'], index.fingerprint(election['id'])) for election in elections)
+    return cached_page(('elections',), version, 'voter/elections.html', lambda: {'elections': elections})
+
+
+async def voter_candidates(election_id):
+    if 'voter_id' not in session:
+        return redirect(url_for('voter_login'))
+    index = get_election_index()
+    election, candidates = await asyncio.to_thread(index.ballot, election_id, datetime.now())
+    if not election:
+        flash('This election is not active or not within the voting time!', 'warning')
+        return redirect(url_for('voter_elections'))
+    return cached_page(('candidates', election_id), index.fingerprint(election_id), 'voter/candidates.html',
+                       lambda: {'candidates': candidates, 'election': election})
+
+
+async def cast_vote(candidate_id):
+    if 'voter_id' not in session:
+        return redirect(url_for('voter_login'))
+
+    election_id = request.form.get('election_id', type=int)
+    if not election_id:
+        flash('Election not specified!', 'danger')
+        return redirect(url_for('voter_dashboard'))
+
+    # Only open elections get as far as the vote guard, which keeps a
+    # bitmap for every election it is asked about
+    election, _ = await asyncio.to_thread(get_election_index().ballot, election_id, datetime.now())
+    if election is None:
+        flash('This election is not active or not within the voting time!', 'warning')
+        return redirect(url_for('voter_elections'))
+
+    voter_id = session['voter_id']
+    guard = get_vote_guard()
+    # The first check of an election loads its voted set from the database
+    if await asyncio.to_thread(guard.has_voted, voter_id, election_id):
+        flash('You have already voted in this election!', 'danger')
+        return redirect(url_for('voter_dashboard'))
+
+    journal = get_vote_journal()
+    if journal is not None:
+        return await asyncio.to_thread(_journal_vote, journal, guard, candidate_id, election_id)
+
+    async with _pool.acquire() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                if not await _execute(cursor, tallies.INSERT_VOTE_SQL, (voter_id, candidate_id, election_id)):
+                    await conn.rollback()
+                    flash('This election is not active or not within the voting time!', 'warning')
+                    return redirect(url_for('voter_elections'))
+                await _execute(cursor, tallies.RECORD_VOTE_SQL, (election_id, candidate_id))
+            await conn.commit()
+            # aiomysql connections are not InstrumentedConnections
+            note_commit()
+        except aiomysql.IntegrityError as e:
+            await conn.rollback()
+            if e.args[0] != ER_DUP_ENTRY:
+                flash(f'Error: {str(e)}', 'danger')
+                return redirect(url_for('voter_dashboard'))
+            guard.mark(voter_id, election_id)
+            flash('You have already voted in this election!', 'danger')
+            return redirect(url_for('voter_dashboard'))
+        except aiomysql.Error as e:
+            await conn.rollback()
+            flash(f'Error: {str(e)}', 'danger')
+            return redirect(url_for('voter_results', election_id=election_id))
+
+    guard.mark(voter_id, election_id)
+    get_results_cache().invalidate(election_id)
+    flash('Vote cast successfully!', 'success')
+    return redirect(url_for('voter_results', election_id=election_id))
+
+
+async def voter_results(election_id):
+    if 'voter_id' not in session:
+        return redirect(url_for('voter_login'))
+
+    cache = get_results_cache()
+    published = cache.published()
+    if published is None:
+        published = await asyncio.to_thread(results_published)
+    if not published:
+        flash('Results are not published yet!', 'warning')
+        return redirect(url_for('voter_dashboard'))
+
+    entry = cache.get(election_id)
+    if entry is None or not entry['frozen']:
+        entry = await asyncio.to_thread(results_snapshot, election_id)
+    if entry is None:
+        flash('Election not found or not completed!', 'warning')
+        return redirect(url_for('voter_results_select'))
+
+    return conditional_page(entry['etag'], 'voter/results.html',
+                            results=entry['results'], total_votes=entry['total_votes'])
+
+
+async def admin_turnout_stream():
+    if 'admin_id' not in session:
+        return redirect(url_for('admin_login'))
+    monitor = get_turnout()
+    if not monitor.acquire_stream():
+        return 'Too many live dashboards are open, please try again shortly.', 503
+    # The body is an async iterator; _stream() sends it chunk by chunk
+    response = Response(monitor.stream_async(app.config['TURNOUT_KEEPALIVE']), mimetype='text/event-stream',
+                        headers=TURNOUT_STREAM_HEADERS)
+    response.call_on_close(monitor.release_stream)
+    return response
+
+
+# Flask endpoint name -> coroutine serving it
+ASYNC_VIEWS = {
+    'voter_login': voter_login,
+    'voter_elections': voter_elections,
+    'voter_candidates': voter_candidates,
+    'cast_vote': cast_vote,
+    'voter_results': voter_results,
+}
+# Streaming endpoints served here whatever the database backend
+ASYNC_STREAMS = {
+    'admin_turnout_stream': admin_turnout_stream,
+}
+
+
+# --------------------- ASGI plumbing ---------------------
+
+def _environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope, so Flask can build its request."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'content-length':
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            if key in environ:
+                # HTTP/2 clients may split cookies over several headers
+                value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+            environ[key] = value
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _dispatch(environ, view):
+    # Mirrors Flask.full_dispatch_request() with an awaited view
+    ctx = app.request_context(environ)
+    error = None
+    ctx.push()
+    try:
+        try:
+            rv = await admit_async()
+            if rv is None:
+                rv = app.preprocess_request()
+            if rv is None:
+                rv = await view(**request.view_args)
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        response = app.process_response(app.make_response(rv))
+    except Exception as e:
+        error = e
+        response = app.handle_exception(e)
+    try:
+        return response.status_code, response.get_wsgi_headers(environ), response.get_data()
+    finally:
+        ctx.pop(error)
+
+
+def _start(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    }
+
+
+async def _until_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _stream(environ, view, receive, send):
+    """Serve a view whose response body may be an async iterator of text chunks."""
+    ctx = app.request_context(environ)
+    ctx.push()
+    try:
+        try:
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await view(**request.view_args)
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        response = app.process_response(app.make_response(rv))
+        headers = response.get_wsgi_headers(environ).items()
+    finally:
+        ctx.pop()
+
+    try:
+        await send(_start(response.status_code, headers))
+        if not hasattr(response.response, '__aiter__'):
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+            return
+        # Stop as soon as the client goes, not at the next chunk
+        disconnected = asyncio.ensure_future(_until_disconnect(receive))
+        chunks = response.response
+        try:
+            while True:
+                chunk = asyncio.ensure_future(chunks.__anext__())
+                await asyncio.wait((chunk, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if not chunk.done():
+                    chunk.cancel()
+                    await asyncio.gather(chunk, return_exceptions=True)
+                    return
+                if chunk.exception() is not None:
+                    if isinstance(chunk.exception(), StopAsyncIteration):
+                        break
+                    raise chunk.exception()
+                await send({'type': 'http.response.body', 'body': chunk.result().encode(), 'more_body': True})
+        finally:
+            disconnected.cancel()
+            await chunks.aclose()
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        response.close()
+
+
+async def _lifespan(receive, send):
+    global _pool
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # As wsgi.load_app() does for the WSGI server
+            app.extensions['shared_store'].reset()
+            if app.config['DB_BACKEND'] != 'mysql':
+                await send({'type': 'lifespan.startup.complete'})
+                continue
+            _pool = await aiomysql.create_pool(
+                host=app.config['MYSQL_HOST'], user=app.config['MYSQL_USER'],
+                password=app.config['MYSQL_PASSWORD'], db=app.config['MYSQL_DB'],
+                minsize=1, maxsize=app.config['ASYNC_DB_POOL_SIZE'],
+            )
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _pool is not None:
+                _pool.close()
+                await _pool.wait_closed()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+wsgi_application = WsgiToAsgi(app)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    view = stream = None
+    if scope['type'] == 'http':
+        try:
+            rule, _ = app.url_map.bind_to_environ(_environ(scope, b'')).match(return_rule=True)
+            stream = ASYNC_STREAMS.get(rule.endpoint)
+            if _pool is not None:
+                view = ASYNC_VIEWS.get(rule.endpoint)
+        except HTTPException:
+            pass
+    if stream is not None:
+        return await _stream(_environ(scope, await _read_body(receive)), stream, receive, send)
+    if view is None:
+        return await wsgi_application(scope, receive, send)
+
+    environ = _environ(scope, await _read_body(receive))
+    status, headers, body = await _dispatch(environ, view)
+    await send(_start(status, headers.items()))
+    await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,148 @@
+"""Compare the threaded Flask server with the ASGI app at high concurrency.
+
+    python benchmarks/load_test.py seed --db voting_system_bench --voters 20000
+    python benchmarks/asgi_bench.py --db voting_system_bench --connections 50 200 1000
+    python benchmarks/asgi_bench.py --servers asgi --paths /voter/elections /voter/results/4
+
+Each server runs as its own process pinned to one CPU core. The client
+opens the given number of keep-alive connections at once, each signed in
+as a different seeded voter, and requests the paths round-robin for
+--seconds. Needs uvicorn and aiomysql for the ASGI side.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from load_test import connect, percentile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    # Werkzeug's threaded server, one thread per connection, as app.run() uses
+    'threaded': 'from wsgi import load_app; load_app().run(host="127.0.0.1", port={port}, threaded=True)',
+    'asgi': ('import uvicorn; uvicorn.run("asgi:application", host="127.0.0.1", port={port}, '
+             'workers=1, log_level="warning", backlog=4096)'),
+}
+
+
+def start_server(kind, db, port, core):
+    code = f'from config import Config; Config.MYSQL_DB = {db!r}; ' + SERVERS[kind].format(port=port)
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=APP_DIR,
+                               preexec_fn=lambda: os.sched_setaffinity(0, {core}),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    sys.exit(f'{kind} server did not start on port {port}')
+
+
+def session_cookies(voter_ids):
+    # Signed the same way the app signs its own session cookie
+    from app import app
+    serializer = app.session_interface.get_signing_serializer(app)
+    return [serializer.dumps({'voter_id': voter_id}) for voter_id in voter_ids]
+
+
+async def client(port, paths, cookie, deadline, latencies, errors):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    except OSError:
+        errors.append('connect')
+        return
+    # Start each connection at a different path
+    n = random.randrange(len(paths))
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[n % len(paths)]
+            n += 1
+            start = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nCookie: session={cookie}\r\n\r\n'.encode())
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+    except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+        errors.append('dropped')
+    finally:
+        writer.close()
+
+
+async def drive(port, paths, cookies, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, paths, cookie, deadline, latencies, errors) for cookie in cookies))
+    return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='voting_system_bench')
+    parser.add_argument('--servers', nargs='+', default=['threaded', 'asgi'], choices=sorted(SERVERS))
+    parser.add_argument('--connections', nargs='+', type=int, default=[50, 200, 1000])
+    parser.add_argument('--paths', nargs='+', default=None,
+                        help='Paths to request (default: the election list and each open ballot).')
+    parser.add_argument('--seconds', type=float, default=15.0)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--core', type=int, default=0, help='CPU core the server is pinned to.')
+    args = parser.parse_args()
+    if args.db == Config.MYSQL_DB:
+        sys.exit(f'Refusing to run against {args.db}: it is the configured application database.')
+
+    conn = connect(args.db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM voters ORDER BY id LIMIT %s", (max(args.connections),))
+    voter_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT id FROM elections WHERE is_active = TRUE")
+    open_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+    if len(voter_ids) < max(args.connections):
+        sys.exit(f'{args.db} needs {max(args.connections)} voters; run load_test.py seed.')
+    paths = args.paths or ['/voter/elections'] + [f'/voter/candidates/{i}' for i in open_ids]
+
+    Config.MYSQL_DB = args.db
+    os.chdir(APP_DIR)
+    cookies = session_cookies(voter_ids)
+
+    print(f'{"server":<9} {"conns":>6} {"requests":>9} {"err":>6} {"rps":>9} {"p50 ms":>9} {"p99 ms":>9}')
+    for kind in args.servers:
+        server = start_server(kind, args.db, args.port, args.core)
+        try:
+            for connections in args.connections:
+                latencies, errors, elapsed = asyncio.run(
+                    drive(args.port, paths, cookies[:connections], args.seconds))
+                latencies.sort()
+                print(f'{kind:<9} {connections:>6} {len(latencies):>9} {len(errors):>6} '
+                      f'{len(latencies) / elapsed:>9.1f} {percentile(latencies, 50) * 1000:>9.1f} '
+                      f'{percentile(latencies, 99) * 1000:>9.1f}')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
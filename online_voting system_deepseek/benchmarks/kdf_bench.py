@@ -0,0 +1,67 @@
+"""Measure password-check throughput for different KDF settings.
+
+    python benchmarks/kdf_bench.py
+    python benchmarks/kdf_bench.py --workers 4 --seconds 5 --method pbkdf2:sha256:600000
+
+Each method is run through the app's PasswordHasher with the given number of
+KDF workers; logins/s per core is the total divided by the cores in use.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from passwords import PasswordHasher
+
+DEFAULT_METHODS = [
+    Config.PASSWORD_HASH_METHOD,
+    'scrypt:16384:8:1',
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+]
+
+
+def bench(method, workers, seconds):
+    hasher = PasswordHasher(method, workers=workers, max_queue=workers * 4)
+    pwhash = hasher.hash('correct horse battery staple')
+    deadline = time.perf_counter() + seconds
+    counts = [0] * (workers * 2)
+
+    # Twice as many callers as KDF workers keeps the executor saturated
+    def caller(slot):
+        while time.perf_counter() < deadline:
+            hasher.verify(pwhash, 'correct horse battery staple')
+            counts[slot] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(len(counts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(counts) / elapsed
+    cores = min(workers, os.cpu_count() or 1)
+    return total, total / cores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', action='append', help='werkzeug hash method (repeatable)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f'{"method":<28} {"workers":>7} {"logins/s":>10} {"per core":>10}')
+    for method in args.method or DEFAULT_METHODS:
+        total, per_core = bench(method, args.workers, args.seconds)
+        print(f'{method:<28} {args.workers:>7} {total:>10.1f} {per_core:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+"""Election-day load test for the voting flows.
+
+Seed a dedicated database, drive a polling-day mix of requests through the
+app in-process and save the latency percentiles as JSON:
+
+    python benchmarks/load_test.py seed --db voting_system_bench --create-schema \\
+        --voters 20000 --elections 3 --candidates 8
+    python benchmarks/load_test.py run --db voting_system_bench --users 32 --seconds 60 \\
+        --out runs/baseline.json
+    python benchmarks/load_test.py compare runs/baseline.json runs/candidate.json --threshold 10
+
+Pass --backend sqlite to seed and run against an embedded database
+instead; --db is then the database file.
+
+Add --capture-sql runs/statements.jsonl to a run to record every distinct
+statement the app issued; `flask db explain runs/statements.jsonl` then
+checks their query plans against the seeded data.
+
+The mix is weighted towards the surge pattern: logins, election lists,
+ballot pages and votes, with some registrations and results views. Seeding
+wipes the target database, so it refuses to touch the configured MYSQL_DB
+or SQLITE_PATH.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+
+from config import Config
+from db import MySQLdb
+from schema import upgrade
+from tallies import rebuild_counters
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'bench-password'
+
+# action -> weight in the request mix
+MIX = {
+    'login': 10,
+    'elections': 25,
+    'candidates': 30,
+    'cast_vote': 15,
+    'results_select': 8,
+    'results': 10,
+    'register': 2,
+}
+
+
+def connect(db, backend='mysql'):
+    if backend == 'sqlite':
+        from sqlite_db import SQLiteConnection
+        return SQLiteConnection(db)
+    return MySQLdb.connect(host=Config.MYSQL_HOST, user=Config.MYSQL_USER,
+                           password=Config.MYSQL_PASSWORD, db=db)
+
+
+def configured_db(backend):
+    return os.path.abspath(Config.SQLITE_PATH) if backend == 'sqlite' else Config.MYSQL_DB
+
+
+def use_db(db, backend):
+    """Point the app's Config at the benchmark database before app is imported."""
+    Config.DB_BACKEND = backend
+    if backend == 'sqlite':
+        Config.SQLITE_PATH = os.path.abspath(db)
+    else:
+        Config.MYSQL_DB = db
+
+
+# --------------------- Seeding ---------------------
+
+def seed(args):
+    target = os.path.abspath(args.db) if args.backend == 'sqlite' else args.db
+    if target == configured_db(args.backend):
+        sys.exit(f'Refusing to seed {args.db}: it is the configured application database.')
+    if args.backend == 'sqlite':
+        # A fresh file every time, always with the schema
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+        conn = connect(args.db, 'sqlite')
+        cursor = conn.cursor()
+        upgrade(conn, backend='sqlite')
+    else:
+        conn = MySQLdb.connect(host=Config.MYSQL_HOST, user=Config.MYSQL_USER, password=Config.MYSQL_PASSWORD)
+        cursor = conn.cursor()
+        cursor.execute(f'CREATE DATABASE IF NOT EXISTS `{args.db}`')
+        conn.select_db(args.db)
+        if args.create_schema:
+            upgrade(conn)
+
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+        for table in ('votes', 'vote_tallies', 'vote_journal_checkpoints', 'votes_archive',
+                      'election_archive_ledger', 'election_archives', 'jobs', 'candidates', 'elections', 'voters'):
+            cursor.execute(f'TRUNCATE TABLE {table}')
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+
+    now = datetime.now()
+    # Open elections for voting plus one completed election for the results pages
+    windows = [(now - timedelta(hours=1), now + timedelta(days=1), True)] * args.elections
+    windows.append((now - timedelta(days=2), now - timedelta(days=1), False))
+    for i, (start, end, active) in enumerate(windows, 1):
+        cursor.execute(
+            "INSERT INTO elections (name, area, start_time, end_time, is_active) VALUES (%s, %s, %s, %s, %s)",
+            (f'Bench Election {i}', f'Ward {i}', start, end, active)
+        )
+        election_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO candidates (candidate_name, party_name, election_id) VALUES (%s, %s, %s)",
+            [(f'Candidate {i}.{c}', f'Party {c}', election_id) for c in range(1, args.candidates + 1)]
+        )
+    cursor.execute("INSERT INTO admin_settings (id, results_published) VALUES (1, TRUE) "
+                   "ON DUPLICATE KEY UPDATE results_published = TRUE")
+
+    # Every seeded voter shares one password hash so seeding stays fast
+    pwhash = generate_password_hash(PASSWORD, Config.PASSWORD_HASH_METHOD, Config.PASSWORD_SALT_LENGTH)
+    batch = []
+    for n in range(1, args.voters + 1):
+        batch.append((f'Bench Voter {n}', f'BENCH{n:08d}', f'bench{n}@example.test', pwhash))
+        if len(batch) == 5000 or n == args.voters:
+            cursor.executemany(
+                "INSERT INTO voters (full_name, voter_id, email, password) VALUES (%s, %s, %s, %s)", batch
+            )
+            conn.commit()
+            batch = []
+    rebuild_counters(cursor)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f'Seeded {args.db}: {args.voters} voters, {args.elections} open elections '
+          f'(+1 completed), {args.candidates} candidates each.')
+
+
+# --------------------- Load run ---------------------
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    k = max(0, math.ceil(p / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, action, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(action, []).append(seconds)
+            if not ok:
+                self.errors[action] = self.errors.get(action, 0) + 1
+
+
+class VirtualVoter(threading.Thread):
+    """One browser session working through its own slice of seeded voters."""
+
+    def __init__(self, app, recorder, voter_numbers, open_elections, completed_election, deadline, seed_value):
+        super().__init__(daemon=True)
+        self.client = app.test_client()
+        self.recorder = recorder
+        self.voter_numbers = iter(voter_numbers)
+        self.open_elections = open_elections
+        self.completed_election = completed_election
+        self.deadline = deadline
+        self.random = random.Random(seed_value)
+        self.voted = set()
+        self.registered = 0
+
+    def timed(self, action, method, url, **kwargs):
+        start = time.perf_counter()
+        response = getattr(self.client, method)(url, **kwargs)
+        elapsed = time.perf_counter() - start
+        self.recorder.add(action, elapsed, response.status_code < 400)
+        return response
+
+    def login_next(self):
+        number = next(self.voter_numbers, None)
+        if number is None:
+            return False
+        self.voted = set()
+        self.timed('login', 'post', '/voter/login',
+                   data={'identifier': f'BENCH{number:08d}', 'password': PASSWORD})
+        return True
+
+    def run(self):
+        if not self.login_next():
+            return
+        actions, weights = zip(*MIX.items())
+        while time.perf_counter() < self.deadline:
+            action = self.random.choices(actions, weights)[0]
+            election_id, candidate_ids = self.random.choice(self.open_elections)
+            if action == 'login':
+                if not self.login_next():
+                    return
+            elif action == 'elections':
+                self.timed(action, 'get', '/voter/elections')
+            elif action == 'candidates':
+                self.timed(action, 'get', f'/voter/candidates/{election_id}')
+            elif action == 'cast_vote':
+                if election_id in self.voted:
+                    continue
+                self.voted.add(election_id)
+                self.timed(action, 'post', f'/vote/{self.random.choice(candidate_ids)}',
+                           data={'election_id': election_id})
+            elif action == 'results_select':
+                self.timed(action, 'get', '/voter/results/select')
+            elif action == 'results':
+                self.timed(action, 'get', f'/voter/results/{self.completed_election}')
+            elif action == 'register':
+                self.registered += 1
+                tag = f'{self.name}-{self.registered}-{int(time.time() * 1000)}'
+                self.timed(action, 'post', '/voter/register',
+                           data={'full_name': f'New Voter {tag}', 'voter_id': f'NEW-{tag}',
+                                 'email': f'new-{tag}@example.test', 'password': PASSWORD})
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    # Point the app at the benchmark database before it is imported
+    use_db(args.db, args.backend)
+    Config.DB_POOL_SIZE = max(Config.DB_POOL_SIZE, args.users)
+    if args.capture_sql:
+        Config.SQL_CAPTURE_FILE = os.path.abspath(args.capture_sql)
+    os.chdir(APP_DIR)
+    from wsgi import load_app
+    app = load_app(warm_up=False)
+
+    conn = connect(args.db, args.backend)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM elections WHERE is_active = TRUE")
+    open_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT id FROM elections WHERE is_active = FALSE LIMIT 1")
+    completed = cursor.fetchone()
+    open_elections = []
+    for election_id in open_ids:
+        cursor.execute("SELECT id FROM candidates WHERE election_id = %s", (election_id,))
+        open_elections.append((election_id, [row[0] for row in cursor.fetchall()]))
+    cursor.execute("SELECT COUNT(*) FROM voters WHERE voter_id LIKE 'BENCH%'")
+    voter_count = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    if not open_elections or not completed or not voter_count:
+        sys.exit(f'{args.db} is not seeded; run the seed command first.')
+
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.seconds
+    users = [
+        VirtualVoter(app, recorder, range(u + 1, voter_count + 1, args.users), open_elections,
+                     completed[0], deadline, args.seed + u)
+        for u in range(args.users)
+    ]
+    start = time.perf_counter()
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.perf_counter() - start
+
+    routes = {}
+    for action, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        routes[action] = {
+            'count': len(samples),
+            'errors': recorder.errors.get(action, 0),
+            'throughput_rps': round(len(samples) / elapsed, 2),
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+            'p50_ms': round(percentile(samples, 50) * 1000, 3),
+            'p95_ms': round(percentile(samples, 95) * 1000, 3),
+            'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        }
+    total = sum(route['count'] for route in routes.values())
+    report = {
+        'meta': {
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'db': args.db,
+            'backend': args.backend,
+            'users': args.users,
+            'seconds': round(elapsed, 2),
+            'mix': MIX,
+            'seed': args.seed,
+        },
+        'total': {'count': total, 'throughput_rps': round(total / elapsed, 2)},
+        'routes': routes,
+    }
+
+    print_report(report)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Saved {args.out}')
+
+
+def print_report(report):
+    print(f'{"route":<16} {"count":>8} {"err":>5} {"rps":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    for action, route in report['routes'].items():
+        print(f'{action:<16} {route["count"]:>8} {route["errors"]:>5} {route["throughput_rps"]:>9.1f} '
+              f'{route["p50_ms"]:>9.1f} {route["p95_ms"]:>9.1f} {route["p99_ms"]:>9.1f}')
+    print(f'{"total":<16} {report["total"]["count"]:>8} {"":>5} {report["total"]["throughput_rps"]:>9.1f}')
+
+
+# --------------------- Comparing runs ---------------------
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    regressions = []
+    print(f'{"route":<16} {"p95 base":>10} {"p95 new":>10} {"change":>8} {"rps base":>9} {"rps new":>9}')
+    for action in sorted(set(baseline['routes']) | set(candidate['routes'])):
+        old = baseline['routes'].get(action)
+        new = candidate['routes'].get(action)
+        if not old or not new:
+            print(f'{action:<16} missing from {"baseline" if not old else "candidate"}')
+            continue
+        change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        flag = ''
+        if change > args.threshold:
+            regressions.append(action)
+            flag = '  REGRESSION'
+        print(f'{action:<16} {old["p95_ms"]:>10.1f} {new["p95_ms"]:>10.1f} {change:>7.1f}% '
+              f'{old["throughput_rps"]:>9.1f} {new["throughput_rps"]:>9.1f}{flag}')
+    if regressions:
+        sys.exit(f'p95 regressed by more than {args.threshold}% on: {", ".join(regressions)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('seed', help='Wipe and seed a benchmark database.')
+    p.add_argument('--db', default='voting_system_bench')
+    p.add_argument('--backend', choices=('mysql', 'sqlite'), default='mysql')
+    p.add_argument('--create-schema', action='store_true', help='Apply the schema migrations first.')
+    p.add_argument('--voters', type=int, default=10000)
+    p.add_argument('--elections', type=int, default=3)
+    p.add_argument('--candidates', type=int, default=8)
+    p.set_defaults(func=seed)
+
+    p = commands.add_parser('run', help='Drive the request mix and report latencies.')
+    p.add_argument('--db', default='voting_system_bench')
+    p.add_argument('--backend', choices=('mysql', 'sqlite'), default='mysql')
+    p.add_argument('--users', type=int, default=16, help='Concurrent virtual voters.')
+    p.add_argument('--seconds', type=float, default=30.0)
+    p.add_argument('--seed', type=int, default=1, help='Random seed for the request mix.')
+    p.add_argument('--out', help='Write the JSON report here.')
+    p.add_argument('--capture-sql', help='Record every distinct statement here for `flask db explain`.')
+    p.set_defaults(func=run)
+
+    p = commands.add_parser('compare', help='Compare two saved runs.')
+    p.add_argument('baseline')
+    p.add_argument('candidate')
+    p.add_argument('--threshold', type=float, default=10.0, help='Allowed p95 increase in percent.')
+    p.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
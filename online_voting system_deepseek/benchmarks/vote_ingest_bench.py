@@ -0,0 +1,150 @@
+"""Compare vote ingestion throughput with and without the write-behind journal.
+
+    python benchmarks/load_test.py seed --db voting_system_bench --voters 20000
+    python benchmarks/vote_ingest_bench.py --db voting_system_bench --users 32 --votes 10000
+    python benchmarks/vote_ingest_bench.py --modes journal --batch-size 1000 --flush-interval 0.05
+
+Each mode runs in its own process against a freshly emptied votes table.
+Every vote is a POST /vote/<candidate> from a distinct seeded voter. For the
+journal mode "acked/s" is how fast voters got their answer and "stored/s"
+includes the time for the writer to drain the journal into the database.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from load_test import connect, percentile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def reset(args):
+    conn = connect(args.db)
+    cursor = conn.cursor()
+    for table in ('votes', 'vote_tallies', 'vote_journal_checkpoints'):
+        cursor.execute(f'DELETE FROM {table}')
+    conn.commit()
+    cursor.execute("SELECT id FROM voters ORDER BY id LIMIT %s", (args.votes,))
+    voter_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT e.id, c.id FROM elections e JOIN candidates c ON c.election_id = e.id
+        WHERE e.is_active = TRUE ORDER BY e.id LIMIT 1
+    """)
+    ballot = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    if not ballot or len(voter_ids) < args.votes:
+        sys.exit(f'{args.db} needs an open election and {args.votes} voters; run load_test.py seed.')
+    return voter_ids, ballot
+
+
+def stored_votes(db):
+    conn = connect(db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM votes")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return count
+
+
+def run_mode(args):
+    """Child process: cast the votes in one ingestion mode and print JSON."""
+    Config.MYSQL_DB = args.db
+    Config.DB_POOL_SIZE = max(Config.DB_POOL_SIZE, args.users + 1)
+    Config.VOTE_INGEST_MODE = args.mode
+    Config.VOTE_JOURNAL_DIR = os.path.join('benchmarks', 'runs', 'journal')
+    Config.VOTE_BATCH_SIZE = args.batch_size
+    Config.VOTE_FLUSH_INTERVAL = args.flush_interval
+    os.chdir(APP_DIR)
+    shutil.rmtree(Config.VOTE_JOURNAL_DIR, ignore_errors=True)
+    from wsgi import load_app
+    app = load_app(warm_up=False)
+
+    voter_ids, (election_id, candidate_id) = reset(args)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def voter(ids):
+        client = app.test_client()
+        mine, failed = [], 0
+        for voter_id in ids:
+            # Sign in by session so the KDF is not part of the measurement
+            with client.session_transaction() as session:
+                session['voter_id'] = voter_id
+            start = time.perf_counter()
+            response = client.post(f'/vote/{candidate_id}', data={'election_id': election_id})
+            mine.append(time.perf_counter() - start)
+            failed += response.status_code >= 400
+        with lock:
+            latencies.extend(mine)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=voter, args=(voter_ids[u::args.users],)) for u in range(args.users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    acked = time.perf_counter() - start
+
+    while stored_votes(args.db) < len(voter_ids) and time.perf_counter() - start < acked + args.drain_timeout:
+        time.sleep(0.05)
+    stored = time.perf_counter() - start
+    count = stored_votes(args.db)
+
+    latencies.sort()
+    print(json.dumps({
+        'mode': args.mode,
+        'votes': len(voter_ids),
+        'stored': count,
+        'errors': sum(errors),
+        'acked_per_s': round(len(voter_ids) / acked, 1),
+        'stored_per_s': round(count / stored, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='voting_system_bench')
+    parser.add_argument('--users', type=int, default=16, help='Concurrent voters.')
+    parser.add_argument('--votes', type=int, default=5000, help='Votes per mode (one per seeded voter).')
+    parser.add_argument('--modes', nargs='+', default=['sync', 'journal'], choices=['sync', 'journal'])
+    parser.add_argument('--batch-size', type=int, default=Config.VOTE_BATCH_SIZE)
+    parser.add_argument('--flush-interval', type=float, default=Config.VOTE_FLUSH_INTERVAL)
+    parser.add_argument('--drain-timeout', type=float, default=60.0,
+                        help='Seconds to wait for the journal to drain after the last vote.')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.db == Config.MYSQL_DB:
+        sys.exit(f'Refusing to run against {args.db}: it is the configured application database.')
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    results = []
+    for mode in args.modes:
+        command = [sys.executable, os.path.abspath(__file__), '--mode', mode] + sys.argv[1:]
+        output = subprocess.check_output(command, cwd=APP_DIR)
+        results.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    print(f'{"mode":<8} {"votes":>7} {"stored":>7} {"err":>5} {"acked/s":>9} {"stored/s":>9} {"p50 ms":>8} {"p99 ms":>8}')
+    for r in results:
+        print(f'{r["mode"]:<8} {r["votes"]:>7} {r["stored"]:>7} {r["errors"]:>5} {r["acked_per_s"]:>9.1f} '
+              f'{r["stored_per_s"]:>9.1f} {r["p50_ms"]:>8.1f} {r["p99_ms"]:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
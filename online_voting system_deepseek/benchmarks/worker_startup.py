@@ -0,0 +1,183 @@
+"""Measure gunicorn worker cold start and memory, with and without preload.
+
+    python benchmarks/load_test.py seed --db voting_system_bench --voters 20000
+    python benchmarks/worker_startup.py --db voting_system_bench --workers 4
+
+For each mode the server is started from gunicorn.conf.py against the
+benchmark database. Cold start is read from the "Worker N ready in X ms"
+line each worker logs (fork to ready to serve), plus the time until the
+server answers its first request. Then --requests requests spread over
+the voter pages warm every worker, and the memory of the master and each
+worker is read from /proc/<pid>/smaps_rollup: RSS, PSS (shared pages
+split between the processes using them) and USS (pages private to the
+process, what one more worker really costs). A worker is also killed to
+time its replacement. Linux only; needs gunicorn.
+"""
+import argparse
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asgi_bench import session_cookies
+from config import Config
+from load_test import connect
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_READY = re.compile(r'Worker (\d+) ready in ([\d.]+) ms')
+
+
+class Server:
+    """gunicorn in a subprocess; collects the workers' ready lines from its log."""
+
+    def __init__(self, settings, port, workers, preload, cookie=None):
+        env = dict(os.environ, VOTING_SETTINGS=settings, VOTING_BIND=f'127.0.0.1:{port}',
+                   VOTING_WORKERS=str(workers), VOTING_PRELOAD='1' if preload else '0')
+        self.port = port
+        self.cookie = cookie
+        self.ready = {}
+        self._cond = threading.Condition()
+        self.started = time.monotonic()
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'info',
+             'wsgi:load_app()'],
+            cwd=APP_DIR, env=env, stderr=subprocess.PIPE, text=True)
+        threading.Thread(target=self._read_log, daemon=True).start()
+
+    def _read_log(self):
+        for line in self.process.stderr:
+            match = _READY.search(line)
+            if match:
+                with self._cond:
+                    self.ready[int(match.group(1))] = float(match.group(2))
+                    self._cond.notify_all()
+
+    def wait_ready(self, count, timeout=60):
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self.ready) >= count, timeout):
+                raise SystemExit(f'only {len(self.ready)} of {count} workers came up')
+
+    def get(self, path):
+        request = urllib.request.Request(f'http://127.0.0.1:{self.port}{path}')
+        if self.cookie:
+            request.add_header('Cookie', f'session={self.cookie}')
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.read()
+
+    def first_response(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.get('/')
+                return time.monotonic() - self.started
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.01)
+
+    def workers(self):
+        with open(f'/proc/{self.process.pid}/task/{self.process.pid}/children') as f:
+            return [int(pid) for pid in f.read().split()]
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        self.process.wait(timeout=30)
+
+
+def memory(pid):
+    """(rss, pss, uss) in MiB."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1])
+    uss = fields['Private_Clean'] + fields['Private_Dirty']
+    return fields['Rss'] / 1024, fields['Pss'] / 1024, uss / 1024
+
+
+def measure(settings, args, preload, paths, cookie):
+    server = Server(settings, args.port, args.workers, preload, cookie)
+    try:
+        first = server.first_response()
+        server.wait_ready(args.workers)
+        cold = list(server.ready.values())
+        for i in range(args.requests):
+            server.get(paths[i % len(paths)])
+        workers = server.workers()
+        per_worker = [memory(pid) for pid in workers]
+
+        # Replacement of a crashed worker
+        server.ready.clear()
+        os.kill(workers[0], signal.SIGKILL)
+        server.wait_ready(1)
+        respawn = list(server.ready.values())[0]
+        master = memory(server.process.pid)
+    finally:
+        server.stop()
+
+    def avg(i):
+        return statistics.mean(m[i] for m in per_worker)
+
+    return {
+        'first_response_s': first,
+        'cold_start_ms_p50': statistics.median(cold),
+        'cold_start_ms_max': max(cold),
+        'respawn_ms': respawn,
+        'master_rss_mb': master[0],
+        'worker_rss_mb': avg(0),
+        'worker_pss_mb': avg(1),
+        'worker_uss_mb': avg(2),
+        'total_pss_mb': master[1] + sum(m[1] for m in per_worker),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default='voting_system_bench')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--port', type=int, default=5098)
+    parser.add_argument('--modes', nargs='+', default=['preload', 'no-preload'], choices=['preload', 'no-preload'])
+    args = parser.parse_args()
+    if args.db == Config.MYSQL_DB:
+        sys.exit(f'Refusing to run against {args.db}: it is the configured application database.')
+
+    conn = connect(args.db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(id) FROM voters")
+    voter_id = cursor.fetchone()[0]
+    cursor.execute("SELECT id FROM elections WHERE is_active = TRUE")
+    open_ids = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    conn.close()
+    if voter_id is None:
+        sys.exit(f'{args.db} has no voters; run load_test.py seed.')
+    paths = (['/', '/voter/dashboard', '/voter/elections', '/voter/results/select']
+             + [f'/voter/candidates/{i}' for i in open_ids])
+
+    Config.MYSQL_DB = args.db
+    os.chdir(APP_DIR)
+    cookie = session_cookies([voter_id])[0]
+
+    with tempfile.NamedTemporaryFile('w', suffix='.py') as settings:
+        settings.write(f'MYSQL_DB = {args.db!r}\n')
+        settings.flush()
+        results = {mode: measure(settings.name, args, mode == 'preload', paths, cookie) for mode in args.modes}
+
+    print(f'{args.workers} workers, {args.requests} requests over {len(paths)} pages')
+    print(f'{"":<22}' + ''.join(f'{mode:>12}' for mode in results))
+    for key in next(iter(results.values())):
+        print(f'{key:<22}' + ''.join(f'{result[key]:>12.1f}' for result in results.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,143 @@ import os
 
 class Config:
     SECRET_KEY = 'your_secret_key'
+    # Storage backend: 'mysql' (the MYSQL_* settings below) or 'sqlite', an
+    # embedded database file in WAL mode for single-node deployments. Apply
+    # the schema with `flask db upgrade` either way
+    DB_BACKEND = 'mysql'
+    SQLITE_PATH = 'voting_system.db'
+    # Seconds a writer waits for the write lock before "database is locked"
+    SQLITE_BUSY_TIMEOUT = 5
+    SQLITE_CACHE_MB = 64
+    SQLITE_MMAP_MB = 256
+    # Prepared statements kept per connection
+    SQLITE_STATEMENT_CACHE = 256
+    # FULL fsyncs the WAL on every commit; NORMAL is faster but a power
+    # failure can lose the last few committed votes
+    SQLITE_SYNCHRONOUS = 'FULL'
     MYSQL_HOST = 'localhost'
     MYSQL_USER = 'root'
     MYSQL_PASSWORD = 'Yoga@151'
     MYSQL_DB = 'voting_system'
+    # Connection pool
+    DB_POOL_SIZE = 10
+    DB_POOL_MAX_OVERFLOW = 5
+    DB_POOL_TIMEOUT = 30
+    DB_POOL_RECYCLE = 3600
+    DB_POOL_PRE_PING = True
+    # Read replicas, each a dict overriding the MYSQL_* settings above, e.g.
+    # {'host': 'replica-1'}; add 'check_lag': False for a standalone local
+    # instance standing in for a replica. Replicas more than REPLICA_MAX_LAG
+    # seconds behind are skipped, and a session reads from the primary for
+    # READ_YOUR_WRITES_SECONDS after it writes
+    MYSQL_REPLICAS = []
+    REPLICA_MAX_LAG = 5
+    REPLICA_CHECK_INTERVAL = 5
+    READ_YOUR_WRITES_SECONDS = 10
+    # Log statements slower than this (None disables); to the app log unless a file is given
+    SLOW_QUERY_THRESHOLD_MS = None
+    SLOW_QUERY_LOG_FILE = None
+    # Append one sample of every distinct statement here (None disables); check
+    # the plans with `flask db explain FILE`, which fails on full scans over
+    # EXPLAIN_MAX_SCAN_ROWS estimated rows
+    SQL_CAPTURE_FILE = None
+    EXPLAIN_MAX_SCAN_ROWS = 1000
+    # Lets a Prometheus scraper read /admin/metrics without an admin session
+    METRICS_TOKEN = None
+    # Admission control: at most ADMISSION_TOTAL requests run at once (about
+    # the DB pool size + overflow) and at most 'limit' of each route class;
+    # the rest wait up to ADMISSION_MAX_WAIT seconds in a queue of 'queue'
+    # per class, served by priority (0 first), and are otherwise answered
+    # 503 with Retry-After. Token buckets, (per second, burst), limit each
+    # voter and client address; behind a proxy, set up ProxyFix so the
+    # address is the client's
+    ADMISSION_ENABLED = True
+    ADMISSION_TOTAL = 15
+    ADMISSION_CLASSES = {
+        'vote': {'priority': 0, 'limit': 12, 'queue': 200},
+        'login': {'priority': 1, 'limit': 6, 'queue': 100},
+        'ballot': {'priority': 2, 'limit': 8, 'queue': 100},
+        'results': {'priority': 3, 'limit': 4, 'queue': 50},
+        'admin': {'priority': 4, 'limit': 2, 'queue': 10},
+    }
+    ADMISSION_MAX_WAIT = 2.0
+    ADMISSION_RETRY_AFTER = 2
+    RATE_LIMIT_VOTER = (2.0, 10)
+    RATE_LIMIT_IP = (20.0, 60)
+    RATE_LIMIT_MAX_KEYS = 100000
+    # ASGI mode (asgi.py): aiomysql connections shared by the async voter routes
+    ASYNC_DB_POOL_SIZE = 20
+    # Password hashing (werkzeug method string); changing it upgrades hashes on next login
+    PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+    PASSWORD_SALT_LENGTH = 16
+    KDF_WORKERS = 2
+    KDF_MAX_QUEUE = 32
     UPLOAD_FOLDER = 'static/uploads'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    # Resized variants (longest side in px) built for every upload
+    MEDIA_VARIANTS = {'thumb': 400, 'icon': 96}
+    MEDIA_MAX_AGE = 31536000
+    # Cross-process shared store for the election index, results snapshots
+    # and the results_published flag: a directory on tmpfs that must be
+    # owned by the app's user with mode 0700 (the app refuses to start
+    # otherwise); None picks one under /dev/shm named after the database.
+    # Values are signed with SECRET_KEY, so every worker needs the same one.
+    # Keys hash to SHARED_STORE_SLOTS version counters
+    SHARED_STORE_DIR = None
+    SHARED_STORE_SLOTS = 4096
+    # Results cache (live results entries kept per process; snapshots are shared)
+    RESULTS_CACHE_SIZE = 256
+    # Rendered voter pages shared by every voter (ballots, election lists)
+    PAGE_CACHE_SIZE = 512
+    # Seconds before the active election index reloads even without an admin change
+    ELECTION_INDEX_TTL = 60
+    # Admin dashboard: seconds between counter samples / SSE keepalive comments.
+    # Under WSGI each open dashboard holds a worker thread, so live streams
+    # are capped per process (503 past that); serve them through asgi.py,
+    # where a stream is a coroutine and not a thread
+    TURNOUT_INTERVAL = 2
+    TURNOUT_KEEPALIVE = 15
+    TURNOUT_MAX_STREAMS = 4
+    # Vote ingestion: 'sync' commits each vote in the request; 'journal'
+    # acknowledges once the vote is fsync'd to a local journal and a
+    # background writer inserts batches of up to VOTE_BATCH_SIZE votes at
+    # least every VOTE_FLUSH_INTERVAL seconds. Acknowledged votes the writer
+    # cannot insert (election completed meanwhile, ...) are appended to
+    # VOTE_JOURNAL_DIR/dead-letter.journal for an operator to review.
+    # Completing an election waits up to VOTE_JOURNAL_DRAIN_TIMEOUT seconds
+    # for the journals on the host running the job to be written (keep the
+    # job runners on the hosts that journal votes)
+    VOTE_INGEST_MODE = 'sync'
+    VOTE_JOURNAL_DIR = 'journal'
+    VOTE_BATCH_SIZE = 500
+    VOTE_FLUSH_INTERVAL = 0.2
+    VOTE_JOURNAL_DRAIN_TIMEOUT = 60
+    # Archive completed elections (tallies + compressed vote ledger); moving
+    # the votes to votes_archive keeps the hot votes table small
+    ARCHIVE_ON_COMPLETE = True
+    ARCHIVE_MOVE_VOTES = False
+    ARCHIVE_CHUNK_SIZE = 5000
+    # Auditor exports (flask export, /admin/export/...): rows fetched per
+    # chunk, and how many exports (the voter roster CSV included) may stream
+    # at once per process
+    EXPORT_CHUNK_SIZE = 5000
+    EXPORT_MAX_CONCURRENT = 2
+    # Background jobs (jobs.py): runner threads per app process (0 leaves
+    # the jobs to `flask jobs work`), seconds between polls for jobs queued
+    # by other processes, seconds without a heartbeat before a running job
+    # is taken back, attempts per job with the first retry after
+    # JOBS_RETRY_BACKOFF seconds (doubling), and rows per transaction for
+    # chunked deletes with a short pause between chunks
+    JOBS_WORKERS = 2
+    JOBS_POLL_INTERVAL = 2.0
+    JOBS_LEASE = 600
+    JOBS_MAX_ATTEMPTS = 3
+    JOBS_RETRY_BACKOFF = 10
+    JOBS_CHUNK_SIZE = 500
+    JOBS_CHUNK_PAUSE = 0.05
+    # Admin voter roster
+    VOTERS_PAGE_SIZE = 50
+    VOTERS_EXPORT_BATCH_SIZE = 1000
 
     @staticmethod
     def init_app(app):
@@ -0,0 +1,520 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+try:
+    import MySQLdb
+except ImportError:
+    # mysqlclient needs the MySQL client library to build; PyMySQL (which
+    # aiomysql already depends on) is a pure-Python drop-in for it
+    import pymysql
+    pymysql.install_as_MySQLdb()
+    import MySQLdb
+import MySQLdb.cursors
+from MySQLdb.connections import Connection
+from MySQLdb.constants.ER import DUP_ENTRY as ER_DUP_ENTRY
+from flask import current_app, g, has_request_context, request, session
+
+from metrics import SQL_SECONDS, SQL_ROWS, POOL_CHECKOUT_SECONDS, normalize_statement, statement_label
+
+slow_query_log = logging.getLogger('voting.slow_query')
+# Seconds; None disables the slow query log
+slow_query_threshold = None
+# Open file that receives one sample of each distinct statement, for `flask db explain`
+sql_capture = None
+_captured = set()
+_capture_lock = threading.Lock()
+
+
+# The storage layer: the rest of the app talks to get_db() / get_read_db()
+# connections through these names, never a driver's own, so either backend
+# (DB_BACKEND 'mysql', or 'sqlite' from sqlite_db.py) can sit behind them.
+# Statements are written in MySQL's dialect with %s placeholders.
+Cursor = MySQLdb.cursors.Cursor
+DictCursor = MySQLdb.cursors.DictCursor
+SSCursor = MySQLdb.cursors.SSCursor
+SSDictCursor = MySQLdb.cursors.SSDictCursor
+Error = (MySQLdb.Error, sqlite3.Error)
+IntegrityError = (MySQLdb.IntegrityError, sqlite3.IntegrityError)
+
+
+def is_duplicate(e):
+    """True if an IntegrityError is a UNIQUE / primary key violation."""
+    if isinstance(e, sqlite3.IntegrityError):
+        return str(e).startswith('UNIQUE constraint failed')
+    return e.args[0] == ER_DUP_ENTRY
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def _capture(query, args):
+    # Keyed on the whole statement: labels are truncated, and statements
+    # sharing a prefix must each be captured
+    key = normalize_statement(query)
+    with _capture_lock:
+        if key in _captured:
+            return
+        _captured.add(key)
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        sql_capture.write(json.dumps({'sql': query, 'args': args}, default=str) + '\n')
+        sql_capture.flush()
+
+
+def _record(query, elapsed, rowcount, args=None):
+    label = statement_label(query)
+    if sql_capture is not None:
+        _capture(query, args)
+    SQL_SECONDS.observe(elapsed, label)
+    SQL_ROWS.inc(max(rowcount, 0), label)
+    if slow_query_threshold is not None and elapsed >= slow_query_threshold:
+        endpoint = request.endpoint if has_request_context() else None
+        slow_query_log.warning('%.1f ms, %d rows, endpoint=%s: %s',
+                               elapsed * 1000, max(rowcount, 0), endpoint, label)
+
+
+class TimedCursorMixin:
+    """Times every statement and counts the rows it returned or affected."""
+
+    _in_executemany = False
+
+    def execute(self, query, args=None):
+        if self._in_executemany:
+            return super().execute(query, args)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            _record(query, time.perf_counter() - start, self.rowcount, args)
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        self._in_executemany = True
+        try:
+            return super().executemany(query, args)
+        finally:
+            self._in_executemany = False
+            _record(query, time.perf_counter() - start, self.rowcount,
+                    args[0] if isinstance(args, (list, tuple)) and args else None)
+
+
+class TimedCursor(TimedCursorMixin, MySQLdb.cursors.Cursor):
+    pass
+
+
+class TimedDictCursor(TimedCursorMixin, MySQLdb.cursors.DictCursor):
+    pass
+
+
+class TimedSSCursor(TimedCursorMixin, MySQLdb.cursors.SSCursor):
+    pass
+
+
+class TimedSSDictCursor(TimedCursorMixin, MySQLdb.cursors.SSDictCursor):
+    pass
+
+
+_TIMED_CURSORS = {
+    None: TimedCursor,
+    MySQLdb.cursors.Cursor: TimedCursor,
+    MySQLdb.cursors.DictCursor: TimedDictCursor,
+    MySQLdb.cursors.SSCursor: TimedSSCursor,
+    MySQLdb.cursors.SSDictCursor: TimedSSDictCursor,
+}
+
+
+def note_commit():
+    # Read-your-writes: a request that committed pins its session to the
+    # primary (see pin_to_primary), whatever its method
+    if has_request_context():
+        g.db_committed = True
+
+
+class InstrumentedConnection(Connection):
+    backend = 'mysql'
+
+    def cursor(self, cursorclass=None):
+        return super().cursor(_TIMED_CURSORS.get(cursorclass, cursorclass))
+
+    def commit(self):
+        super().commit()
+        note_commit()
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections.
+
+    Holds up to ``pool_size`` idle connections and opens at most
+    ``max_overflow`` extra ones under load. Callers that find the pool
+    exhausted wait up to ``timeout`` seconds before ``PoolTimeout`` is raised.
+    """
+
+    def __init__(self, connect_args, pool_size=10, max_overflow=5, timeout=30,
+                 recycle=3600, pre_ping=True):
+        self.connect_args = connect_args
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._lock = threading.Condition()
+        self._idle = deque()
+        self._born = {}
+        self._disposed_at = 0.0
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+
+        self._checkouts = 0
+        self._checkout_total = 0.0
+        self._checkout_max = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+    def _connect(self):
+        conn = InstrumentedConnection(**self.connect_args)
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._born.pop(id(conn), None)
+        self._discarded += 1
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def _usable(self, conn):
+        # Recycle old connections before the server's wait_timeout does it for us
+        born = self._born.get(id(conn), 0)
+        if self.recycle and time.monotonic() - born > self.recycle:
+            return False
+        if self.pre_ping:
+            try:
+                conn.ping()
+            except MySQLdb.Error:
+                return False
+        return True
+
+    def checkout(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._lock:
+            while not self._idle and self._open >= self.pool_size + self.max_overflow:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout('No database connection available after %ss' % self.timeout)
+                self._waiting += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._open += 1
+            self._in_use += 1
+
+        # Health check and connect happen outside the lock so other
+        # requests are not serialised behind a slow network round trip.
+        try:
+            if conn is not None and not self._usable(conn):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+        elapsed = time.monotonic() - start
+        POOL_CHECKOUT_SECONDS.observe(elapsed)
+        with self._lock:
+            self._checkouts += 1
+            self._checkout_total += elapsed
+            self._checkout_max = max(self._checkout_max, elapsed)
+        return conn
+
+    def checkin(self, conn):
+        # Never hand an open transaction to the next request
+        try:
+            conn.rollback()
+            healthy = True
+        except Error:
+            healthy = False
+
+        with self._lock:
+            self._in_use -= 1
+            # Opened before dispose(): dropped like the idle ones were
+            stale = self._born.get(id(conn), 0) <= self._disposed_at
+            if healthy and not stale and len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+            else:
+                self._open -= 1
+                self._discard(conn)
+            self._lock.notify()
+
+    def dispose(self, close=True):
+        """Drop the idle connections, e.g. before forking workers.
+
+        Connections checked out at the time are closed when they are
+        checked back in rather than reused. A forked child passes
+        close=False: its inherited connections share sockets with the
+        parent, and closing them would end the parent's sessions.
+        """
+        with self._lock:
+            self._disposed_at = time.monotonic()
+            idle, self._idle = list(self._idle), deque()
+            self._open -= len(idle)
+        for conn in idle:
+            if close:
+                self._discard(conn)
+            else:
+                self._born.pop(id(conn), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'checkout_avg_ms': round(self._checkout_total / self._checkouts * 1000, 3) if self._checkouts else 0,
+                'checkout_max_ms': round(self._checkout_max * 1000, 3),
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+            }
+
+
+class ReplicaSet:
+    """Read replicas of the primary, each with its own ConnectionPool.
+
+    A background thread reads every replica's replication lag once per
+    ``check_interval`` seconds. Replicas lagging more than ``max_lag``
+    seconds, not replicating, or unreachable are left out until they catch
+    up; with none left, reads go to the primary.
+    """
+
+    def __init__(self, app, replicas, max_lag=5, check_interval=5):
+        self.app = app
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._replicas = replicas
+        self._lag = {name: None for name in replicas}
+        self._healthy = []
+        self._next = 0
+        self._thread = None
+        self.reads = {name: 0 for name in replicas}
+        self.primary_reads = 0
+
+    def _lag_of(self, pool):
+        conn = pool.checkout()
+        try:
+            cursor = conn.cursor(MySQLdb.cursors.DictCursor)
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except MySQLdb.ProgrammingError:
+                # MySQL before 8.0.22
+                cursor.execute("SHOW SLAVE STATUS")
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            pool.checkin(conn)
+        if row is None:
+            return None
+        return row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+
+    def _refresh(self):
+        lags = {}
+        for name, (pool, check_lag) in self._replicas.items():
+            try:
+                lags[name] = self._lag_of(pool) if check_lag else 0
+            except (MySQLdb.Error, PoolTimeout):
+                lags[name] = None
+        with self._lock:
+            self._lag = lags
+            self._healthy = [name for name, lag in lags.items() if lag is not None and lag <= self.max_lag]
+
+    def _run(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self._refresh()
+            except Exception:
+                self.app.logger.exception('Replica lag check failed')
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='replica-lag', daemon=True)
+        self._refresh()
+        self._thread.start()
+
+    def choose(self):
+        """Round-robin over healthy replicas; None means read from the primary."""
+        self._ensure_started()
+        with self._lock:
+            if not self._healthy:
+                self.primary_reads += 1
+                return None
+            name = self._healthy[self._next % len(self._healthy)]
+            self._next += 1
+            self.reads[name] += 1
+        return self._replicas[name][0]
+
+    def pools(self):
+        return [pool for pool, _ in self._replicas.values()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_lag': self.max_lag,
+                'healthy': len(self._healthy),
+                'primary_reads': self.primary_reads,
+                'replicas': {
+                    name: {
+                        'lag_seconds': self._lag[name],
+                        'healthy': name in self._healthy,
+                        'reads': self.reads[name],
+                        'pool': pool.stats(),
+                    }
+                    for name, (pool, _) in self._replicas.items()
+                },
+            }
+
+
+def _pool_options(app):
+    return {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_POOL_MAX_OVERFLOW'],
+        'timeout': app.config['DB_POOL_TIMEOUT'],
+        'recycle': app.config['DB_POOL_RECYCLE'],
+        'pre_ping': app.config['DB_POOL_PRE_PING'],
+    }
+
+
+def init_pool(app):
+    global slow_query_threshold, sql_capture
+    threshold_ms = app.config['SLOW_QUERY_THRESHOLD_MS']
+    slow_query_threshold = threshold_ms / 1000.0 if threshold_ms is not None else None
+    if app.config['SLOW_QUERY_LOG_FILE']:
+        handler = logging.FileHandler(app.config['SLOW_QUERY_LOG_FILE'])
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_query_log.addHandler(handler)
+        slow_query_log.setLevel(logging.WARNING)
+    if app.config['SQL_CAPTURE_FILE']:
+        sql_capture = open(app.config['SQL_CAPTURE_FILE'], 'a', encoding='utf-8')
+
+    @app.after_request
+    def _pin_after_write(response):
+        # Some GET routes write too (delete_candidate enqueues a job), so
+        # what counts is whether the request committed, not its method
+        if g.get('db_committed'):
+            pin_to_primary()
+        return response
+
+    app.teardown_appcontext(release_db)
+
+    if app.config['DB_BACKEND'] == 'sqlite':
+        from sqlite_db import SQLitePool, sqlite_connect_args
+        if app.config['MYSQL_REPLICAS']:
+            raise ValueError("MYSQL_REPLICAS needs DB_BACKEND = 'mysql'")
+        app.extensions['db_pool'] = SQLitePool(sqlite_connect_args(app.config), **_pool_options(app))
+        return
+
+    primary = {
+        'host': app.config['MYSQL_HOST'],
+        'user': app.config['MYSQL_USER'],
+        'password': app.config['MYSQL_PASSWORD'],
+        'db': app.config['MYSQL_DB'],
+    }
+    app.extensions['db_pool'] = ConnectionPool(primary, **_pool_options(app))
+
+    # Each replica entry overrides the primary's settings, e.g. {'host': 'replica-1'}
+    replicas = {}
+    for entry in app.config['MYSQL_REPLICAS']:
+        entry = dict(entry)
+        check_lag = entry.pop('check_lag', True)
+        args = dict(primary, **entry)
+        name = f"{args['host']}:{args['port']}" if 'port' in args else args['host']
+        replicas[name] = (ConnectionPool(args, **_pool_options(app)), check_lag)
+    if replicas:
+        app.extensions['db_replicas'] = ReplicaSet(
+            app, replicas,
+            max_lag=app.config['REPLICA_MAX_LAG'],
+            check_interval=app.config['REPLICA_CHECK_INTERVAL'],
+        )
+
+
+def get_pool():
+    return current_app.extensions['db_pool']
+
+
+# One connection per request, checked out on first use
+def get_db():
+    if 'db' not in g:
+        g.db = get_pool().checkout()
+    return g.db
+
+
+def get_replicas():
+    return current_app.extensions.get('db_replicas')
+
+
+def dispose_pools(close=True):
+    """ConnectionPool.dispose() the primary's pool and every replica's."""
+    replicas = get_replicas()
+    for pool in [get_pool()] + (replicas.pools() if replicas is not None else []):
+        pool.dispose(close)
+
+
+def pin_to_primary():
+    """This session just wrote: read from the primary for READ_YOUR_WRITES_SECONDS.
+
+    So it sees its own changes, whatever the replicas' lag. A no-op
+    without replicas.
+    """
+    if get_replicas() is not None:
+        session['_primary_until'] = time.time() + current_app.config['READ_YOUR_WRITES_SECONDS']
+
+
+def _pinned():
+    return has_request_context() and session.get('_primary_until', 0) > time.time()
+
+
+# Reads that can tolerate replica lag; the primary when there are no
+# healthy replicas or the session wrote recently
+def get_read_db():
+    if 'read_db' not in g:
+        replicas = get_replicas()
+        pool = replicas.choose() if replicas is not None and not _pinned() else None
+        g.read_db = (pool.checkout(), pool) if pool is not None else (get_db(), None)
+    return g.read_db[0]
+
+
+def read_from_replica():
+    """True if this request's get_read_db() connection is a replica."""
+    return 'read_db' in g and g.read_db[1] is not None
+
+
+def release_db(exc=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        get_pool().checkin(conn)
+    conn, pool = g.pop('read_db', (None, None))
+    if pool is not None:
+        pool.checkin(conn)
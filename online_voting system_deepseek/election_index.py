@@ -0,0 +1,144 @@
+import bisect
+import hashlib
+import threading
+import time
+
+from flask import current_app
+
+from db import get_db, DictCursor
+
+SHARED_KEY = 'election_index'
+
+
+class ElectionIndex:
+    """Index of active elections and their candidates.
+
+    Elections are kept sorted by start_time, so the set that is open at a
+    given moment is found with a bisect and an end_time check instead of a
+    database query. The loaded rows live in the shared store, so one
+    worker's load serves every worker on the host; admin changes call
+    invalidate(), which makes every worker reload, and the first one to do
+    so reloads everything in two queries. ``ttl`` bounds how stale the
+    index can get when the database is changed outside the app.
+    """
+
+    def __init__(self, store, ttl=60):
+        self.store = store
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._loaded_at = 0.0
+        self._starts = []
+        self._by_start = []
+        self._elections = {}
+        self._candidates = {}
+        self._fingerprints = {}
+        self.reloads = 0
+        self.db_loads = 0
+
+    def invalidate(self):
+        self.store.bump(SHARED_KEY)
+
+    def _stale(self):
+        return (self._loaded_version != self.store.version(SHARED_KEY)
+                or time.time() - self._loaded_at > self.ttl)
+
+    def _load(self):
+        # Always the primary: the reload after an admin change must see it
+        cursor = get_db().cursor(DictCursor)
+        cursor.execute(
+            "SELECT * FROM elections WHERE is_active = TRUE "
+            "AND start_time IS NOT NULL AND end_time IS NOT NULL ORDER BY start_time"
+        )
+        elections = cursor.fetchall()
+        cursor.execute(
+            "SELECT c.* FROM candidates c JOIN elections e ON e.id = c.election_id "
+            "WHERE e.is_active = TRUE ORDER BY c.id"
+        )
+        candidates = {}
+        for candidate in cursor.fetchall():
+            candidates.setdefault(candidate['election_id'], []).append(candidate)
+        cursor.close()
+        with self._lock:
+            self.db_loads += 1
+        return {
+            'elections': list(elections),
+            'candidates': candidates,
+            'fingerprints': {
+                election['id']: hashlib.sha1(repr((
+                    sorted(election.items()), [sorted(c.items()) for c in candidates.get(election['id'], [])]
+                )).encode('utf-8')).hexdigest()
+                for election in elections
+            },
+            'loaded_at': time.time(),
+        }
+
+    def _reload(self):
+        version = self.store.version(SHARED_KEY)
+        state = self.store.get(SHARED_KEY)
+        if state is None or time.time() - state['loaded_at'] > self.ttl:
+            state = self._load()
+            # Dropped if an invalidate() raced this load, which leaves the index stale
+            self.store.set(SHARED_KEY, version, state)
+
+        elections = state['elections']
+        with self._lock:
+            self._by_start = elections
+            self._starts = [election['start_time'] for election in elections]
+            self._elections = {election['id']: election for election in elections}
+            self._candidates = state['candidates']
+            self._fingerprints = state['fingerprints']
+            self._loaded_at = state['loaded_at']
+            self._loaded_version = version
+            self.reloads += 1
+
+    def _ensure_loaded(self):
+        if self._stale():
+            self._reload()
+
+    def open_elections(self, now):
+        self._ensure_loaded()
+        with self._lock:
+            started = self._by_start[:bisect.bisect_right(self._starts, now)]
+        return [election for election in started if election['end_time'] >= now]
+
+    def ballot(self, election_id, now):
+        """Return (election, candidates) if the election is open at ``now``, else (None, [])."""
+        self._ensure_loaded()
+        with self._lock:
+            election = self._elections.get(election_id)
+            candidates = self._candidates.get(election_id, [])
+        if election is None or not (election['start_time'] <= now <= election['end_time']):
+            return None, []
+        return election, candidates
+
+    def fingerprint(self, election_id):
+        """Digest of an election's row and candidates; changes whenever either does."""
+        self._ensure_loaded()
+        with self._lock:
+            return self._fingerprints.get(election_id)
+
+    def generation(self):
+        # Bumped by every reload, so anything derived from elections can key on it
+        self._ensure_loaded()
+        with self._lock:
+            return self.reloads
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active_elections': len(self._elections),
+                'candidates': sum(len(c) for c in self._candidates.values()),
+                'reloads': self.reloads,
+                'db_loads': self.db_loads,
+                'age_seconds': round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+            }
+
+
+def init_election_index(app):
+    app.extensions['election_index'] = ElectionIndex(app.extensions['shared_store'],
+                                                     app.config['ELECTION_INDEX_TTL'])
+
+
+def get_election_index():
+    return current_app.extensions['election_index']
@@ -0,0 +1,312 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import zlib
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from db import get_read_db, DictCursor, SSCursor
+import archive
+import tallies
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # without pyarrow only CSV and JSONL exports are available
+    pa = pq = None
+
+# Auditor exports: an election's results and its vote ledger as CSV, JSONL
+# or Parquet, optionally gzipped. Rows come from an unbuffered cursor in
+# chunks of EXPORT_CHUNK_SIZE and are encoded (and compressed) one chunk at
+# a time, so memory stays flat however many votes an election has. Output
+# is deterministic (rows in id order, gzip without a timestamp), so the
+# sha256 in a manifest identifies the exact bytes of a download made from
+# the same data: the CLI writes the files and their manifest in one pass,
+# and the web manifest is only served for archived elections; the vote
+# ledger's ledger_sha256 is computed as the archive computes it, whatever
+# the format, and can be compared with election_archives.ledger_sha256.
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+COLUMNS = {
+    'results': ('candidate_id', 'candidate_name', 'party_name', 'vote_count', 'percentage'),
+    'votes': ('vote_id', 'voter_id', 'candidate_id', 'voted_at'),
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def _results_chunks(conn, election_id, chunk_size):
+    cursor = conn.cursor(DictCursor)
+    try:
+        # Archived elections read the archive, like the results pages
+        results, _ = archive.load_results(cursor, election_id) or tallies.fetch_results(cursor, election_id)
+    finally:
+        cursor.close()
+    rows = [(c['id'], c['candidate_name'], c['party_name'], c['vote_count'], c['percentage'])
+            for c in sorted(results, key=lambda c: c['id'])]
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+def _vote_chunks(conn, election_id, chunk_size):
+    cursor = conn.cursor()
+    table = archive.votes_table(cursor, election_id)
+    cursor.close()
+    # Unbuffered: only one chunk of the ledger is in memory at a time
+    cursor = conn.cursor(SSCursor)
+    try:
+        cursor.execute(
+            f"SELECT id, voter_id, candidate_id, voted_at FROM {table} WHERE election_id = %s ORDER BY id",
+            (election_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+_CHUNKS = {'results': _results_chunks, 'votes': _vote_chunks}
+
+
+def _text(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return '' if value is None else value
+
+
+def _encode_csv(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows([_text(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _encode_jsonl(columns, chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, row)), default=_text) + '\n' for row in rows).encode('utf-8')
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back whatever ParquetWriter has written so far."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _parquet_schema(dataset):
+    if dataset == 'results':
+        return pa.schema([('candidate_id', pa.int64()), ('candidate_name', pa.string()),
+                          ('party_name', pa.string()), ('vote_count', pa.int64()),
+                          ('percentage', pa.float64())])
+    return pa.schema([('vote_id', pa.int64()), ('voter_id', pa.int64()),
+                      ('candidate_id', pa.int64()), ('voted_at', pa.timestamp('s'))])
+
+
+def _encode_parquet(schema, chunks):
+    # One row group per chunk
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in chunks:
+        columns = list(zip(*rows))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _gzip(stream):
+    # wbits=31: gzip framing with a zero timestamp, so equal input gives equal bytes
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for data in stream:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class Export:
+    """One dataset of an election as a byte stream; counts and hashes what it yields.
+
+    Iterate it once; manifest() describes the output after that.
+    """
+
+    def __init__(self, conn, election_id, dataset, fmt='csv', gzip=False, chunk_size=5000):
+        if dataset not in COLUMNS:
+            raise ExportError(f'Unknown dataset {dataset!r}; expected one of {", ".join(COLUMNS)}.')
+        if fmt not in FORMATS:
+            raise ExportError(f'Unknown format {fmt!r}; expected one of {", ".join(FORMATS)}.')
+        if fmt == 'parquet' and pa is None:
+            raise ExportError('Parquet exports need pyarrow installed.')
+        if fmt == 'parquet' and gzip:
+            raise ExportError('Parquet files are compressed internally; export them without gzip.')
+        self.conn = conn
+        self.election_id = election_id
+        self.dataset = dataset
+        self.fmt = fmt
+        self.gzip = gzip
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._ledger_digest = hashlib.sha256(archive.LEDGER_HEADER) if dataset == 'votes' else None
+
+    @property
+    def filename(self):
+        return f'election-{self.election_id}-{self.dataset}.{self.fmt}' + ('.gz' if self.gzip else '')
+
+    @property
+    def mimetype(self):
+        return 'application/gzip' if self.gzip else FORMATS[self.fmt]
+
+    def _counted(self):
+        for rows in _CHUNKS[self.dataset](self.conn, self.election_id, self.chunk_size):
+            self.rows += len(rows)
+            if self._ledger_digest is not None:
+                for row in rows:
+                    self._ledger_digest.update(archive.ledger_line(row))
+            yield rows
+
+    def __iter__(self):
+        if self.fmt == 'parquet':
+            stream = _encode_parquet(_parquet_schema(self.dataset), self._counted())
+        elif self.fmt == 'jsonl':
+            stream = _encode_jsonl(COLUMNS[self.dataset], self._counted())
+        else:
+            stream = _encode_csv(COLUMNS[self.dataset], self._counted())
+        if self.gzip:
+            stream = _gzip(stream)
+        for data in stream:
+            self._digest.update(data)
+            self.size += len(data)
+            yield data
+
+    def manifest(self):
+        entry = {
+            'dataset': self.dataset,
+            'file': self.filename,
+            'format': self.fmt,
+            'gzip': self.gzip,
+            'rows': self.rows,
+            'bytes': self.size,
+            'sha256': self._digest.hexdigest(),
+        }
+        if self._ledger_digest is not None:
+            entry['ledger_sha256'] = self._ledger_digest.hexdigest()
+        return entry
+
+
+def find_election(conn, election_id):
+    cursor = conn.cursor(DictCursor)
+    cursor.execute("SELECT id, name, is_active FROM elections WHERE id = %s", (election_id,))
+    election = cursor.fetchone()
+    cursor.close()
+    if election is None:
+        raise ExportError(f'Election {election_id} does not exist.')
+    return election
+
+
+def election_exports(conn, election_id, fmt='csv', gzip=False, chunk_size=5000):
+    """An Export of each dataset of an election."""
+    return [Export(conn, election_id, dataset, fmt, gzip, chunk_size) for dataset in COLUMNS]
+
+
+def build_manifest(conn, election_id, exports):
+    """Manifest of exports that have been iterated to the end."""
+    election = find_election(conn, election_id)
+    cursor = conn.cursor()
+    info = archive.archive_info(cursor, election_id)
+    cursor.close()
+    return {
+        'election_id': election_id,
+        'election_name': election['name'],
+        # The ledger of an election still open can grow between exports
+        'completed': not election['is_active'],
+        'archive_ledger_sha256': info['ledger_sha256'] if info else None,
+        'generated_at': datetime.now().isoformat(sep=' ', timespec='seconds'),
+        'files': [export.manifest() for export in exports],
+    }
+
+
+def init_exports(app):
+    # Each export holds a database connection for as long as it streams
+    app.extensions['export_slots'] = threading.BoundedSemaphore(app.config['EXPORT_MAX_CONCURRENT'])
+
+
+def export_slots():
+    return current_app.extensions['export_slots']
+
+
+# --------------------- CLI: flask export ... ---------------------
+
+export_cli = AppGroup('export', help='Export election results and vote ledgers for auditors.')
+
+
+def _write_export(export, directory):
+    path = os.path.join(directory, export.filename)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        for data in export:
+            f.write(data)
+    os.replace(tmp, path)
+
+
+@export_cli.command('election')
+@click.argument('election_id', type=int)
+@click.argument('directory', type=click.Path(file_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv', show_default=True)
+@click.option('--gzip/--no-gzip', default=False, help='Gzip the CSV or JSONL files.')
+def export_command(election_id, directory, fmt, gzip):
+    """Write an election's results, vote ledger and manifest.json to DIRECTORY."""
+    conn = get_read_db()
+    try:
+        find_election(conn, election_id)
+        exports = election_exports(conn, election_id, fmt, gzip, current_app.config['EXPORT_CHUNK_SIZE'])
+    except ExportError as e:
+        raise click.ClickException(str(e))
+    os.makedirs(directory, exist_ok=True)
+    for export in exports:
+        _write_export(export, directory)
+        click.echo(f'{export.filename}: {export.rows} rows, {export.size} bytes')
+    manifest = build_manifest(conn, election_id, exports)
+    with open(os.path.join(directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    click.echo(f'Wrote manifest.json for election {election_id}.')
@@ -0,0 +1,53 @@
+# Production server settings:
+#
+#     gunicorn -c gunicorn.conf.py 'wsgi:load_app()'
+#
+# VOTING_BIND, VOTING_WORKERS, VOTING_THREADS and VOTING_PRELOAD override
+# the defaults below; VOTING_SETTINGS names a file of app settings.
+import gc
+import os
+import time
+
+bind = os.environ.get('VOTING_BIND', '0.0.0.0:8000')
+# Each worker has its own DB pool (DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW),
+# so workers x that must stay under MySQL's max_connections
+workers = int(os.environ.get('VOTING_WORKERS', (os.cpu_count() or 1) * 2 + 1))
+# Threads, not greenlets: the pool, admission control and the KDF
+# executor all block threads. An open admin dashboard's turnout stream holds
+# one of these threads (at most TURNOUT_MAX_STREAMS per worker); route
+# /admin/turnout/stream to the ASGI server (asgi.py) instead
+worker_class = 'gthread'
+threads = int(os.environ.get('VOTING_THREADS', 8))
+# Build the app and warm the hot state once in the master, then fork
+preload_app = os.environ.get('VOTING_PRELOAD', '1') == '1'
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound memory growth; with a preloaded app
+# a replacement is a fork, and the shared store stays warm
+max_requests = 20000
+max_requests_jitter = 2000
+# Worker heartbeat files on tmpfs, so a slow disk cannot stall workers
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def when_ready(server):
+    # Everything loaded so far goes to a generation the collector never
+    # touches, so collections in the workers do not dirty shared pages
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    worker.forked_at = time.time()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app import app
+        from wsgi import after_fork
+        after_fork(app)
+
+
+def post_worker_init(worker):
+    # Worker cold start: from fork until it can serve (benchmarks/worker_startup.py reads this)
+    worker.log.info('Worker %s ready in %.1f ms', worker.pid, (time.time() - worker.forked_at) * 1000)
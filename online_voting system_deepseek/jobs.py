@@ -0,0 +1,348 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from db import get_db, get_pool, DictCursor
+
+# Background jobs for admin operations too heavy for a request (deleting a
+# candidate's votes, archiving a completed election, publishing results).
+# Jobs are rows in the jobs table, so they survive restarts and any process
+# can run them: every app process runs a few runner threads (JOBS_WORKERS),
+# and `flask jobs work` runs a dedicated one. A runner claims a queued job
+# with a conditional UPDATE, so two runners never take the same job. A
+# failed job is retried with exponential backoff up to max_attempts times;
+# handlers must therefore be safe to run again after a partial run, which
+# chunked work that commits as it goes naturally is.
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+
+_handlers = {}
+
+
+def job(kind):
+    """Register ``handler(ctx, **args)`` as the handler for jobs of ``kind``."""
+    def register(handler):
+        _handlers[kind] = handler
+        return handler
+    return register
+
+
+def enqueue(kind, max_attempts=None, **args):
+    """Queue a job and return its id; an identical job not yet finished is reused."""
+    if kind not in _handlers:
+        raise ValueError(f'No handler for job kind {kind!r}')
+    if max_attempts is None:
+        max_attempts = current_app.config['JOBS_MAX_ATTEMPTS']
+    payload = json.dumps(args, sort_keys=True)
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM jobs WHERE kind = %s AND args = %s AND status IN ('queued', 'running')",
+                   (kind, payload))
+    row = cursor.fetchone()
+    if row is not None:
+        conn.commit()
+        cursor.close()
+        return row[0]
+    cursor.execute("INSERT INTO jobs (kind, args, max_attempts) VALUES (%s, %s, %s)",
+                   (kind, payload, max_attempts))
+    job_id = cursor.lastrowid
+    conn.commit()
+    cursor.close()
+    runner = get_job_runner()
+    if runner is not None:
+        runner.wake()
+    return job_id
+
+
+def fetch_job(cursor, job_id):
+    cursor.execute("SELECT * FROM jobs WHERE id = %s", (job_id,))
+    return cursor.fetchone()
+
+
+def recent_jobs(cursor, limit=50):
+    cursor.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT %s", (limit,))
+    return cursor.fetchall()
+
+
+class JobContext:
+    """What a handler gets besides its arguments: progress reporting."""
+
+    def __init__(self, runner, job_id):
+        self.runner = runner
+        self.job_id = job_id
+        self.chunk_size = runner.chunk_size
+        self.pause = runner.pause
+
+    def progress(self, done, total=None, message=None):
+        """Record progress; also the job's heartbeat.
+
+        Uses a connection of its own, so it never commits the handler's work
+        and can be called while the handler streams a read (with SQLite, not
+        while the handler's connection holds the write lock).
+        """
+        pool = get_pool()
+        conn = pool.checkout()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE jobs SET progress = %s, total = COALESCE(%s, total), message = COALESCE(%s, message), "
+                "locked_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (done, total, message, self.job_id)
+            )
+            conn.commit()
+            cursor.close()
+        finally:
+            pool.checkin(conn)
+
+    def breathe(self):
+        # Between chunks: lets the votes queued behind a chunk's locks through
+        if self.pause:
+            time.sleep(self.pause)
+
+
+class JobRunner:
+    """A pool of threads running queued jobs, started on first use in each process."""
+
+    def __init__(self, app, workers=2, poll_interval=2.0, lease=600, retry_backoff=10,
+                 chunk_size=1000, pause=0.05):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.retry_backoff = retry_backoff
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self._cond = threading.Condition()
+        self._pid = None
+        self._stopping = False
+        self._last_reap = 0.0
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.running = 0
+
+    def ensure_started(self):
+        # Per process: threads started before a fork do not exist in the child
+        if self._pid == os.getpid() or not self.workers:
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.name = f'{socket.gethostname()}:{self._pid}'
+            for n in range(self.workers):
+                threading.Thread(target=self._run, name=f'job-runner-{n}', daemon=True).start()
+
+    def wake(self):
+        self.ensure_started()
+        with self._cond:
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                with self.app.app_context():
+                    ran = self.run_one()
+            except Exception:
+                self.app.logger.exception('Job runner failed')
+                ran = False
+            if not ran:
+                with self._cond:
+                    self._cond.wait(self.poll_interval)
+
+    # --------------------- Claiming and running ---------------------
+
+    def _reap(self, cursor):
+        # Jobs whose runner stopped sending heartbeats (it died, or the
+        # process was restarted) go back to the queue, or fail for good.
+        # Job times are all the database's clock, never this process's
+        cursor.execute(
+            "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding', locked_by = NULL, "
+            "finished_at = CURRENT_TIMESTAMP WHERE status = 'running' "
+            "AND locked_at < CURRENT_TIMESTAMP - INTERVAL %s SECOND AND attempts >= max_attempts",
+            (self.lease,)
+        )
+        cursor.execute(
+            "UPDATE jobs SET status = 'queued', locked_by = NULL WHERE status = 'running' "
+            "AND locked_at < CURRENT_TIMESTAMP - INTERVAL %s SECOND",
+            (self.lease,)
+        )
+
+    def _claim(self):
+        conn = get_db()
+        cursor = conn.cursor(DictCursor)
+        try:
+            if time.monotonic() - self._last_reap > self.lease / 4:
+                self._last_reap = time.monotonic()
+                self._reap(cursor)
+                conn.commit()
+            cursor.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP "
+                "ORDER BY id LIMIT 1"
+            )
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            cursor.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = %s, "
+                "locked_at = CURRENT_TIMESTAMP, started_at = COALESCE(started_at, CURRENT_TIMESTAMP) "
+                "WHERE id = %s AND status = 'queued'",
+                (self.name, row['id'])
+            )
+            claimed = cursor.rowcount == 1
+            conn.commit()
+            # Another runner got there first
+            return fetch_job(cursor, row['id']) if claimed else None
+        finally:
+            conn.rollback()
+            cursor.close()
+
+    def run_one(self):
+        """Claim and run one job; False when there was none to run."""
+        claimed = self._claim()
+        if claimed is None:
+            return False
+        with self._cond:
+            self.running += 1
+        try:
+            self._execute(claimed)
+        finally:
+            with self._cond:
+                self.running -= 1
+        return True
+
+    def _finish(self, job_id, sql, args):
+        conn = get_db()
+        conn.rollback()
+        cursor = conn.cursor()
+        cursor.execute(sql, args + (job_id,))
+        conn.commit()
+        cursor.close()
+
+    def _execute(self, claimed):
+        handler = _handlers.get(claimed['kind'])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler for job kind {claimed['kind']!r}")
+            handler(JobContext(self, claimed['id']), **json.loads(claimed['args']))
+        except Exception:
+            error = traceback.format_exc()
+            self.app.logger.warning('Job %s (%s) failed, attempt %d of %d:\n%s', claimed['id'],
+                                    claimed['kind'], claimed['attempts'], claimed['max_attempts'], error)
+            if handler is not None and claimed['attempts'] < claimed['max_attempts']:
+                backoff = self.retry_backoff * 2 ** (claimed['attempts'] - 1)
+                self._finish(claimed['id'], "UPDATE jobs SET status = 'queued', error = %s, "
+                             "run_after = CURRENT_TIMESTAMP + INTERVAL %s SECOND, locked_by = NULL "
+                             "WHERE id = %s", (error, backoff))
+                with self._cond:
+                    self.retried += 1
+            else:
+                self._finish(claimed['id'], "UPDATE jobs SET status = 'failed', error = %s, locked_by = NULL, "
+                             "finished_at = CURRENT_TIMESTAMP WHERE id = %s", (error,))
+                with self._cond:
+                    self.failed += 1
+            return
+        self._finish(claimed['id'], "UPDATE jobs SET status = 'done', error = NULL, locked_by = NULL, "
+                     "finished_at = CURRENT_TIMESTAMP WHERE id = %s", ())
+        with self._cond:
+            self.completed += 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.workers if self._pid == os.getpid() else 0,
+                'running': self.running,
+                'completed': self.completed,
+                'retried': self.retried,
+                'failed': self.failed,
+            }
+
+
+def init_jobs(app):
+    runner = JobRunner(
+        app,
+        workers=app.config['JOBS_WORKERS'],
+        poll_interval=app.config['JOBS_POLL_INTERVAL'],
+        lease=app.config['JOBS_LEASE'],
+        retry_backoff=app.config['JOBS_RETRY_BACKOFF'],
+        chunk_size=app.config['JOBS_CHUNK_SIZE'],
+        pause=app.config['JOBS_CHUNK_PAUSE'],
+    )
+    app.extensions['job_runner'] = runner
+
+    @app.before_request
+    def _start_job_runner():
+        runner.ensure_started()
+
+
+def get_job_runner():
+    return current_app.extensions.get('job_runner')
+
+
+def job_counts(cursor):
+    cursor.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update({row[0]: row[1] for row in cursor.fetchall()})
+    return counts
+
+
+# --------------------- CLI: flask jobs ... ---------------------
+
+jobs_cli = AppGroup('jobs', help='Background jobs.')
+
+
+@jobs_cli.command('work')
+@click.option('--workers', type=int, default=None, help='Runner threads (default: JOBS_WORKERS, at least 1).')
+def work_command(workers):
+    """Run queued jobs in the foreground until interrupted."""
+    runner = get_job_runner()
+    runner.workers = workers or max(runner.workers, 1)
+    runner.ensure_started()
+    click.echo(f'Running jobs with {runner.workers} thread(s); Ctrl+C to stop.')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+@jobs_cli.command('list')
+@click.option('--limit', type=int, default=20, show_default=True)
+def list_command(limit):
+    """Show the most recent jobs."""
+    cursor = get_db().cursor(DictCursor)
+    for entry in recent_jobs(cursor, limit):
+        total = f"/{entry['total']}" if entry['total'] is not None else ''
+        click.echo(f"{entry['id']:>6} {entry['kind']:<20} {entry['status']:<8} "
+                   f"{entry['progress']}{total} {entry['message'] or ''}")
+    cursor.close()
+
+
+@jobs_cli.command('retry')
+@click.argument('job_id', type=int)
+def retry_command(job_id):
+    """Queue a failed job again with a fresh set of attempts."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE jobs SET status = 'queued', attempts = 0, run_after = CURRENT_TIMESTAMP "
+                   "WHERE id = %s AND status = 'failed'", (job_id,))
+    conn.commit()
+    retried = cursor.rowcount
+    cursor.close()
+    if not retried:
+        raise click.ClickException(f'Job {job_id} has not failed.')
+    click.echo(f'Job {job_id} queued again.')
@@ -0,0 +1,206 @@
+import hashlib
+import io
+import os
+import re
+import threading
+
+import click
+from flask import current_app, send_from_directory, url_for
+from flask.cli import AppGroup
+
+from db import get_db, DictCursor
+
+try:
+    from PIL import Image
+except ImportError:  # without Pillow only the original upload is stored
+    Image = None
+
+# What Pillow raises for data it cannot decode
+_IMAGE_ERRORS = (OSError, SyntaxError, ValueError) + ((Image.DecompressionBombError,) if Image else ())
+
+# Uploads are stored as <sha256>.<ext>; resized variants as
+# <sha256>.<variant>.<ext> and <sha256>.<variant>.webp
+HASHED_NAME = re.compile(r'^([0-9a-f]{64})(\.[a-z]+)?\.(jpg|png|webp)$')
+# What each stored extension's files start with
+SIGNATURES = {'png': b'\x89PNG\r\n\x1a\n', 'jpg': b'\xff\xd8\xff'}
+PIL_FORMATS = {'png': 'PNG', 'jpg': 'JPEG'}
+
+
+class MediaError(Exception):
+    pass
+
+
+def _folder():
+    return os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+
+
+def _extension(filename):
+    ext = filename.rsplit('.', 1)[1].lower()
+    return 'jpg' if ext == 'jpeg' else ext
+
+
+def _tmp(path):
+    # One per writer: two workers storing the same upload must not share it
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+def _write(path, data):
+    tmp = _tmp(path)
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _check_image(data, ext):
+    """Refuse anything that is not an image of the type its extension says."""
+    if not data.startswith(SIGNATURES[ext]):
+        raise MediaError(f'The file is not a {ext.upper()} image.')
+    if Image is None:
+        return
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+            if image.format != PIL_FORMATS[ext]:
+                raise MediaError(f'The file is not a {ext.upper()} image.')
+    except _IMAGE_ERRORS:
+        raise MediaError(f'The file is not a valid {ext.upper()} image.')
+
+
+def _save_variants(folder, digest, ext, variants, created):
+    """Write the resized variants, adding the names of new files to ``created``."""
+    if Image is None:
+        return
+    with Image.open(os.path.join(folder, f'{digest}.{ext}')) as image:
+        image.load()
+        for variant, size in variants.items():
+            small = image.copy()
+            small.thumbnail((size, size))
+            if ext == 'jpg' and small.mode != 'RGB':
+                small = small.convert('RGB')
+            if ext == 'jpg':
+                original = ('JPEG', 'jpg', {'optimize': True, 'quality': 82, 'progressive': True})
+            else:
+                original = ('PNG', 'png', {'optimize': True})
+            for fmt, suffix, options in (original, ('WEBP', 'webp', {'quality': 80, 'method': 4})):
+                name = f'{digest}.{variant}.{suffix}'
+                path = os.path.join(folder, name)
+                if not os.path.exists(path):
+                    tmp = _tmp(path)
+                    small.save(tmp, fmt, **options)
+                    os.replace(tmp, path)
+                    created.append(name)
+
+
+def store_bytes(data, ext):
+    """Store image bytes under their content hash and build the resized variants.
+
+    Identical uploads map to the same file, so re-uploading a photo under a
+    different name costs no extra space. Returns the stored file name;
+    raises MediaError, leaving nothing behind, if the data is not an image.
+    """
+    _check_image(data, ext)
+    folder = _folder()
+    digest = hashlib.sha256(data).hexdigest()
+    name = f'{digest}.{ext}'
+    path = os.path.join(folder, name)
+    created = []
+    if not os.path.exists(path):
+        _write(path, data)
+        created.append(name)
+    try:
+        _save_variants(folder, digest, ext, current_app.config['MEDIA_VARIANTS'], created)
+    except _IMAGE_ERRORS as e:
+        # verify() does not decode the pixels, so a damaged image fails here
+        for stale in created:
+            os.remove(os.path.join(folder, stale))
+        raise MediaError(f'The image could not be read: {e}')
+    return name
+
+
+def store_upload(file_storage):
+    return store_bytes(file_storage.read(), _extension(file_storage.filename))
+
+
+def media_url(filename, variant=None, fmt=None):
+    """URL for an upload, preferring a resized variant when one exists.
+
+    With ``fmt='webp'`` returns None if no WebP variant is available, so
+    templates can skip the <source> element.
+    """
+    if not filename:
+        return None
+    match = HASHED_NAME.match(filename)
+    if variant and match:
+        name = f'{match.group(1)}.{variant}.{fmt or match.group(3)}'
+        if os.path.exists(os.path.join(_folder(), name)):
+            return url_for('media_file', filename=name)
+    if fmt == 'webp':
+        return None
+    return url_for('media_file', filename=filename)
+
+
+def serve_media(filename):
+    if not HASHED_NAME.match(filename):
+        return send_from_directory(_folder(), filename)
+    # Content-addressed files never change, so the name is the ETag
+    response = send_from_directory(_folder(), filename, etag=filename,
+                                   max_age=current_app.config['MEDIA_MAX_AGE'])
+    response.cache_control.immutable = True
+    return response
+
+
+# --------------------- CLI: flask media ... ---------------------
+
+media_cli = AppGroup('media', help='Maintain candidate media uploads.')
+
+
+@media_cli.command('rehash')
+def rehash_command():
+    """Move legacy uploads to content-addressed names and build variants.
+
+    Each original is deleted once no candidate refers to it any more.
+    """
+    conn = get_db()
+    cursor = conn.cursor(DictCursor)
+    cursor.execute("SELECT id, photo_path, symbol_path FROM candidates")
+    candidates = cursor.fetchall()
+    folder = _folder()
+    renamed = 0
+    moved = set()
+    for candidate in candidates:
+        paths = {}
+        for column in ('photo_path', 'symbol_path'):
+            filename = candidate[column]
+            if not filename or HASHED_NAME.match(filename):
+                continue
+            path = os.path.join(folder, filename)
+            if not os.path.exists(path):
+                click.echo(f'candidate {candidate["id"]}: missing {filename}')
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            try:
+                paths[column] = store_bytes(data, _extension(filename))
+                moved.add(filename)
+            except MediaError as e:
+                click.echo(f'candidate {candidate["id"]}: skipped {filename}: {e}')
+        if paths:
+            cursor.execute(
+                "UPDATE candidates SET photo_path = %s, symbol_path = %s WHERE id = %s",
+                (paths.get('photo_path', candidate['photo_path']),
+                 paths.get('symbol_path', candidate['symbol_path']), candidate['id'])
+            )
+            renamed += len(paths)
+    conn.commit()
+    removed = 0
+    for filename in sorted(moved):
+        cursor.execute("SELECT COUNT(*) AS n FROM candidates WHERE photo_path = %s OR symbol_path = %s",
+                       (filename, filename))
+        if cursor.fetchone()['n'] == 0:
+            os.remove(os.path.join(folder, filename))
+            removed += 1
+    conn.commit()
+    cursor.close()
+    click.echo(f'Rehashed {renamed} upload(s); removed {removed} original(s).')
+    if Image is None:
+        click.echo('Pillow is not installed; thumbnails and WebP variants were skipped.')
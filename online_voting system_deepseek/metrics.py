@@ -0,0 +1,171 @@
+import bisect
+import re
+import threading
+import time
+
+from flask import before_render_template, g, request, template_rendered
+
+# Seconds; roughly the Prometheus client defaults with a finer low end
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts, then sum and count
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def add_gauges(self, prefix, help, collect):
+        """Expose every numeric value of the dict returned by ``collect()`` as a gauge."""
+        self._collectors.append((prefix, help, collect))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, help, collect in self._collectors:
+            for key, value in collect().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f'{prefix}_{key}'
+                lines += [f'# HELP {name} {help}', f'# TYPE {name} gauge', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'voting_request_duration_seconds', 'Request duration by endpoint.', ('endpoint', 'method', 'status'))
+SQL_SECONDS = REGISTRY.histogram(
+    'voting_sql_duration_seconds', 'SQL statement duration.', ('statement',))
+SQL_ROWS = REGISTRY.counter(
+    'voting_sql_rows_total', 'Rows returned or affected by SQL statements.', ('statement',))
+TEMPLATE_SECONDS = REGISTRY.histogram(
+    'voting_template_render_seconds', 'Template render time.', ('template',))
+KDF_SECONDS = REGISTRY.histogram(
+    'voting_kdf_duration_seconds', 'Password hash/verify time including queueing.', ('operation',))
+POOL_CHECKOUT_SECONDS = REGISTRY.histogram(
+    'voting_db_pool_checkout_seconds', 'Time to check a connection out of the pool.')
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    'voting_admission_wait_seconds', 'Time queued requests waited for admission.', ('route_class',))
+ADMISSION_SHED = REGISTRY.counter(
+    'voting_admission_shed_total', 'Requests turned away by admission control.', ('route_class', 'reason'))
+
+
+_SPACES = re.compile(r'\s+')
+_PLACEHOLDER_LISTS = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+def normalize_statement(sql):
+    """A SQL statement with whitespace collapsed and placeholder lists shortened."""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    sql = _SPACES.sub(' ', sql).strip()
+    return _PLACEHOLDER_LISTS.sub('%s, ...', sql)
+
+
+def statement_label(sql):
+    """Collapse a SQL statement to a stable, low-cardinality label."""
+    return normalize_statement(sql)[:200]
+
+
+def init_metrics(app):
+    """Time every request and every top-level template render."""
+    @app.before_request
+    def _start_timer():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = g.pop('_request_start', None)
+        if start is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - start, request.endpoint or 'unmatched',
+                                    request.method, str(response.status_code))
+        return response
+
+    def _before_render(sender, template, context, **extra):
+        g.setdefault('_render_starts', []).append(time.perf_counter())
+
+    def _rendered(sender, template, context, **extra):
+        starts = g.get('_render_starts')
+        if starts:
+            TEMPLATE_SECONDS.observe(time.perf_counter() - starts.pop(), template.name)
+
+    before_render_template.connect(_before_render, app, weak=False)
+    template_rendered.connect(_rendered, app, weak=False)
@@ -0,0 +1,92 @@
+-- Initial schema: everything voting_system.sql created. Written with
+-- IF NOT EXISTS / INSERT IGNORE so it also brings a database created from
+-- any earlier version of that file up to date without touching its data.
+
+-- Voters Table
+CREATE TABLE IF NOT EXISTS voters (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    full_name VARCHAR(100) NOT NULL,
+    voter_id VARCHAR(50) UNIQUE NOT NULL,
+    email VARCHAR(100) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    has_voted BOOLEAN DEFAULT FALSE,
+    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Admins Table
+CREATE TABLE IF NOT EXISTS admins (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL
+);
+INSERT IGNORE INTO admins (username, password) VALUES ('admin', 'admin@123');
+
+-- Elections Table
+CREATE TABLE IF NOT EXISTS elections (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    start_time DATETIME,
+    end_time DATETIME,
+    area VARCHAR(100),
+    is_active BOOLEAN DEFAULT TRUE
+);
+
+-- Candidates Table
+CREATE TABLE IF NOT EXISTS candidates (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    candidate_name VARCHAR(100) NOT NULL,
+    party_name VARCHAR(100) NOT NULL,
+    photo_path VARCHAR(255),
+    symbol_path VARCHAR(255),
+    election_id INT NOT NULL,
+    FOREIGN KEY (election_id) REFERENCES elections(id) ON DELETE CASCADE
+);
+
+-- Votes Table
+CREATE TABLE IF NOT EXISTS votes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    voter_id INT NOT NULL,
+    candidate_id INT NOT NULL,
+    election_id INT NOT NULL,
+    voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (voter_id) REFERENCES voters(id) ON DELETE CASCADE,
+    FOREIGN KEY (candidate_id) REFERENCES candidates(id) ON DELETE CASCADE,
+    FOREIGN KEY (election_id) REFERENCES elections(id) ON DELETE CASCADE,
+    UNIQUE (voter_id, election_id)
+);
+
+-- Vote Tallies Table (per-candidate counts maintained by cast_vote;
+-- check or recompute with `flask tallies verify` / `flask tallies rebuild`)
+CREATE TABLE IF NOT EXISTS vote_tallies (
+    election_id INT NOT NULL,
+    candidate_id INT NOT NULL,
+    vote_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (election_id, candidate_id),
+    FOREIGN KEY (election_id) REFERENCES elections(id) ON DELETE CASCADE,
+    FOREIGN KEY (candidate_id) REFERENCES candidates(id) ON DELETE CASCADE
+);
+INSERT IGNORE INTO vote_tallies (election_id, candidate_id, vote_count)
+    SELECT election_id, candidate_id, COUNT(*) FROM votes GROUP BY election_id, candidate_id;
+
+-- Site Counters Table (registered voters and candidates, maintained on write
+-- so the admin dashboard never runs COUNT(*))
+CREATE TABLE IF NOT EXISTS site_counters (
+    name VARCHAR(50) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+INSERT IGNORE INTO site_counters (name, value) SELECT 'voters', COUNT(*) FROM voters;
+INSERT IGNORE INTO site_counters (name, value) SELECT 'candidates', COUNT(*) FROM candidates;
+
+-- Vote Journal Checkpoints (highest journal sequence number each local
+-- vote journal has committed to votes; only used with VOTE_INGEST_MODE = 'journal')
+CREATE TABLE IF NOT EXISTS vote_journal_checkpoints (
+    journal VARCHAR(100) PRIMARY KEY,
+    last_seq BIGINT NOT NULL DEFAULT 0
+);
+
+-- Admin Settings Table (for result publishing)
+CREATE TABLE IF NOT EXISTS admin_settings (
+    id INT PRIMARY KEY,
+    results_published BOOLEAN DEFAULT FALSE
+);
+INSERT IGNORE INTO admin_settings (id, results_published) VALUES (1, FALSE);
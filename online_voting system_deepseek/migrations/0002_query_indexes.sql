@@ -0,0 +1,31 @@
+-- Indexes for the queries the app actually runs. InnoDB secondary indexes
+-- carry the primary key, so "covering" below includes the id column.
+
+-- ElectionIndex reload (election_index.py):
+--   WHERE is_active = TRUE AND start_time IS NOT NULL AND end_time IS NOT NULL ORDER BY start_time
+-- Equality on is_active, then start_time in index order, so no filesort.
+CREATE INDEX idx_elections_active_window ON elections (is_active, start_time, end_time);
+
+-- voter_results_select: WHERE is_active = FALSE ORDER BY end_time DESC
+-- _default_election_id: WHERE is_active = TRUE LIMIT 1
+CREATE INDEX idx_elections_active_end ON elections (is_active, end_time);
+
+-- VoteGuard._load (vote_guard.py): SELECT voter_id FROM votes WHERE election_id = ?
+-- Covering, so loading an election's voted set never touches the rows.
+-- Also serves the election_id foreign key.
+CREATE INDEX idx_votes_election_voter ON votes (election_id, voter_id);
+
+-- delete_candidate: DELETE FROM votes WHERE candidate_id = ?
+-- Also serves the candidate_id foreign key and the tally rebuild grouping.
+CREATE INDEX idx_votes_candidate_election ON votes (candidate_id, election_id);
+
+-- admin_candidates / fetch_results / ElectionIndex: candidates WHERE election_id = ?
+-- Replaces the implicit foreign key index; id keeps ORDER BY c.id in order.
+CREATE INDEX idx_candidates_election ON candidates (election_id, id);
+
+-- The rest are already served by primary keys or UNIQUE constraints:
+--   voter_login           voters.email / voters.voter_id (UNIQUE, index merge)
+--   voter_dashboard       votes (voter_id, election_id) UNIQUE, leftmost prefix
+--   fetch_voter_roster    voters PRIMARY KEY range + votes (voter_id, election_id) UNIQUE
+--   admin_login           admins.username UNIQUE
+--   fetch_results         vote_tallies PRIMARY KEY (election_id, candidate_id)
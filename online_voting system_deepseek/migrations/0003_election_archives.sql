@@ -0,0 +1,27 @@
+-- Archives of completed elections (archive.py). One row per election,
+-- written once: final tallies as JSON plus the zlib-compressed vote ledger
+-- and the SHA-256 of the uncompressed ledger for audits.
+CREATE TABLE election_archives (
+    election_id INT PRIMARY KEY,
+    format SMALLINT NOT NULL,
+    vote_count INT NOT NULL,
+    tallies MEDIUMTEXT NOT NULL,
+    ledger LONGBLOB NOT NULL,
+    ledger_sha256 CHAR(64) NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    votes_moved_at TIMESTAMP NULL,
+    FOREIGN KEY (election_id) REFERENCES elections(id) ON DELETE CASCADE
+);
+
+-- Vote rows of archived elections moved out of the hot votes table. No
+-- foreign keys: the rows are a record and must outlive voter and
+-- candidate deletions.
+CREATE TABLE votes_archive (
+    id INT PRIMARY KEY,
+    voter_id INT NOT NULL,
+    candidate_id INT NOT NULL,
+    election_id INT NOT NULL,
+    voted_at TIMESTAMP NULL,
+    UNIQUE (election_id, voter_id),
+    INDEX idx_votes_archive_voter (voter_id)
+);
@@ -0,0 +1,23 @@
+-- Background jobs (jobs.py): heavy admin operations queued by the admin
+-- routes and run by a worker pool. args is JSON; a running job's
+-- locked_at is its heartbeat, and a job whose heartbeat is older than
+-- JOBS_LEASE seconds is taken back from the worker that claimed it.
+CREATE TABLE jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    args TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    progress INT NOT NULL DEFAULT 0,
+    total INT NULL,
+    message VARCHAR(255) NULL,
+    error TEXT NULL,
+    run_after TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(100) NULL,
+    locked_at TIMESTAMP NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+    INDEX idx_jobs_status (status, run_after)
+);
@@ -0,0 +1,5 @@
+-- When an election was completed (the complete_election route), in the
+-- app's local time like votes.voted_at. The vote journal's writer still
+-- records votes journaled before this moment once is_active is cleared;
+-- later ones are refused.
+ALTER TABLE elections ADD COLUMN completed_at DATETIME NULL;
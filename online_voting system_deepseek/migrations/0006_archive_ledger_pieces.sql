@@ -0,0 +1,11 @@
+-- The compressed vote ledger of an archive (format 2 on), split into rows
+-- of at most archive.LEDGER_PIECE bytes: a single LONGBLOB for a large
+-- election outgrows max_allowed_packet. election_archives.ledger is left
+-- empty for these; format 1 archives keep their ledger there.
+CREATE TABLE election_archive_ledger (
+    election_id INT NOT NULL,
+    seq INT NOT NULL,
+    data MEDIUMBLOB NOT NULL,
+    PRIMARY KEY (election_id, seq),
+    FOREIGN KEY (election_id) REFERENCES election_archives(election_id) ON DELETE CASCADE
+);
@@ -0,0 +1,89 @@
+-- SQLite version of ../0001_initial_schema.sql (DB_BACKEND = 'sqlite').
+-- Differences from MySQL, so the app sees the same behaviour:
+--   * AUTOINCREMENT, so ids are never reused (votes_archive keys on vote id)
+--   * COLLATE NOCASE on login names, as MySQL's default collation compares
+--     them case-insensitively
+--   * timestamps default to local time, like MySQL's CURRENT_TIMESTAMP
+--   * an explicit index for each foreign key MySQL would index implicitly
+
+-- Voters Table
+CREATE TABLE IF NOT EXISTS voters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    full_name VARCHAR(100) NOT NULL,
+    voter_id VARCHAR(50) COLLATE NOCASE UNIQUE NOT NULL,
+    email VARCHAR(100) COLLATE NOCASE UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    has_voted BOOLEAN DEFAULT FALSE,
+    registered_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+-- Admins Table
+CREATE TABLE IF NOT EXISTS admins (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) COLLATE NOCASE UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL
+);
+INSERT OR IGNORE INTO admins (username, password) VALUES ('admin', 'admin@123');
+
+-- Elections Table
+CREATE TABLE IF NOT EXISTS elections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    start_time DATETIME,
+    end_time DATETIME,
+    area VARCHAR(100),
+    is_active BOOLEAN DEFAULT TRUE
+);
+
+-- Candidates Table
+CREATE TABLE IF NOT EXISTS candidates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    candidate_name VARCHAR(100) NOT NULL,
+    party_name VARCHAR(100) NOT NULL,
+    photo_path VARCHAR(255),
+    symbol_path VARCHAR(255),
+    election_id INTEGER NOT NULL REFERENCES elections(id) ON DELETE CASCADE
+);
+
+-- Votes Table
+CREATE TABLE IF NOT EXISTS votes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    voter_id INTEGER NOT NULL REFERENCES voters(id) ON DELETE CASCADE,
+    candidate_id INTEGER NOT NULL REFERENCES candidates(id) ON DELETE CASCADE,
+    election_id INTEGER NOT NULL REFERENCES elections(id) ON DELETE CASCADE,
+    voted_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    UNIQUE (voter_id, election_id)
+);
+
+-- Vote Tallies Table (per-candidate counts maintained by cast_vote;
+-- check or recompute with `flask tallies verify` / `flask tallies rebuild`)
+CREATE TABLE IF NOT EXISTS vote_tallies (
+    election_id INTEGER NOT NULL REFERENCES elections(id) ON DELETE CASCADE,
+    candidate_id INTEGER NOT NULL REFERENCES candidates(id) ON DELETE CASCADE,
+    vote_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (election_id, candidate_id)
+);
+CREATE INDEX IF NOT EXISTS idx_vote_tallies_candidate ON vote_tallies (candidate_id);
+
+-- Site Counters Table (registered voters and candidates, maintained on write
+-- so the admin dashboard never runs COUNT(*))
+CREATE TABLE IF NOT EXISTS site_counters (
+    name VARCHAR(50) PRIMARY KEY,
+    value BIGINT NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO site_counters (name, value) VALUES ('voters', 0);
+INSERT OR IGNORE INTO site_counters (name, value) VALUES ('candidates', 0);
+
+-- Vote Journal Checkpoints (highest journal sequence number each local
+-- vote journal has committed to votes; only used with VOTE_INGEST_MODE = 'journal')
+CREATE TABLE IF NOT EXISTS vote_journal_checkpoints (
+    journal VARCHAR(100) PRIMARY KEY,
+    last_seq BIGINT NOT NULL DEFAULT 0
+);
+
+-- Admin Settings Table (for result publishing)
+CREATE TABLE IF NOT EXISTS admin_settings (
+    id INTEGER PRIMARY KEY,
+    results_published BOOLEAN DEFAULT FALSE
+);
+INSERT OR IGNORE INTO admin_settings (id, results_published) VALUES (1, FALSE);
@@ -0,0 +1,10 @@
+-- SQLite version of ../0002_query_indexes.sql; see that file for the
+-- queries each index serves. SQLite does not index foreign keys on its own,
+-- so the votes and candidates indexes also keep ON DELETE CASCADE from
+-- scanning those tables.
+
+CREATE INDEX idx_elections_active_window ON elections (is_active, start_time, end_time);
+CREATE INDEX idx_elections_active_end ON elections (is_active, end_time);
+CREATE INDEX idx_votes_election_voter ON votes (election_id, voter_id);
+CREATE INDEX idx_votes_candidate_election ON votes (candidate_id, election_id);
+CREATE INDEX idx_candidates_election ON candidates (election_id, id);
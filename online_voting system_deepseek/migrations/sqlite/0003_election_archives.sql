@@ -0,0 +1,22 @@
+-- SQLite version of ../0003_election_archives.sql.
+
+CREATE TABLE election_archives (
+    election_id INTEGER PRIMARY KEY REFERENCES elections(id) ON DELETE CASCADE,
+    format SMALLINT NOT NULL,
+    vote_count INTEGER NOT NULL,
+    tallies TEXT NOT NULL,
+    ledger BLOB NOT NULL,
+    ledger_sha256 CHAR(64) NOT NULL,
+    archived_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    votes_moved_at TIMESTAMP NULL
+);
+
+CREATE TABLE votes_archive (
+    id INTEGER PRIMARY KEY,
+    voter_id INTEGER NOT NULL,
+    candidate_id INTEGER NOT NULL,
+    election_id INTEGER NOT NULL,
+    voted_at TIMESTAMP NULL,
+    UNIQUE (election_id, voter_id)
+);
+CREATE INDEX idx_votes_archive_voter ON votes_archive (voter_id);
@@ -0,0 +1,21 @@
+-- SQLite version of ../0004_jobs.sql.
+
+CREATE TABLE jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind VARCHAR(50) NOT NULL,
+    args TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    progress INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NULL,
+    message VARCHAR(255) NULL,
+    error TEXT NULL,
+    run_after TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    locked_by VARCHAR(100) NULL,
+    locked_at TIMESTAMP NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    started_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL
+);
+CREATE INDEX idx_jobs_status ON jobs (status, run_after);
@@ -0,0 +1,3 @@
+-- SQLite version of ../0005_election_completed_at.sql.
+
+ALTER TABLE elections ADD COLUMN completed_at DATETIME NULL;
@@ -0,0 +1,8 @@
+-- SQLite version of ../0006_archive_ledger_pieces.sql.
+
+CREATE TABLE election_archive_ledger (
+    election_id INTEGER NOT NULL REFERENCES election_archives(election_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (election_id, seq)
+);
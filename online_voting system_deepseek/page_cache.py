@@ -0,0 +1,77 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app, render_template
+
+# base.html writes this instead of the flash messages when rendering a page
+# for the cache; cached_page() puts the current voter's messages back in.
+FLASH_SLOT = '<!--flashes-->'
+
+
+class PageCache:
+    """Rendered pages that are identical for every voter.
+
+    Entries are keyed by page (for example ``('candidates', 7)``) and carry
+    the version of the data they were rendered from; asking with a newer
+    version re-renders and replaces the entry. The ETag is a digest of the
+    HTML, so a re-render that produced the same page still answers 304.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['version'] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def render(self, key, version, template, load):
+        """Return the entry for ``key``, rendering ``template`` with ``load()`` on a miss."""
+        entry = self.get(key, version)
+        if entry is not None:
+            return entry
+        return self.store(key, version, render_template(template, cached_render=True, **load()))
+
+    def store(self, key, version, html):
+        # html must have been rendered with cached_render=True
+        entry = {
+            'version': version,
+            'html': html,
+            'etag': hashlib.sha1(html.encode('utf-8')).hexdigest(),
+        }
+        with self._lock:
+            self.renders += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'renders': self.renders,
+            }
+
+
+def init_page_cache(app):
+    app.extensions['page_cache'] = PageCache(app.config['PAGE_CACHE_SIZE'])
+
+
+def get_page_cache():
+    return current_app.extensions['page_cache']
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from metrics import KDF_SECONDS
+
+
+class KdfBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs password hashing on a dedicated, bounded thread pool.
+
+    hashlib's scrypt and pbkdf2 release the GIL, so a few KDF workers keep
+    login surges from occupying every request thread. Once ``max_queue``
+    hashes are running or waiting, new ones fail fast with ``KdfBusy``.
+    """
+
+    def __init__(self, method, salt_length=16, workers=2, max_queue=32):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.max_queue = max_queue
+        # werkzeug writes the method out in full ("pbkdf2:sha256" is stored as
+        # "pbkdf2:sha256:1000000"), so compare against what it actually writes
+        self._prefix = generate_password_hash('', method, salt_length).split('$', 1)[0]
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='kdf')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+
+    def _submit(self, operation, fn, *args):
+        start = time.perf_counter()
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self._rejected += 1
+                raise KdfBusy('Password hashing queue is full')
+            self._pending += 1
+
+        def done(future):
+            KDF_SECONDS.observe(time.perf_counter() - start, operation)
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(done)
+        return future
+
+    def hash(self, password):
+        return self._submit('hash', generate_password_hash, password, self.method, self.salt_length).result()
+
+    def verify(self, pwhash, password):
+        return self._submit('verify', check_password_hash, pwhash, password).result()
+
+    # For the ASGI app: await the KDF without blocking the event loop
+    async def hash_async(self, password):
+        return await asyncio.wrap_future(
+            self._submit('hash', generate_password_hash, password, self.method, self.salt_length))
+
+    async def verify_async(self, pwhash, password):
+        return await asyncio.wrap_future(self._submit('verify', check_password_hash, pwhash, password))
+
+    def needs_rehash(self, pwhash):
+        # Stored hashes look like "scrypt:32768:8:1$salt$hash"
+        return pwhash.split('$', 1)[0] != self._prefix
+
+    def note_rehash(self):
+        with self._lock:
+            self._rehashed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'method': self.method,
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'pending': self._pending,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'rehashed': self._rehashed,
+            }
+
+
+def init_hasher(app):
+    app.extensions['password_hasher'] = PasswordHasher(
+        app.config['PASSWORD_HASH_METHOD'],
+        salt_length=app.config['PASSWORD_SALT_LENGTH'],
+        workers=app.config['KDF_WORKERS'],
+        max_queue=app.config['KDF_MAX_QUEUE'],
+    )
+
+
+def get_hasher():
+    return current_app.extensions['password_hasher']
@@ -0,0 +1,128 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+
+def _etag(election_id, results, total_votes):
+    digest = hashlib.sha1(repr((
+        election_id,
+        total_votes,
+        [(c['id'], c['candidate_name'], c['party_name'], c['photo_path'], c['symbol_path'], c['vote_count'])
+         for c in results],
+    )).encode('utf-8'))
+    return digest.hexdigest()
+
+
+PUBLISHED_KEY = 'results_published'
+
+
+def _key(election_id):
+    return f'results:{election_id}'
+
+
+class ResultsCache:
+    """Election results keyed by election id.
+
+    Versions are per election and kept in the shared store, so every
+    invalidate() reaches all worker processes, and a reader that raced a
+    write cannot store stale results. Live results sit in a size-bounded
+    per-process LRU and are only served at the version they were read at.
+    Completed elections are frozen into snapshots, which go to the shared
+    store and stay until the election's candidates change.
+    """
+
+    def __init__(self, store, max_entries=256):
+        self.store = store
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._live = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, election_id):
+        return self.store.version(_key(election_id))
+
+    def get(self, election_id):
+        version = self.version(election_id)
+        entry = self.store.get(_key(election_id))
+        with self._lock:
+            if entry is None:
+                entry = self._live.get(election_id)
+                if entry is not None and entry['version'] != version:
+                    del self._live[election_id]
+                    entry = None
+                if entry is not None:
+                    self._live.move_to_end(election_id)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def _store(self, election_id, version, results, total_votes, frozen):
+        entry = {
+            'results': results,
+            'total_votes': total_votes,
+            'etag': _etag(election_id, results, total_votes),
+            'frozen': frozen,
+            'version': version,
+        }
+        if frozen:
+            if self.store.set(_key(election_id), version, entry):
+                with self._lock:
+                    self._live.pop(election_id, None)
+            return entry
+        with self._lock:
+            if self.version(election_id) != version:
+                return entry
+            self._live[election_id] = entry
+            self._live.move_to_end(election_id)
+            while len(self._live) > self.max_entries:
+                self._live.popitem(last=False)
+        return entry
+
+    def put(self, election_id, version, results, total_votes):
+        return self._store(election_id, version, results, total_votes, frozen=False)
+
+    def freeze(self, election_id, version, results, total_votes):
+        # Only call this for completed elections
+        return self._store(election_id, version, results, total_votes, frozen=True)
+
+    def invalidate(self, election_id):
+        self.store.bump(_key(election_id))
+        with self._lock:
+            self._live.pop(election_id, None)
+
+    # admin_settings.results_published, shared alongside the results; None
+    # until some process has read it
+    def published(self):
+        return self.store.get(PUBLISHED_KEY)
+
+    def published_version(self):
+        return self.store.version(PUBLISHED_KEY)
+
+    def set_published(self, value, version=None):
+        """Share the flag; pass the published_version() it was read at, or None after changing it."""
+        if version is None:
+            version = self.store.bump(PUBLISHED_KEY)
+        self.store.set(PUBLISHED_KEY, version, bool(value))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'live_entries': len(self._live),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def init_results_cache(app):
+    app.extensions['results_cache'] = ResultsCache(app.extensions['shared_store'],
+                                                   app.config['RESULTS_CACHE_SIZE'])
+
+
+def get_results_cache():
+    return current_app.extensions['results_cache']
@@ -0,0 +1,186 @@
+import json
+import os
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from db import MySQLdb, DictCursor
+
+# Versioned schema migrations. Each file in migrations/ is named
+# NNNN_description.sql and is applied once, in order; the versions applied
+# are recorded in schema_migrations. MySQL commits DDL implicitly, so a
+# migration that fails halfway is not rolled back: fix it and write the
+# remaining statements so they can be re-run. The SQLite backend has its
+# own files under migrations/sqlite/ with the same version numbers; a
+# schema change needs both (SQLite migrations run in one transaction).
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+_FILENAME = re.compile(r'^(\d+)_(\w+)\.sql$')
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|UPDATE|DELETE|INSERT|REPLACE)\b', re.I)
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def migrations_dir(backend='mysql'):
+    return MIGRATIONS_DIR if backend == 'mysql' else os.path.join(MIGRATIONS_DIR, backend)
+
+
+def available_migrations(directory=MIGRATIONS_DIR):
+    """Return [(version, name, path)] sorted by version."""
+    migrations = []
+    for filename in os.listdir(directory):
+        match = _FILENAME.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    migrations.sort()
+    versions = [version for version, _, _ in migrations]
+    if len(set(versions)) != len(versions):
+        raise click.ClickException('Two migrations share a version number.')
+    return migrations
+
+
+def split_statements(sql):
+    """Split a migration file into statements; a ';' in a comment line does not count."""
+    code = '\n'.join(line for line in sql.splitlines() if not line.strip().startswith('--'))
+    return [chunk.strip() for chunk in code.split(';') if chunk.strip()]
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def upgrade(conn, target=None, echo=print, backend='mysql'):
+    """Apply every pending migration up to ``target``; returns the versions applied."""
+    cursor = conn.cursor()
+    done = applied_versions(cursor)
+    conn.commit()
+    applied = []
+    for version, name, path in available_migrations(migrations_dir(backend)):
+        if version in done or (target is not None and version > target):
+            continue
+        echo(f'Applying {version:04d}_{name}')
+        with open(path, encoding='utf-8') as f:
+            for statement in split_statements(f.read()):
+                cursor.execute(statement)
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        conn.commit()
+        applied.append(version)
+    cursor.close()
+    return applied
+
+
+def explain(conn, statements, max_rows):
+    """EXPLAIN each (sql, args) pair and return the plans that scan too much.
+
+    A plan fails when any table in it is read with a full table scan
+    (type ALL) over more than ``max_rows`` estimated rows.
+    """
+    if getattr(conn, 'backend', 'mysql') == 'sqlite':
+        return _explain_sqlite(conn, statements, max_rows)
+    failures = []
+    cursor = conn.cursor(DictCursor)
+    for sql, args in statements:
+        if not _EXPLAINABLE.match(sql):
+            continue
+        cursor.execute('EXPLAIN ' + sql, args)
+        for row in cursor.fetchall():
+            if row['type'] == 'ALL' and (row['rows'] or 0) > max_rows:
+                failures.append((sql, row['table'], row['rows']))
+    cursor.close()
+    return failures
+
+
+def _explain_sqlite(conn, statements, max_rows):
+    # EXPLAIN QUERY PLAN has no row estimates, so a plain "SCAN table"
+    # (no index) fails when the table itself holds more than max_rows
+    failures = []
+    sizes = {}
+    cursor = conn.cursor()
+    for sql, args in statements:
+        if not _EXPLAINABLE.match(sql):
+            continue
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, args)
+        scans = [_SQLITE_FULL_SCAN.match(row[3]) for row in cursor.fetchall()]
+        for table in {scan.group(1) for scan in scans if scan}:
+            if table not in sizes:
+                cursor.execute(f'SELECT COUNT(*) FROM {table}')
+                sizes[table] = cursor.fetchone()[0]
+            if sizes[table] > max_rows:
+                failures.append((sql, table, sizes[table]))
+    cursor.close()
+    return failures
+
+
+def load_captured(path):
+    """Read statements written by the SQL_CAPTURE_FILE setting as (sql, args) pairs."""
+    with open(path, encoding='utf-8') as f:
+        return [(entry['sql'], entry['args']) for entry in map(json.loads, f) if entry]
+
+
+# --------------------- CLI: flask db ... ---------------------
+
+db_cli = AppGroup('db', help='Schema migrations and query plan checks.')
+
+
+def _connect(create=False):
+    config = current_app.config
+    if config['DB_BACKEND'] == 'sqlite':
+        from sqlite_db import SQLiteConnection, sqlite_connect_args
+        return SQLiteConnection(**sqlite_connect_args(config))
+    conn = MySQLdb.connect(host=config['MYSQL_HOST'], user=config['MYSQL_USER'],
+                           password=config['MYSQL_PASSWORD'])
+    if create:
+        conn.cursor().execute(f"CREATE DATABASE IF NOT EXISTS `{config['MYSQL_DB']}`")
+    conn.select_db(config['MYSQL_DB'])
+    return conn
+
+
+@db_cli.command('upgrade')
+@click.option('--target', type=int, default=None, help='Stop after this migration version.')
+def upgrade_command(target):
+    """Create the database if needed and apply pending migrations."""
+    conn = _connect(create=True)
+    applied = upgrade(conn, target, echo=click.echo, backend=current_app.config['DB_BACKEND'])
+    conn.close()
+    click.echo(f'{len(applied)} migration(s) applied.' if applied else 'Schema is up to date.')
+
+
+@db_cli.command('status')
+def status_command():
+    """List migrations and whether each has been applied."""
+    conn = _connect()
+    cursor = conn.cursor()
+    done = applied_versions(cursor)
+    cursor.close()
+    conn.close()
+    for version, name, _ in available_migrations(migrations_dir(current_app.config['DB_BACKEND'])):
+        click.echo(f'{"applied" if version in done else "pending":<8} {version:04d}_{name}')
+
+
+@db_cli.command('explain')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--max-rows', type=int, default=None,
+              help='Largest full table scan allowed (default: EXPLAIN_MAX_SCAN_ROWS).')
+def explain_command(path, max_rows):
+    """EXPLAIN every statement in a SQL_CAPTURE_FILE and fail on large full scans."""
+    if max_rows is None:
+        max_rows = current_app.config['EXPLAIN_MAX_SCAN_ROWS']
+    statements = load_captured(path)
+    conn = _connect()
+    failures = explain(conn, statements, max_rows)
+    conn.close()
+    for sql, table, rows in failures:
+        click.echo(f'full scan of {table} (~{rows} rows): {sql}')
+    if failures:
+        raise SystemExit(f'{len(failures)} full table scan(s) over {max_rows} rows')
+    click.echo(f'{len(statements)} statement(s) checked, no full scans over {max_rows} rows.')
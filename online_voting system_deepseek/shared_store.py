@@ -0,0 +1,299 @@
+import errno
+import fcntl
+import glob
+import hashlib
+import hmac
+import logging
+import mmap
+import os
+import pickle
+import stat
+import struct
+import tempfile
+import threading
+import zlib
+
+from flask import current_app
+
+# Hot read-mostly state (the active election index, results snapshots, the
+# results_published flag) shared by every worker process on a host, so a
+# change made through one worker is seen by all of them and one worker's
+# rebuild serves the rest.
+
+_SLOTS = 4096
+_COUNTER = struct.Struct('<Q')
+# (epoch, counter) a value file was written at
+_TAG = struct.Struct('<QQ')
+_MAC_SIZE = hashlib.sha256().digest_size
+
+log = logging.getLogger('voting.shared_store')
+
+
+class SharedStoreError(Exception):
+    pass
+
+
+def _open(path, flags, mode=0o600):
+    # Never through a symlink planted in the directory
+    return os.open(path, flags | os.O_NOFOLLOW, mode)
+
+
+class SharedStore:
+    """Versioned values shared between processes through files on tmpfs.
+
+    Every key hashes to one of ``slots`` version counters in a memory-mapped
+    file, so checking whether a key changed is a memory read; keys that
+    share a slot just invalidate each other now and then. Slot 0 is an
+    epoch, bumped by reset() when the app starts, that is part of every
+    version, so nothing cached before a restart is trusted after it.
+
+    A value is pickled into its own file, tagged with the version it was
+    built from, and only returned while that version is current; set()
+    with an outdated version is dropped. Each process also keeps the values
+    it has unpickled, so a read whose version has not moved does no I/O.
+    The directory must be owned by the app's user with mode 0700, or the
+    store refuses to open; files are never opened through symlinks, and a
+    value file is only unpickled if its HMAC under ``secret`` (the app's
+    SECRET_KEY) checks out.
+
+    Claim bitmaps (claim()/unclaim()) are the one kind of state here that
+    is not a cache: a bit set by one process is seen by every other at
+    once, and stays set across resets until drop_claims().
+    """
+
+    def __init__(self, directory, secret, slots=_SLOTS):
+        self.directory = directory
+        self.slots = slots
+        if isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        self._key = hashlib.sha256(b'voting shared store\0' + secret).digest()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._map = None
+        self._local = {}
+        self._claim_lock = threading.Lock()
+        self._claim_fds = {}
+        self.hits = 0
+        self.loads = 0
+        self.misses = 0
+        self.rejected = 0
+        self.stores = 0
+        self.bumps = 0
+
+    def _check_directory(self):
+        st = os.lstat(self.directory)
+        if not stat.S_ISDIR(st.st_mode):
+            raise SharedStoreError(f'{self.directory} is not a directory')
+        if st.st_uid != os.geteuid() or stat.S_IMODE(st.st_mode) != 0o700:
+            raise SharedStoreError(
+                f'{self.directory} must be owned by uid {os.geteuid()} with mode 0700 '
+                f'(it is uid {st.st_uid}, mode {stat.S_IMODE(st.st_mode):04o})')
+
+    def _ensure_open(self):
+        # Reopened in a forked child: a flock taken through the parent's
+        # open file would not exclude the parent
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            self._check_directory()
+            f = os.fdopen(_open(os.path.join(self.directory, 'versions'), os.O_RDWR | os.O_CREAT), 'r+b')
+            size = (self.slots + 1) * _COUNTER.size
+            if os.fstat(f.fileno()).st_size < size:
+                f.truncate(size)
+            self._file = f
+            self._map = mmap.mmap(f.fileno(), size)
+            # Likewise for the claim bitmaps' byte-range locks
+            self._claim_fds = {}
+            self._pid = os.getpid()
+
+    def _slot(self, key):
+        return 1 + zlib.crc32(key.encode('utf-8')) % self.slots
+
+    def _read(self, slot):
+        return _COUNTER.unpack_from(self._map, slot * _COUNTER.size)[0]
+
+    def _increment(self, slot):
+        with self._lock:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                value = self._read(slot) + 1
+                _COUNTER.pack_into(self._map, slot * _COUNTER.size, value)
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+        return value
+
+    def version(self, key):
+        self._ensure_open()
+        return self._read(0), self._read(self._slot(key))
+
+    def bump(self, key):
+        """Invalidate ``key`` in every process; returns its new version."""
+        self._ensure_open()
+        self._increment(self._slot(key))
+        with self._lock:
+            self.bumps += 1
+            self._local.pop(key, None)
+        return self.version(key)
+
+    def reset(self):
+        """Invalidate every key, e.g. when the database may have changed while the app was down."""
+        self._ensure_open()
+        self._increment(0)
+        with self._lock:
+            self._local.clear()
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _mac(self, key, data):
+        # The key is signed too, so one key's file cannot stand in for another's
+        return hmac.new(self._key, key.encode('utf-8') + b'\0' + data, hashlib.sha256).digest()
+
+    def _reject(self, key, reason):
+        log.warning('Shared store value for %r ignored: %s', key, reason)
+        with self._lock:
+            self.rejected += 1
+
+    def get(self, key):
+        """The value stored for the current version of ``key``, or None."""
+        version = self.version(key)
+        with self._lock:
+            local = self._local.get(key)
+            if local is not None and local[0] == version:
+                self.hits += 1
+                return local[1]
+        try:
+            with os.fdopen(_open(self._path(key), os.O_RDONLY), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        except OSError as e:
+            if e.errno != errno.ELOOP:
+                raise
+            # set() replaces the link with a real file
+            self._reject(key, 'symlink')
+            return None
+        mac, data = data[:_MAC_SIZE], data[_MAC_SIZE:]
+        if len(data) < _TAG.size or _TAG.unpack_from(data) != version:
+            with self._lock:
+                self.misses += 1
+            return None
+        if not hmac.compare_digest(mac, self._mac(key, data)):
+            self._reject(key, 'bad signature')
+            return None
+        value = pickle.loads(data[_TAG.size:])
+        with self._lock:
+            self.loads += 1
+            self._local[key] = (version, value)
+        return value
+
+    def set(self, key, version, value):
+        """Store ``value`` as built from ``version``; ignored if the key has changed since."""
+        if self.version(key) != version:
+            return False
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        data = _TAG.pack(*version) + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with os.fdopen(_open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC), 'wb') as f:
+            f.write(self._mac(key, data) + data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.stores += 1
+            self._local[key] = (version, value)
+        return True
+
+    # --------------------- Claim bitmaps ---------------------
+
+    def _claims_path(self, name):
+        return os.path.join(self.directory, 'claims-' + hashlib.sha1(name.encode('utf-8')).hexdigest())
+
+    def _claims_fd(self, name):
+        self._ensure_open()
+        with self._claim_lock:
+            fd = self._claim_fds.get(name)
+            if fd is None:
+                fd = self._claim_fds[name] = _open(self._claims_path(name), os.O_RDWR | os.O_CREAT)
+            return fd
+
+    def _flip(self, name, index, value):
+        fd = self._claims_fd(name)
+        offset, mask = index >> 3, 1 << (index & 7)
+        # lockf() only excludes other processes; the thread lock does the rest
+        with self._claim_lock:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, offset)
+            try:
+                byte = os.pread(fd, 1, offset)
+                old = byte[0] if byte else 0
+                new = old | mask if value else old & ~mask
+                if new != old:
+                    os.pwrite(fd, bytes([new]), offset)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+        return new != old
+
+    def claim(self, name, index):
+        """Set bit ``index`` of the bitmap ``name``; False if it was already set, by any process."""
+        return self._flip(name, index, True)
+
+    def unclaim(self, name, index):
+        self._flip(name, index, False)
+
+    def drop_claims(self, name=None):
+        """Clear the bitmap ``name``, or every bitmap, for every process."""
+        paths = [self._claims_path(name)] if name is not None else \
+            glob.glob(os.path.join(self.directory, 'claims-*'))
+        for path in paths:
+            # Truncated, not removed: other processes keep their descriptors
+            try:
+                fd = _open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                with self._claim_lock:
+                    fcntl.lockf(fd, fcntl.LOCK_EX)
+                    os.ftruncate(fd, 0)
+            finally:
+                os.close(fd)
+
+    def stats(self):
+        self._ensure_open()
+        with self._lock:
+            return {
+                'epoch': self._read(0),
+                'local_values': len(self._local),
+                'hits': self.hits,
+                'loads': self.loads,
+                'misses': self.misses,
+                'rejected': self.rejected,
+                'stores': self.stores,
+                'bumps': self.bumps,
+            }
+
+
+def default_directory(config):
+    """A directory on tmpfs named after the database, so two deployments on a host stay apart."""
+    if config['DB_BACKEND'] == 'sqlite':
+        database = os.path.abspath(config['SQLITE_PATH'])
+    else:
+        database = f"{config['MYSQL_HOST']}/{config['MYSQL_DB']}"
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    name = hashlib.sha1(f"{config['DB_BACKEND']}:{database}".encode('utf-8')).hexdigest()[:12]
+    return os.path.join(base, f'voting-{name}')
+
+
+def init_shared_store(app):
+    store = SharedStore(app.config['SHARED_STORE_DIR'] or default_directory(app.config),
+                        app.config['SECRET_KEY'], app.config['SHARED_STORE_SLOTS'])
+    # Nothing is touched until first use: importing app.py, as every
+    # `flask` command does, must not reset the store under running workers.
+    # The server entry points reset it on startup (wsgi.load_app(), asgi's
+    # lifespan startup)
+    app.extensions['shared_store'] = store
+
+
+def get_shared_store():
+    return current_app.extensions['shared_store']
@@ -0,0 +1,273 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+
+from db import ConnectionPool, DictCursor, SSDictCursor, _record, note_commit
+
+# Embedded SQLite backend (DB_BACKEND = 'sqlite') for single-node
+# deployments. Connections look like MySQLdb ones to the rest of the app:
+# %s placeholders, the same cursor kinds, DATETIME columns read back as
+# datetime, and the MySQL statements the app issues (ON DUPLICATE KEY
+# UPDATE, INSERT IGNORE) rewritten to SQLite's dialect. The database runs
+# in WAL mode, so readers never wait for the writer; writers are serialised
+# in-process by a lock taken on a transaction's first write (BEGIN
+# IMMEDIATE), which SQLite's busy timeout extends to other processes.
+
+_PLACEHOLDER = re.compile(r'%([s%])')
+_UPSERT = re.compile(r'\bON DUPLICATE KEY UPDATE\b', re.I)
+_VALUES_REF = re.compile(r'\bVALUES\((\w+)\)', re.I)
+_INSERT_IGNORE = re.compile(r'^(\s*)INSERT\s+IGNORE\b', re.I)
+_READ_ONLY = re.compile(r'^\s*(SELECT|WITH|EXPLAIN|\()', re.I)
+# MySQL's CURRENT_TIMESTAMP is local time, SQLite's UTC
+_NOW = re.compile(r'\b(CURRENT_TIMESTAMP|NOW\(\))', re.I)
+_NOW_INTERVAL = re.compile(r'\b(?:CURRENT_TIMESTAMP|NOW\(\))\s*([+-])\s*INTERVAL\s+(\?|%s)\s+SECOND\b', re.I)
+_CLOCK = "'now', 'localtime'"
+
+
+def _adapt_datetime(value):
+    # Whole seconds, like a MySQL DATETIME column
+    return value.isoformat(sep=' ', timespec='seconds')
+
+
+def _convert_datetime(value):
+    return datetime.fromisoformat(value.decode('ascii'))
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_converter('DATETIME', _convert_datetime)
+sqlite3.register_converter('TIMESTAMP', _convert_datetime)
+
+
+@lru_cache(maxsize=1024)
+def translate(sql, with_args=True):
+    """Rewrite a statement in the app's MySQL dialect; returns (sql, writes)."""
+    if with_args:
+        # MySQLdb only %-formats when it is given arguments
+        sql = _PLACEHOLDER.sub(lambda m: '?' if m.group(1) == 's' else '%', sql)
+    match = _UPSERT.search(sql)
+    if match:
+        # Needs SQLite 3.35+ for an upsert without a conflict target
+        sql = (sql[:match.start()] + 'ON CONFLICT DO UPDATE SET'
+               + _VALUES_REF.sub(r'excluded.\1', sql[match.end():]))
+    sql = _INSERT_IGNORE.sub(r'\1INSERT OR IGNORE', sql)
+    # CURRENT_TIMESTAMP - INTERVAL %s SECOND becomes a datetime() modifier
+    sql = _NOW_INTERVAL.sub(
+        lambda m: f"(datetime({_CLOCK}, '{m.group(1)}' || {m.group(2)} || ' seconds'))", sql)
+    sql = _NOW.sub(f'(datetime({_CLOCK}))', sql)
+    return sql, not _READ_ONLY.match(sql)
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class WriteLock:
+    """The one write transaction a process may have open on a database file."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.writes = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def acquire(self, timeout):
+        start = time.monotonic()
+        acquired = self._lock.acquire(timeout=timeout)
+        elapsed = time.monotonic() - start
+        with self._stats_lock:
+            self.writes += acquired
+            self.timeouts += not acquired
+            if elapsed > 0.001:
+                self.waits += 1
+                self.wait_total += elapsed
+                self.wait_max = max(self.wait_max, elapsed)
+        if not acquired:
+            raise sqlite3.OperationalError('database is locked')
+
+    def release(self):
+        self._lock.release()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'write_transactions': self.writes,
+                'writer_waits': self.waits,
+                'writer_wait_avg_ms': round(self.wait_total / self.waits * 1000, 3) if self.waits else 0,
+                'writer_wait_max_ms': round(self.wait_max * 1000, 3),
+                'writer_timeouts': self.timeouts,
+            }
+
+
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+
+def write_lock(path):
+    with _write_locks_lock:
+        return _write_locks.setdefault(os.path.abspath(path), WriteLock())
+
+
+class SQLiteCursor:
+    """Timed cursor over one SQLiteConnection; rows are tuples or dicts."""
+
+    def __init__(self, connection, as_dict):
+        self.connection = connection
+        self._cursor = connection._conn.cursor()
+        if as_dict:
+            self._cursor.row_factory = _dict_row
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def _prepare(self, query, with_args):
+        sql, writes = translate(query, with_args)
+        if writes:
+            self.connection._begin_write()
+        return sql
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(self._prepare(query, args is not None), args or ())
+        finally:
+            _record(query, time.perf_counter() - start, self._cursor.rowcount, args)
+        return self._cursor.rowcount
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(self._prepare(query, True), args)
+        finally:
+            _record(query, time.perf_counter() - start, self._cursor.rowcount,
+                    args[0] if isinstance(args, (list, tuple)) and args else None)
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """A SQLite database opened with the settings in ``sqlite_connect_args()``.
+
+    Runs in autocommit mode until the first write, so reads outside a
+    write transaction never hold a snapshot open. The first write takes
+    the process's write lock and starts BEGIN IMMEDIATE; commit() or
+    rollback() ends the transaction and releases the lock.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path, busy_timeout=5, cache_mb=64, mmap_mb=256, statement_cache=256,
+                 synchronous='FULL'):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._write_lock = write_lock(path)
+        self._writing = False
+        # isolation_level=None: transactions are started explicitly below.
+        # cached_statements is sqlite3's per-connection prepared statement LRU.
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None,
+                                     detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                                     cached_statements=statement_cache)
+        for pragma in ('journal_mode = WAL',
+                       f'synchronous = {synchronous}',
+                       'foreign_keys = ON',
+                       f'cache_size = -{cache_mb * 1024}',
+                       f'mmap_size = {mmap_mb * 1024 * 1024}',
+                       'temp_store = MEMORY'):
+            self._conn.execute(f'PRAGMA {pragma}')
+
+    def cursor(self, cursorclass=None):
+        return SQLiteCursor(self, cursorclass in (DictCursor, SSDictCursor))
+
+    def _begin_write(self):
+        if self._writing:
+            return
+        self._write_lock.acquire(self.busy_timeout)
+        try:
+            self._conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.Error:
+            self._write_lock.release()
+            raise
+        self._writing = True
+
+    def _end_write(self, statement):
+        if not self._writing:
+            return
+        self._conn.execute(statement)
+        self._writing = False
+        self._write_lock.release()
+
+    def commit(self):
+        # A failed COMMIT leaves the transaction (and the lock) to rollback()
+        wrote = self._writing
+        self._end_write('COMMIT')
+        if wrote:
+            note_commit()
+
+    def rollback(self):
+        try:
+            self._end_write('ROLLBACK')
+        finally:
+            if self._writing:
+                self._writing = False
+                self._write_lock.release()
+
+    def close(self):
+        self.rollback()
+        self._conn.close()
+
+
+def sqlite_connect_args(config):
+    return {
+        'path': config['SQLITE_PATH'],
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT'],
+        'cache_mb': config['SQLITE_CACHE_MB'],
+        'mmap_mb': config['SQLITE_MMAP_MB'],
+        'statement_cache': config['SQLITE_STATEMENT_CACHE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+    }
+
+
+class SQLitePool(ConnectionPool):
+    """ConnectionPool of SQLiteConnections; nothing to ping or recycle."""
+
+    def _connect(self):
+        conn = SQLiteConnection(**self.connect_args)
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _usable(self, conn):
+        return True
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(write_lock(self.connect_args['path']).stats())
+        return stats
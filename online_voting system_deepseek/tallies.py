@@ -0,0 +1,220 @@
+import click
+from flask.cli import AppGroup
+
+from db import get_db, Error
+
+# Per-candidate vote counts kept in vote_tallies so results pages never
+# have to aggregate the votes table, plus site-wide counters (registered
+# voters, candidates) in site_counters for the admin dashboard.
+
+COUNTED_TABLES = {'voters': 'voters', 'candidates': 'candidates'}
+
+
+# Inserts nothing unless the candidate stands in the election and the
+# election is still active, so a completed (possibly archived) election
+# can never gain votes
+INSERT_VOTE_SQL = (
+    "INSERT INTO votes (voter_id, candidate_id, election_id) "
+    "SELECT %s, c.id, c.election_id FROM candidates c JOIN elections e ON e.id = c.election_id "
+    "WHERE c.id = %s AND e.id = %s AND e.is_active = TRUE"
+)
+
+
+def insert_votes_sql(n):
+    """INSERT_VOTE_SQL for ``n`` journaled votes at once, with their voted_at.
+
+    Arguments are (voter_id, candidate_id, election_id, voted_at) for each
+    vote in turn; the rowcount says how many passed the check. A vote
+    journaled before its election was completed passes it even once the
+    election is inactive, since it was already acknowledged.
+    """
+    rows = ' UNION ALL '.join(['SELECT %s AS voter_id, %s AS candidate_id, %s AS election_id, %s AS voted_at']
+                              + ['SELECT %s, %s, %s, %s'] * (n - 1))
+    return (
+        "INSERT INTO votes (voter_id, candidate_id, election_id, voted_at) "
+        f"SELECT v.voter_id, c.id, c.election_id, v.voted_at FROM ({rows}) v "
+        "JOIN candidates c ON c.id = v.candidate_id AND c.election_id = v.election_id "
+        "JOIN elections e ON e.id = c.election_id "
+        "WHERE e.is_active = TRUE OR v.voted_at < e.completed_at"
+    )
+
+
+RECORD_VOTE_SQL = (
+    "INSERT INTO vote_tallies (election_id, candidate_id, vote_count) VALUES (%s, %s, 1) "
+    "ON DUPLICATE KEY UPDATE vote_count = vote_count + 1"
+)
+
+
+def record_vote(cursor, election_id, candidate_id):
+    # Must run in the same transaction as the INSERT INTO votes
+    cursor.execute(RECORD_VOTE_SQL, (election_id, candidate_id))
+
+
+def add_to_tallies(cursor, counts):
+    """Apply a batch of votes, ``counts`` mapping (election_id, candidate_id) to votes."""
+    # Must run in the same transaction as the batch of INSERT INTO votes
+    if counts:
+        cursor.executemany(
+            "INSERT INTO vote_tallies (election_id, candidate_id, vote_count) VALUES (%s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE vote_count = vote_count + VALUES(vote_count)",
+            [(election_id, candidate_id, n) for (election_id, candidate_id), n in counts.items()]
+        )
+
+
+def bump_counter(cursor, name, delta=1):
+    # Must run in the same transaction as the write being counted
+    cursor.execute(
+        "INSERT INTO site_counters (name, value) VALUES (%s, %s) "
+        "ON DUPLICATE KEY UPDATE value = value + VALUES(value)",
+        (name, delta)
+    )
+
+
+def counter_drift(cursor):
+    """Return (name, stored, counted) for every site counter that is wrong."""
+    cursor.execute("SELECT name, value FROM site_counters")
+    stored = {row[0]: row[1] for row in cursor.fetchall()}
+    drift = []
+    for name, table in COUNTED_TABLES.items():
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        counted = cursor.fetchone()[0]
+        if stored.get(name, 0) != counted:
+            drift.append((name, stored.get(name, 0), counted))
+    return drift
+
+
+def rebuild_counters(cursor):
+    for name, table in COUNTED_TABLES.items():
+        cursor.execute(
+            # WHERE TRUE keeps SQLite from reading the ON of the upsert as a join
+            f"INSERT INTO site_counters (name, value) SELECT %s, COUNT(*) FROM {table} WHERE TRUE "
+            "ON DUPLICATE KEY UPDATE value = VALUES(value)",
+            (name,)
+        )
+
+
+def forget_candidate(cursor, candidate_id):
+    cursor.execute("DELETE FROM vote_tallies WHERE candidate_id = %s", (candidate_id,))
+
+
+def fetch_results(cursor, election_id):
+    """Return (results, total_votes) for an election, read from vote_tallies."""
+    cursor.execute("""
+        SELECT c.id, c.candidate_name, c.party_name, c.photo_path, c.symbol_path,
+               COALESCE(t.vote_count, 0) AS vote_count
+        FROM candidates c
+        LEFT JOIN vote_tallies t ON t.election_id = c.election_id AND t.candidate_id = c.id
+        WHERE c.election_id = %s
+    """, (election_id,))
+    results = list(cursor.fetchall())
+
+    total_votes = sum(candidate['vote_count'] for candidate in results)
+    for candidate in results:
+        candidate['percentage'] = round((candidate['vote_count'] / total_votes) * 100, 2) if total_votes > 0 else 0
+    return results, total_votes
+
+
+# Votes of archived elections may have moved to votes_archive
+ALL_VOTES = ("(SELECT election_id, candidate_id FROM votes "
+             "UNION ALL SELECT election_id, candidate_id FROM votes_archive) AS v")
+
+
+def _counted(cursor, election_id=None):
+    query = f"SELECT election_id, candidate_id, COUNT(*) FROM {ALL_VOTES}"
+    params = ()
+    if election_id is not None:
+        query += " WHERE election_id = %s"
+        params = (election_id,)
+    cursor.execute(query + " GROUP BY election_id, candidate_id", params)
+    return {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+
+
+def _stored(cursor, election_id=None):
+    query = "SELECT election_id, candidate_id, vote_count FROM vote_tallies"
+    params = ()
+    if election_id is not None:
+        query += " WHERE election_id = %s"
+        params = (election_id,)
+    cursor.execute(query, params)
+    return {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+
+
+def find_drift(cursor, election_id=None):
+    """Compare vote_tallies with a fresh count of votes.
+
+    Returns a list of (election_id, candidate_id, stored, counted) for every
+    candidate whose stored tally is wrong.
+    """
+    counted = _counted(cursor, election_id)
+    stored = _stored(cursor, election_id)
+    drift = []
+    for key in sorted(set(counted) | set(stored)):
+        if counted.get(key, 0) != stored.get(key, 0):
+            drift.append((key[0], key[1], stored.get(key, 0), counted.get(key, 0)))
+    return drift
+
+
+def rebuild(cursor, election_id=None):
+    if election_id is None:
+        cursor.execute("DELETE FROM vote_tallies")
+        cursor.execute(
+            "INSERT INTO vote_tallies (election_id, candidate_id, vote_count) "
+            f"SELECT election_id, candidate_id, COUNT(*) FROM {ALL_VOTES} GROUP BY election_id, candidate_id"
+        )
+    else:
+        cursor.execute("DELETE FROM vote_tallies WHERE election_id = %s", (election_id,))
+        cursor.execute(
+            "INSERT INTO vote_tallies (election_id, candidate_id, vote_count) "
+            f"SELECT election_id, candidate_id, COUNT(*) FROM {ALL_VOTES} WHERE election_id = %s "
+            "GROUP BY election_id, candidate_id",
+            (election_id,)
+        )
+
+
+# --------------------- CLI: flask tallies ... ---------------------
+
+tallies_cli = AppGroup('tallies', help='Verify or rebuild the vote_tallies table.')
+
+
+def _report(drift, counters=()):
+    for election_id, candidate_id, stored, counted in drift:
+        click.echo(f'election {election_id} candidate {candidate_id}: stored {stored}, counted {counted}')
+    for name, stored, counted in counters:
+        click.echo(f'counter {name}: stored {stored}, counted {counted}')
+
+
+@tallies_cli.command('verify')
+@click.option('--election', 'election_id', type=int, default=None, help='Only check this election.')
+def verify_command(election_id):
+    """Report tallies and site counters that differ from the underlying tables."""
+    cursor = get_db().cursor()
+    drift = find_drift(cursor, election_id)
+    counters = counter_drift(cursor) if election_id is None else []
+    cursor.close()
+    if drift or counters:
+        _report(drift, counters)
+        raise SystemExit(f'{len(drift) + len(counters)} tally row(s) out of date')
+    click.echo('Tallies match votes.')
+
+
+@tallies_cli.command('rebuild')
+@click.option('--election', 'election_id', type=int, default=None, help='Only rebuild this election.')
+def rebuild_command(election_id):
+    """Recompute tallies from the votes table and the site counters."""
+    conn = get_db()
+    cursor = conn.cursor()
+    counters = []
+    try:
+        drift = find_drift(cursor, election_id)
+        rebuild(cursor, election_id)
+        if election_id is None:
+            counters = counter_drift(cursor)
+            rebuild_counters(cursor)
+        conn.commit()
+    except Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    _report(drift, counters)
+    click.echo(f'Rebuilt tallies, {len(drift) + len(counters)} row(s) corrected.')
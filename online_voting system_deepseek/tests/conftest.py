@@ -0,0 +1,156 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+# app.py builds the app when it is imported, so its settings must be in
+# place first: a scratch SQLite database and shared store, no background
+# job threads (tests run jobs themselves) and no admission control
+# (tests/test_admission.py covers it without the app)
+_SCRATCH = tempfile.mkdtemp(prefix='voting-tests-')
+SETTINGS = os.path.join(_SCRATCH, 'settings.py')
+with open(SETTINGS, 'w', encoding='utf-8') as f:
+    f.write(f"DB_BACKEND = 'sqlite'\n"
+            f"SQLITE_PATH = {os.path.join(_SCRATCH, 'voting.db')!r}\n"
+            f"SQLITE_SYNCHRONOUS = 'OFF'\n"
+            f"SHARED_STORE_DIR = {os.path.join(_SCRATCH, 'shared')!r}\n"
+            f"JOBS_WORKERS = 0\n"
+            f"ADMISSION_ENABLED = False\n"
+            f"PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'\n")
+os.environ['VOTING_SETTINGS'] = SETTINGS
+
+PASSWORD = 'test-password'
+
+
+def _reset(app):
+    """A fresh database and empty caches, as after a deploy."""
+    from db import dispose_pools, get_db
+    from election_index import init_election_index
+    from page_cache import init_page_cache
+    from results_cache import init_results_cache
+    from schema import upgrade
+    from vote_guard import init_vote_guard
+
+    with app.app_context():
+        dispose_pools()
+    path = app.config['SQLITE_PATH']
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    with app.app_context():
+        upgrade(get_db(), echo=lambda message: None, backend='sqlite')
+    app.extensions['shared_store'].reset()
+    app.extensions['shared_store'].drop_claims()
+    init_vote_guard(app)
+    init_results_cache(app)
+    init_election_index(app)
+    init_page_cache(app)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    from app import app as flask_app
+    _reset(flask_app)
+    monkeypatch.setitem(flask_app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    os.makedirs(flask_app.config['UPLOAD_FOLDER'])
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login_voter(client, voter_id):
+    with client.session_transaction() as session:
+        session['voter_id'] = voter_id
+        session['voter_name'] = f'Voter {voter_id}'
+
+
+def login_admin(client):
+    with client.session_transaction() as session:
+        session['admin_id'] = 1
+
+
+def run_jobs(app):
+    """Run every queued job in this thread; returns how many ran."""
+    runner = app.extensions['job_runner']
+    ran = 0
+    with app.app_context():
+        while runner.run_one():
+            ran += 1
+    return ran
+
+
+class Seed:
+    """Rows for a test, written straight to the database."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _insert(self, sql, args):
+        from db import get_db
+        with self.app.app_context():
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.execute(sql, args)
+            row_id = cursor.lastrowid
+            conn.commit()
+            cursor.close()
+        return row_id
+
+    def election(self, name='Test Election', active=True, opens=timedelta(hours=-1), closes=timedelta(days=1)):
+        now = datetime.now().replace(microsecond=0)
+        return self._insert(
+            "INSERT INTO elections (name, area, start_time, end_time, is_active) VALUES (%s, %s, %s, %s, %s)",
+            (name, 'Ward 1', now + opens, now + closes, active))
+
+    def candidates(self, election_id, count=3):
+        return [self._insert(
+            "INSERT INTO candidates (candidate_name, party_name, election_id) VALUES (%s, %s, %s)",
+            (f'Candidate {n}', f'Party {n}', election_id)) for n in range(1, count + 1)]
+
+    def voters(self, count=1, password=PASSWORD, method='pbkdf2:sha256:1000'):
+        from werkzeug.security import generate_password_hash
+        pwhash = generate_password_hash(password, method)
+        start = self.query("SELECT COALESCE(MAX(id), 0) FROM voters")[0][0]
+        return [self._insert(
+            "INSERT INTO voters (full_name, voter_id, email, password) VALUES (%s, %s, %s, %s)",
+            (f'Voter {start + n}', f'V{start + n:06d}', f'voter{start + n}@example.test', pwhash))
+            for n in range(1, count + 1)]
+
+    def vote(self, voter_id, candidate_id, election_id):
+        """Cast a vote the way cast_vote does: the guarded INSERT and the tally, in one transaction."""
+        import tallies
+        from db import get_db
+        with self.app.app_context():
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.execute(tallies.INSERT_VOTE_SQL, (voter_id, candidate_id, election_id))
+            inserted = cursor.rowcount
+            if inserted:
+                tallies.record_vote(cursor, election_id, candidate_id)
+            conn.commit()
+            cursor.close()
+        return bool(inserted)
+
+    def query(self, sql, args=None):
+        from db import get_db
+        with self.app.app_context():
+            conn = get_db()
+            cursor = conn.cursor()
+            cursor.execute(sql, args)
+            rows = cursor.fetchall()
+            conn.commit()
+            cursor.close()
+        return rows
+
+
+@pytest.fixture
+def seed(app):
+    return Seed(app)
@@ -0,0 +1,125 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import admission
+from admission import AdmissionControl, TokenBuckets, route_class
+from conftest import login_admin
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission, 'time', SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_burst_then_rate(clock):
+    buckets = TokenBuckets(rate=2, burst=3)
+    assert [buckets.allow('a') for _ in range(4)] == [True, True, True, False]
+    # Other keys have buckets of their own
+    assert buckets.allow('b')
+
+    clock[0] += 0.5
+    assert buckets.allow('a') and not buckets.allow('a')
+    # Idle time refills up to the burst, no further
+    clock[0] += 60
+    assert [buckets.allow('a') for _ in range(4)] == [True, True, True, False]
+    assert buckets.stats() == {'keys': 2, 'max_keys': 100000, 'limited': 3, 'evicted': 0}
+
+
+@pytest.mark.parametrize('rate, seconds', [(2, 1), (0.5, 2), (0.1, 10)])
+def test_retry_after(rate, seconds):
+    assert TokenBuckets(rate=rate, burst=1).retry_after() == seconds
+
+
+def test_longest_idle_key_evicted(clock):
+    buckets = TokenBuckets(rate=1, burst=1, max_keys=2)
+    buckets.allow('a')
+    buckets.allow('b')
+    clock[0] += 0.1
+    # Using a key makes it the most recent
+    buckets.allow('a')
+    buckets.allow('c')
+    assert list(buckets._buckets) == ['a', 'c']
+    assert buckets.stats()['evicted'] == 1
+    # An evicted key starts again with a full bucket
+    assert buckets.allow('b')
+
+
+def test_route_classes():
+    assert route_class('cast_vote') == 'vote'
+    assert route_class('admin_login') == 'login'
+    assert route_class('admin_voters') == 'admin'
+    assert route_class('admin_turnout_stream') is None
+    assert route_class('static') is None and route_class(None) is None
+
+
+def _control(max_wait=0.05):
+    return AdmissionControl({
+        'vote': {'priority': 0, 'limit': 1, 'queue': 1},
+        'admin': {'priority': 1, 'limit': 1, 'queue': 1},
+    }, total=1, max_wait=max_wait)
+
+
+def test_queue_full_and_timeout_shed():
+    control = _control()
+    assert control.acquire('vote') is None
+    assert control.acquire('admin') == 'timeout'
+    control.release('vote')
+    assert control.acquire('admin') is None
+
+    classes = control.stats()['classes']
+    assert (classes['admin']['admitted'], classes['admin']['shed_timeout']) == (1, 1)
+    assert control.stats()['running'] == 1 and control.stats()['queued'] == 0
+
+
+def test_waiters_admitted_by_priority():
+    control = _control(max_wait=5)
+    assert control.acquire('admin') is None
+    admitted = []
+
+    def wait(name):
+        assert control.acquire(name) is None
+        admitted.append(name)
+        control.release(name)
+
+    threads = [threading.Thread(target=wait, args=(name,)) for name in ('admin', 'vote')]
+    for thread in threads:
+        thread.start()
+        while control.stats()['queued'] < threads.index(thread) + 1:
+            time.sleep(0.001)
+    # The queue for each class is one deep
+    assert control.acquire('vote') == 'queue_full'
+
+    control.release('admin')
+    for thread in threads:
+        thread.join(5)
+    assert admitted == ['vote', 'admin']
+    assert control.stats()['classes']['vote']['shed_queue_full'] == 1
+
+
+def test_streamed_downloads_exempt():
+    # They hold their slot for as long as the client takes to download
+    for endpoint in ('admin_export', 'admin_export_manifest', 'admin_voters_export', 'admin_turnout_stream'):
+        assert route_class(endpoint) is None
+
+
+def test_roster_download_shares_export_cap(app, client):
+    login_admin(client)
+    slots = app.extensions['export_slots']
+    held = 0
+    while slots.acquire(blocking=False):
+        held += 1
+    try:
+        assert client.get('/admin/voters/export.csv').status_code == 503
+    finally:
+        for _ in range(held):
+            slots.release()
+    response = client.get('/admin/voters/export.csv')
+    assert response.status_code == 200 and response.data.startswith(b'id,full_name')
+    response.close()
+    assert slots.acquire(blocking=False)
+    slots.release()
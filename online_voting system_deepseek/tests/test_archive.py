@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import archive
+from conftest import login_admin, run_jobs
+from db import get_db
+from vote_journal import JournalBehind, VoteJournal, wait_for_writers
+
+
+def _completed(seed, votes=3):
+    election = seed.election()
+    candidates = seed.candidates(election, 2)
+    for n, voter in enumerate(seed.voters(votes)):
+        seed.vote(voter, candidates[n % 2], election)
+    seed.query("UPDATE elections SET is_active = FALSE WHERE id = %s", (election,))
+    return election, candidates
+
+
+def _archive(app, election, **kwargs):
+    with app.app_context():
+        return archive.archive_election(get_db(), election, **kwargs)
+
+
+def _verify(app, election):
+    with app.app_context():
+        return archive.verify_archive(get_db(), election)
+
+
+@pytest.mark.parametrize('move_votes', [False, True], ids=['kept', 'moved'])
+def test_archive_checks_out(app, seed, move_votes):
+    election, _ = _completed(seed)
+    assert _archive(app, election, move_votes=move_votes, chunk_size=2)[0] == 3
+    assert _verify(app, election) == []
+    assert seed.query("SELECT COUNT(*) FROM votes")[0][0] == (0 if move_votes else 3)
+
+
+def test_verify_finds_tampering(app, seed):
+    election, (first, _) = _completed(seed)
+    _archive(app, election)
+    seed.query("UPDATE vote_tallies SET vote_count = vote_count + 1 WHERE candidate_id = %s", (first,))
+    seed.query("DELETE FROM votes WHERE id = (SELECT MIN(id) FROM votes)")
+    seed.query("UPDATE election_archives SET ledger_sha256 = %s", ('0' * 64,))
+    assert _verify(app, election) == [
+        'ledger checksum does not match',
+        'vote_tallies differ from the ledger',
+        'rows in votes differ from the ledger',
+    ]
+    assert _verify(app, election + 1) == [f'election {election + 1} has no archive']
+
+
+def test_refused_while_active_or_drifting(app, seed):
+    election = seed.election()
+    with pytest.raises(archive.ArchiveError, match='not completed'):
+        _archive(app, election)
+
+    election, (first, _) = _completed(seed)
+    seed.query("UPDATE vote_tallies SET vote_count = 7 WHERE candidate_id = %s", (first,))
+    with pytest.raises(archive.ArchiveError, match='do not match'):
+        _archive(app, election)
+
+
+def test_ledger_heartbeat(app, seed):
+    election, _ = _completed(seed, votes=5)
+    beats = []
+    with app.app_context():
+        ledger, digest, counts = archive.build_ledger(get_db(), election, progress=beats.append, every=2)
+    assert beats == [2, 4]
+    assert archive.scan_ledger([ledger]) == (digest, 5, counts)
+
+
+def test_format_1_archive_read(app, seed):
+    election, _ = _completed(seed)
+    _archive(app, election)
+    # Archived before ledgers were stored in pieces
+    seed.query("UPDATE election_archives SET format = 1, ledger = (SELECT data FROM election_archive_ledger)")
+    seed.query("DELETE FROM election_archive_ledger")
+    assert _verify(app, election) == []
+
+
+def test_ledger_stored_in_pieces(app, seed, monkeypatch, tmp_path):
+    election, _ = _completed(seed, votes=20)
+    monkeypatch.setattr(archive, 'LEDGER_PIECE', 64)
+    size = _archive(app, election)[1]
+    pieces = seed.query("SELECT LENGTH(data) FROM election_archive_ledger WHERE election_id = %s ORDER BY seq",
+                        (election,))
+    assert len(pieces) > 1 and max(n for n, in pieces) == 64 and sum(n for n, in pieces) == size
+    assert _verify(app, election) == []
+
+    output = tmp_path / 'ledger.csv'
+    result = app.test_cli_runner().invoke(args=['archive', 'ledger', str(election), str(output)])
+    assert result.exit_code == 0
+    raw = output.read_bytes()
+    assert raw.startswith(archive.LEDGER_HEADER) and raw.count(b'\n') == 21
+
+
+def _journal_file(directory, entries):
+    # What a process that died before its writer caught up leaves behind
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'votes-0.journal'), 'w', encoding='utf-8') as f:
+        for seq, (voter, candidate, election, voted_at) in enumerate(entries, 1):
+            f.write(json.dumps({'seq': seq, 'voter_id': voter, 'candidate_id': candidate,
+                                'election_id': election,
+                                'voted_at': voted_at.isoformat(sep=' ', timespec='seconds')}) + '\n')
+
+
+def test_wait_for_writers(app, seed, tmp_path):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    directory = str(tmp_path / 'journal')
+    earlier = datetime.now() - timedelta(minutes=1)
+    _journal_file(directory, [(voter, candidate, election, earlier) for voter in seed.voters(2)])
+
+    beats = []
+    with app.app_context():
+        with pytest.raises(JournalBehind):
+            wait_for_writers(directory, 0.05, lambda: beats.append(1), interval=0.01)
+    assert beats
+
+    journal = VoteJournal(app, directory, flush_interval=0.01)
+    with app.app_context():
+        journal.start()
+        wait_for_writers(directory, 5, interval=0.01)
+    assert seed.query("SELECT COUNT(*) FROM votes")[0][0] == 2
+
+
+def test_completion_waits_for_journaled_votes(app, seed, client, tmp_path, monkeypatch):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    before, after = seed.voters(2)
+    directory = str(tmp_path / 'journal')
+    monkeypatch.setitem(app.config, 'VOTE_JOURNAL_DIR', directory)
+    now = datetime.now()
+    _journal_file(directory, [(before, candidate, election, now - timedelta(minutes=1)),
+                              (after, candidate, election, now + timedelta(minutes=1))])
+
+    login_admin(client)
+    client.post(f'/admin/election/complete/{election}')
+    # The writer only comes back once the job is already waiting for it
+    journal = VoteJournal(app, directory, flush_interval=0.01)
+
+    def start():
+        with app.app_context():
+            journal.start()
+    threading.Timer(0.2, start).start()
+    run_jobs(app)
+
+    job = seed.query("SELECT status, message FROM jobs")[0]
+    assert job == ('done', 'Results frozen')
+    # The vote journaled before completion is archived; the later one refused
+    assert seed.query("SELECT vote_count FROM election_archives WHERE election_id = %s", (election,)) == [(1,)]
+    assert _verify(app, election) == []
+    assert journal.stats()['failed'] == 1
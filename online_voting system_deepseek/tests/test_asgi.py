@@ -0,0 +1,25 @@
+import pytest
+from flask import session
+
+asgi = pytest.importorskip('asgi')
+
+
+def _scope(headers):
+    return {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'http_version': '2',
+            'headers': [(name.encode(), value.encode()) for name, value in headers]}
+
+
+def test_repeated_headers_joined():
+    environ = asgi._environ(_scope([('cookie', 'session=abc'), ('cookie', 'theme=dark'),
+                                    ('accept', 'text/html'), ('accept', 'text/plain')]), b'')
+    assert environ['HTTP_COOKIE'] == 'session=abc; theme=dark'
+    assert environ['HTTP_ACCEPT'] == 'text/html,text/plain'
+
+
+def test_session_from_split_cookie_headers(app, client):
+    with client.session_transaction() as stored:
+        stored['admin_id'] = 1
+    cookie = client.get_cookie('session').value
+    environ = asgi._environ(_scope([('cookie', 'theme=dark'), ('cookie', f'session={cookie}')]), b'')
+    with app.request_context(environ):
+        assert session.get('admin_id') == 1
@@ -0,0 +1,244 @@
+"""The MySQL and SQLite backends serve the same pages.
+
+Both databases are seeded identically (benchmarks/load_test.py seed), then
+one scripted session is replayed against each backend in a process of its
+own, since the app binds its database when it is imported. Background jobs
+run inside the crawl after each step, in order, so the job pages can be
+compared too. Each response's status, redirect target and body digest are
+recorded; timestamps in bodies are masked first, and steps whose bodies
+carry counters or generation times (VOLATILE) are compared by status only.
+
+The SQLite crawl always runs. The MySQL crawl, and the comparison, run when
+VOTING_TEST_MYSQL_DB names a scratch database on the configured server;
+it is wiped.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import struct
+import subprocess
+import sys
+import zlib
+from argparse import Namespace
+from datetime import datetime, timedelta
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'benchmarks'))
+
+_TIMESTAMP = re.compile(rb'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(:\d{2})?(\.\d+)?')
+
+# Bodies that differ from run to run on either backend
+VOLATILE = {'export votes gzip', 'export manifest', 'admin metrics', 'turnout stream'}
+
+
+def _png(width=2, height=2):
+    """A small valid PNG, the same bytes on every run."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\x00' + b'\xcc\x22\x22' * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+PNG = _png()
+
+
+def _uploads(**files):
+    # Every candidate form posts both file fields, empty when unused
+    fields = {'photo': (io.BytesIO(), ''), 'symbol': (io.BytesIO(), '')}
+    fields.update({field: (io.BytesIO(PNG), name) for field, name in files.items()})
+    return fields
+
+
+def _steps(open_id, other_id, completed_id, first_candidate, last_candidate, other_candidate):
+    """(step, method, url, request kwargs, expected status); a url of None follows the last redirect."""
+    from load_test import PASSWORD
+    start = datetime.now().replace(microsecond=0)
+    voter_login = {'data': {'identifier': 'BENCH1@EXAMPLE.TEST', 'password': PASSWORD}}
+    return [
+        ('home', 'get', '/', {}, 302),
+        ('register form', 'get', '/voter/register', {}, 200),
+        ('register', 'post', '/voter/register', {'data': {
+            'full_name': 'Parity Voter', 'voter_id': 'PARITY1', 'email': 'parity@example.test',
+            'password': PASSWORD}}, 302),
+        ('register duplicate', 'post', '/voter/register', {'data': {
+            'full_name': 'Parity Voter', 'voter_id': 'parity1', 'email': 'other@example.test',
+            'password': PASSWORD}}, 200),
+        ('login wrong password', 'post', '/voter/login', {'data': {
+            'identifier': 'BENCH00000001', 'password': 'wrong'}}, 200),
+        ('login email other case', 'post', '/voter/login', voter_login, 302),
+        ('dashboard', 'get', '/voter/dashboard', {}, 200),
+        ('elections', 'get', '/voter/elections', {}, 200),
+        ('ballot', 'get', f'/voter/candidates/{open_id}', {}, 200),
+        ('ballot closed election', 'get', f'/voter/candidates/{completed_id}', {}, 302),
+        ('vote', 'post', f'/vote/{first_candidate}', {'data': {'election_id': open_id}}, 302),
+        ('vote again', 'post', f'/vote/{last_candidate}', {'data': {'election_id': open_id}}, 302),
+        ('vote closed election', 'post', f'/vote/{first_candidate}', {'data': {'election_id': completed_id}}, 302),
+        ('dashboard after vote', 'get', '/voter/dashboard', {}, 200),
+        ('results list', 'get', '/voter/results/select', {}, 200),
+        ('results unpublished', 'get', f'/voter/results/{completed_id}', {}, 302),
+        ('logout', 'get', '/logout', {}, 302),
+        ('admin login', 'post', '/admin/login', {'data': {'username': 'admin', 'password': 'admin@123'}}, 302),
+        ('admin dashboard', 'get', '/admin/dashboard', {}, 200),
+        ('add election', 'post', '/admin/election/add', {'data': {
+            'election_name': 'Parity Election', 'area': 'Ward P',
+            'start_time': start.isoformat(timespec='minutes'),
+            'end_time': (start + timedelta(days=1)).isoformat(timespec='minutes')}}, 302),
+        ('admin elections', 'get', '/admin/elections', {}, 200),
+        ('add candidate form', 'get', f'/admin/candidate/add/{other_id}', {}, 200),
+        ('add candidate with photo', 'post', f'/admin/candidate/add/{other_id}', {'data': {
+            'candidate_name': 'Parity Candidate', 'party_name': 'Parity Party',
+            **_uploads(photo='photo.png')}}, 302),
+        ('edit candidate with symbol', 'post', f'/admin/candidate/edit/{other_candidate}', {'data': {
+            'candidate_name': 'Renamed Candidate', 'party_name': 'Party 1',
+            **_uploads(symbol='symbol.png')}}, 302),
+        ('admin candidates after upload', 'get', f'/admin/candidates/{other_id}', {}, 200),
+        ('media', 'get', f'/media/{hashlib.sha256(PNG).hexdigest()}.png', {}, 200),
+        ('media missing', 'get', f'/media/{"0" * 64}.png', {}, 404),
+        ('admin candidates', 'get', f'/admin/candidates/{open_id}', {}, 200),
+        ('admin voters', 'get', '/admin/voters', {}, 200),
+        ('voters export', 'get', '/admin/voters/export.csv', {}, 200),
+        ('voters export filtered', 'get', f'/admin/voters/export.csv?election_id={open_id}&status=voted', {}, 200),
+        ('admin results', 'get', f'/admin/results/{open_id}', {}, 200),
+        ('complete election', 'post', f'/admin/election/complete/{open_id}', {}, 302),
+        ('complete election job', 'get', None, {}, 200),
+        ('admin results archived', 'get', f'/admin/results/{open_id}', {}, 200),
+        ('delete candidate', 'get', f'/admin/candidate/delete/{last_candidate}', {}, 302),
+        ('delete candidate job', 'get', None, {}, 200),
+        ('admin jobs', 'get', '/admin/jobs', {}, 200),
+        ('admin candidates after delete', 'get', f'/admin/candidates/{open_id}', {}, 200),
+        ('export results', 'get', f'/admin/export/{open_id}/results', {}, 200),
+        ('export votes', 'get', f'/admin/export/{open_id}/votes', {}, 200),
+        ('export votes jsonl', 'get', f'/admin/export/{open_id}/votes?format=jsonl', {}, 200),
+        ('export votes gzip', 'get', f'/admin/export/{open_id}/votes?gzip=1', {}, 200),
+        ('export manifest', 'get', f'/admin/export/{open_id}/manifest.json', {}, 200),
+        ('export unknown dataset', 'get', f'/admin/export/{open_id}/ballots', {}, 404),
+        ('export unknown format', 'get', f'/admin/export/{open_id}/votes?format=xml', {}, 400),
+        ('admin metrics', 'get', '/admin/metrics', {}, 200),
+        ('turnout stream', 'stream', '/admin/turnout/stream', {}, 200),
+        ('publish results', 'post', f'/admin/publish_results/{completed_id}', {}, 302),
+        ('publish results job', 'get', None, {}, 200),
+        ('admin logout', 'get', '/logout', {}, 302),
+        ('login after publishing', 'post', '/voter/login', voter_login, 302),
+        ('results published', 'get', f'/voter/results/{completed_id}', {}, 200),
+        ('results of election completed today', 'get', f'/voter/results/{open_id}', {}, 200),
+    ]
+
+
+def crawl():
+    """Replay the session against the app's database; returns [[step, status, location, digest]]."""
+    from db import get_db
+    from wsgi import load_app
+
+    app = load_app(warm_up=False)
+
+    # Config.init_app() puts uploads back under static/, whatever the settings say
+    app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.environ['VOTING_SETTINGS']), 'uploads')
+    with app.app_context():
+        cursor = get_db().cursor()
+        cursor.execute("SELECT MIN(id), MAX(id) FROM elections WHERE is_active = TRUE")
+        open_id, other_id = cursor.fetchone()
+        cursor.execute("SELECT MIN(id) FROM elections WHERE is_active = FALSE")
+        completed_id = cursor.fetchone()[0]
+        cursor.execute("SELECT MIN(id), MAX(id) FROM candidates WHERE election_id = %s", (open_id,))
+        first_candidate, last_candidate = cursor.fetchone()
+        cursor.execute("SELECT MIN(id) FROM candidates WHERE election_id = %s", (other_id,))
+        other_candidate = cursor.fetchone()[0]
+        cursor.close()
+
+    runner = app.extensions['job_runner']
+    client = app.test_client()
+    results = []
+    location = None
+    for name, method, url, kwargs, _ in _steps(open_id, other_id, completed_id,
+                                               first_candidate, last_candidate, other_candidate):
+        if method == 'stream':
+            # An open event stream: the first event is enough
+            response = client.get(url, buffered=False)
+            body = next(response.response)
+        else:
+            response = getattr(client, method)(url or location, **kwargs)
+            body = response.get_data()
+        # Closing releases the export and stream slots
+        response.close()
+        # No runner threads: jobs run here, between steps
+        with app.app_context():
+            while runner.run_one():
+                pass
+        location = response.headers.get('Location')
+        digest = None if name in VOLATILE else hashlib.sha1(_TIMESTAMP.sub(b'<time>', body)).hexdigest()[:12]
+        results.append([name, response.status_code, location, digest])
+    return results
+
+
+def _settings(directory, backend, db):
+    path = os.path.join(directory, 'settings.py')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"DB_BACKEND = {backend!r}\n"
+                f"{'SQLITE_PATH' if backend == 'sqlite' else 'MYSQL_DB'} = {db!r}\n"
+                f"SHARED_STORE_DIR = {os.path.join(directory, 'shared')!r}\n"
+                f"VOTE_JOURNAL_DIR = {os.path.join(directory, 'journal')!r}\n"
+                f"JOBS_WORKERS = 0\n"
+                f"ADMISSION_ENABLED = False\n")
+    return path
+
+
+def _run_crawl(directory, backend, db):
+    from load_test import connect, seed
+    seed(Namespace(db=db, backend=backend, create_schema=True, voters=50, elections=2, candidates=4))
+    # Seeding publishes results; the crawl publishes them itself
+    conn = connect(db, backend)
+    cursor = conn.cursor()
+    cursor.execute("UPDATE admin_settings SET results_published = FALSE WHERE id = 1")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    os.makedirs(os.path.join(directory, 'uploads'))
+    env = dict(os.environ, VOTING_SETTINGS=_settings(directory, backend, db))
+    output = subprocess.run([sys.executable, os.path.abspath(__file__)], cwd=APP_DIR, env=env,
+                            capture_output=True, text=True, timeout=300)
+    assert output.returncode == 0, output.stderr
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+BACKENDS = [
+    'sqlite',
+    pytest.param('mysql', marks=pytest.mark.skipif(
+        not os.environ.get('VOTING_TEST_MYSQL_DB'), reason='VOTING_TEST_MYSQL_DB is not set')),
+]
+
+
+@pytest.fixture(scope='module')
+def crawls(tmp_path_factory):
+    runs = {}
+
+    def run(backend):
+        if backend not in runs:
+            directory = str(tmp_path_factory.mktemp(f'parity-{backend}'))
+            db = os.path.join(directory, 'parity.db') if backend == 'sqlite' else os.environ['VOTING_TEST_MYSQL_DB']
+            runs[backend] = _run_crawl(directory, backend, db)
+        return runs[backend]
+    return run
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_crawl_statuses(crawls, backend):
+    expected = [(name, status) for name, _, _, _, status in _steps(*range(6))]
+    assert [(name, status) for name, status, _, _ in crawls(backend)] == expected
+
+
+@pytest.mark.skipif(not os.environ.get('VOTING_TEST_MYSQL_DB'), reason='VOTING_TEST_MYSQL_DB is not set')
+def test_backends_agree(crawls):
+    differing = [(mine, theirs) for mine, theirs in zip(crawls('mysql'), crawls('sqlite')) if mine != theirs]
+    assert differing == []
+
+
+if __name__ == '__main__':
+    print(json.dumps(crawl()))
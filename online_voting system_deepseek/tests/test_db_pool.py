@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from db import PoolTimeout, get_db, get_pool
+from sqlite_db import SQLitePool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    return SQLitePool({'path': str(tmp_path / 'pool.db')}, pool_size=2, max_overflow=1, timeout=0.2)
+
+
+def test_checkin_reuses_connection(pool):
+    conn = pool.checkout()
+    pool.checkin(conn)
+    assert pool.checkout() is conn
+    assert pool.stats()['open'] == 1
+
+
+def test_overflow_then_timeout(pool):
+    conns = [pool.checkout() for _ in range(3)]
+    assert pool.stats()['in_use'] == 3
+    with pytest.raises(PoolTimeout):
+        pool.checkout()
+    assert pool.stats()['timeouts'] == 1
+
+    # Only pool_size connections are kept idle; the overflow one is closed
+    for conn in conns:
+        pool.checkin(conn)
+    stats = pool.stats()
+    assert (stats['open'], stats['idle'], stats['in_use']) == (2, 2, 0)
+
+
+def test_waiter_gets_returned_connection(pool):
+    pool.timeout = 5
+    conns = [pool.checkout() for _ in range(3)]
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.checkout()))
+    waiter.start()
+    pool.checkin(conns[0])
+    waiter.join(5)
+    assert got == [conns[0]]
+
+
+def test_checkin_rolls_back(pool):
+    conn = pool.checkout()
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE t (n INTEGER)")
+    conn.commit()
+    cursor.execute("INSERT INTO t (n) VALUES (%s)", (1,))
+    pool.checkin(conn)
+    conn = pool.checkout()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM t")
+    assert cursor.fetchone()[0] == 0
+
+
+def test_dispose_drops_idle(pool):
+    conn = pool.checkout()
+    pool.checkin(conn)
+    pool.dispose()
+    assert pool.stats()['open'] == 0
+    assert pool.checkout() is not conn
+
+
+def test_dispose_drops_checked_out_on_checkin(pool):
+    conn = pool.checkout()
+    pool.dispose()
+    pool.checkin(conn)
+    stats = pool.stats()
+    assert (stats['open'], stats['idle'], stats['discarded']) == (0, 0, 1)
+    fresh = pool.checkout()
+    assert fresh is not conn
+    pool.checkin(fresh)
+    assert pool.checkout() is fresh
+
+
+def test_one_connection_per_request(app):
+    with app.test_request_context():
+        pool = get_pool()
+        assert get_db() is get_db()
+        assert pool.stats()['in_use'] == 1
+    assert pool.stats()['in_use'] == 0
+
+
+def test_capture_keeps_statements_sharing_a_prefix(app, tmp_path, monkeypatch):
+    import db
+    from schema import load_captured
+    path = tmp_path / 'captured.jsonl'
+    monkeypatch.setattr(db, 'sql_capture', open(path, 'w', encoding='utf-8'))
+    monkeypatch.setattr(db, '_captured', set())
+    columns = ', '.join(f'id AS column_{n}' for n in range(30))
+    statements = [f'SELECT {columns} FROM voters WHERE id = %s',
+                  f'SELECT {columns} FROM elections WHERE id = %s']
+    with app.app_context():
+        cursor = get_db().cursor()
+        for sql in statements + statements:
+            cursor.execute(sql, (1,))
+        cursor.close()
+    db.sql_capture.close()
+    assert [sql for sql, _ in load_captured(path)] == statements
@@ -0,0 +1,92 @@
+import io
+from datetime import datetime, timedelta
+
+from conftest import login_admin, login_voter
+from election_index import ElectionIndex
+
+
+def _index(app):
+    return app.extensions['election_index']
+
+
+def test_open_elections_by_window(app, seed):
+    open_now = seed.election('Open')
+    seed.election('Later', opens=timedelta(hours=1))
+    seed.election('Over', opens=timedelta(days=-2), closes=timedelta(days=-1))
+    seed.election('Closed', active=False)
+    with app.app_context():
+        assert [e['id'] for e in _index(app).open_elections(datetime.now())] == [open_now]
+
+
+def test_ballot(app, seed):
+    election = seed.election()
+    candidates = seed.candidates(election, 2)
+    later = seed.election(opens=timedelta(hours=1))
+    now = datetime.now()
+    with app.app_context():
+        found, ballot = _index(app).ballot(election, now)
+        assert found['id'] == election and [c['id'] for c in ballot] == candidates
+        assert _index(app).ballot(later, now) == (None, [])
+        assert _index(app).ballot(later, now + timedelta(hours=2))[0]['id'] == later
+
+
+def test_loaded_once_until_invalidated(app, seed):
+    election = seed.election()
+    index = _index(app)
+    with app.app_context():
+        index.open_elections(datetime.now())
+        index.open_elections(datetime.now())
+        assert index.stats()['db_loads'] == 1
+
+        seed.candidates(election, 1)
+        assert index.ballot(election, datetime.now())[1] == []
+        fingerprint = index.fingerprint(election)
+        index.invalidate()
+        assert len(index.ballot(election, datetime.now())[1]) == 1
+        assert index.fingerprint(election) != fingerprint
+        assert index.stats()['db_loads'] == 2
+
+
+def test_one_load_serves_every_process(app, seed):
+    seed.election()
+    index = _index(app)
+    # A second index on the same shared store stands in for another worker
+    other = ElectionIndex(app.extensions['shared_store'], ttl=60)
+    with app.app_context():
+        assert len(index.open_elections(datetime.now())) == 1
+        assert len(other.open_elections(datetime.now())) == 1
+        assert other.stats()['db_loads'] == 0
+
+        seed.election()
+        other.invalidate()
+        assert len(index.open_elections(datetime.now())) == 2
+
+
+def test_ttl_bounds_staleness(app, seed):
+    index = _index(app)
+    index.ttl = 0
+    with app.app_context():
+        assert index.open_elections(datetime.now()) == []
+        seed.election()
+        assert len(index.open_elections(datetime.now())) == 1
+
+
+def test_admin_changes_reach_the_ballot(app, seed, client):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voter, = seed.voters()
+    login_voter(client, voter)
+    assert b'Candidate 1' in client.get(f'/voter/candidates/{election}').data
+
+    login_admin(client)
+    client.post(f'/admin/candidate/edit/{candidate}', data={
+        'candidate_name': 'Renamed', 'party_name': 'Party 1',
+        'photo': (io.BytesIO(), ''), 'symbol': (io.BytesIO(), '')})
+    login_voter(client, voter)
+    assert b'Renamed' in client.get(f'/voter/candidates/{election}').data
+
+    login_admin(client)
+    client.post(f'/admin/election/complete/{election}')
+    login_voter(client, voter)
+    response = client.get(f'/voter/candidates/{election}')
+    assert response.headers['Location'] == '/voter/elections'
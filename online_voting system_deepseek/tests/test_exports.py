@@ -0,0 +1,39 @@
+import hashlib
+
+from conftest import login_admin, run_jobs
+
+
+def _election_with_votes(seed):
+    election = seed.election()
+    candidates = seed.candidates(election, 2)
+    for n, voter in enumerate(seed.voters(3)):
+        seed.vote(voter, candidates[n % 2], election)
+    return election
+
+
+def test_manifest_only_for_archived_elections(app, seed, client, monkeypatch):
+    election = _election_with_votes(seed)
+    login_admin(client)
+    assert client.get(f'/admin/export/{election}/manifest.json').status_code == 409
+
+    # Completed but not archived: its votes can still be deleted
+    monkeypatch.setitem(app.config, 'ARCHIVE_ON_COMPLETE', False)
+    client.post(f'/admin/election/complete/{election}')
+    run_jobs(app)
+    assert client.get(f'/admin/export/{election}/manifest.json').status_code == 409
+
+
+def test_manifest_matches_downloads(app, seed, client):
+    election = _election_with_votes(seed)
+    login_admin(client)
+    client.post(f'/admin/election/complete/{election}')
+    run_jobs(app)
+
+    manifest = client.get(f'/admin/export/{election}/manifest.json?gzip=1').get_json()
+    for entry in manifest['files']:
+        response = client.get(f"/admin/export/{election}/{entry['dataset']}?gzip=1")
+        assert hashlib.sha256(response.data).hexdigest() == entry['sha256']
+        assert len(response.data) == entry['bytes']
+        response.close()
+    votes, = [entry for entry in manifest['files'] if entry['dataset'] == 'votes']
+    assert votes['rows'] == 3 and votes['ledger_sha256'] == manifest['archive_ledger_sha256']
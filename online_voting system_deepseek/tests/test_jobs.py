@@ -0,0 +1,162 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+import sqlite_db
+from conftest import login_admin, run_jobs
+from jobs import JobContext, JobRunner
+
+calls = []
+
+
+@jobs.job('test_flaky')
+def flaky_job(ctx, fail):
+    calls.append(ctx.job_id)
+    ctx.progress(1, 2, 'Halfway')
+    if fail:
+        raise RuntimeError('still failing')
+
+
+@pytest.fixture
+def runner(app):
+    calls.clear()
+    runner = JobRunner(app, workers=0, lease=60, retry_backoff=10)
+    # Reap on the first claim
+    runner._last_reap = float('-inf')
+    return runner
+
+
+def _enqueue(app, **args):
+    with app.app_context():
+        return jobs.enqueue('test_flaky', **args)
+
+
+def _run(app, runner):
+    with app.app_context():
+        return runner.run_one()
+
+
+def _job(seed, job_id):
+    return dict(zip(('status', 'attempts', 'run_after', 'message', 'locked_by'), seed.query(
+        "SELECT status, attempts, run_after, message, locked_by FROM jobs WHERE id = %s", (job_id,))[0]))
+
+
+def test_identical_job_reused(app):
+    first = _enqueue(app, fail=False)
+    assert _enqueue(app, fail=False) == first
+    assert _enqueue(app, fail=True) != first
+
+
+def test_retried_with_backoff_then_failed(app, seed, runner):
+    job_id = _enqueue(app, fail=True)
+    for attempt in (1, 2):
+        assert _run(app, runner)
+        job = _job(seed, job_id)
+        assert (job['status'], job['attempts'], job['locked_by']) == ('queued', attempt, None)
+        delay = (job['run_after'] - datetime.now()).total_seconds()
+        assert delay == pytest.approx(10 * 2 ** (attempt - 1), abs=5)
+        # Not due yet
+        assert not _run(app, runner)
+        seed.query("UPDATE jobs SET run_after = %s", (datetime.now() - timedelta(days=1),))
+
+    assert _run(app, runner)
+    assert _job(seed, job_id)['status'] == 'failed'
+    assert calls == [job_id] * 3
+    assert (runner.stats()['retried'], runner.stats()['failed']) == (2, 1)
+
+
+def _running(seed, job_id, locked_at, attempts):
+    seed.query("UPDATE jobs SET status = 'running', locked_by = 'gone:1', locked_at = %s, attempts = %s "
+               "WHERE id = %s", (locked_at, attempts, job_id))
+
+
+def test_expired_lease_requeued(app, seed, runner):
+    job_id = _enqueue(app, fail=False)
+    _running(seed, job_id, datetime.now() - timedelta(minutes=5), 1)
+    assert _run(app, runner)
+    job = _job(seed, job_id)
+    assert (job['status'], job['attempts'], job['message']) == ('done', 2, 'Halfway')
+    assert calls == [job_id]
+
+
+def test_expired_lease_out_of_attempts_fails(app, seed, runner):
+    job_id = _enqueue(app, fail=False)
+    _running(seed, job_id, datetime.now() - timedelta(minutes=5), 3)
+    assert not _run(app, runner)
+    assert _job(seed, job_id)['status'] == 'failed'
+    assert seed.query("SELECT error FROM jobs")[0][0] == 'Worker stopped responding'
+
+
+def test_heartbeat_keeps_lease(app, seed, runner):
+    job_id = _enqueue(app, fail=False)
+    _running(seed, job_id, datetime.now() - timedelta(minutes=5), 1)
+    with app.app_context():
+        JobContext(runner, job_id).progress(1, message='Still here')
+    assert not _run(app, runner)
+    assert _job(seed, job_id)['status'] == 'running'
+
+
+def test_claimed_by_one_runner(app, seed, runner):
+    job_id = _enqueue(app, fail=False)
+    other = JobRunner(app, workers=0)
+    other.name = 'other:1'
+    with app.app_context():
+        claimed = runner._claim()
+        assert claimed['id'] == job_id and claimed['locked_by'] == runner.name
+        assert other._claim() is None
+    assert not _run(app, other)
+
+
+def _heartbeats(monkeypatch):
+    messages = []
+    progress = JobContext.progress
+
+    def record(self, done, total=None, message=None):
+        messages.append(message)
+        progress(self, done, total, message)
+    monkeypatch.setattr(JobContext, 'progress', record)
+    return messages
+
+
+def test_completion_heartbeats(app, seed, client, monkeypatch):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voter, = seed.voters()
+    seed.vote(voter, candidate, election)
+    messages = _heartbeats(monkeypatch)
+    login_admin(client)
+    client.post(f'/admin/election/complete/{election}')
+    run_jobs(app)
+    assert messages == ['Archiving the vote ledger', 'Vote ledger archived', 'Freezing results', 'Results frozen']
+
+
+def test_publishing_heartbeats(app, seed, client, monkeypatch):
+    for _ in range(2):
+        seed.election(active=False)
+    messages = _heartbeats(monkeypatch)
+    login_admin(client)
+    client.post('/admin/publish_results/1')
+    run_jobs(app)
+    assert messages == ['Freezing results', 'Freezing results', 'Publishing results', 'Results published']
+
+
+@pytest.mark.parametrize('skew', ['-3 hours', '+3 hours'])
+def test_database_clock_not_mixed_with_ours(app, seed, runner, monkeypatch, skew):
+    # The database's clock is hours off this process's
+    monkeypatch.setattr(sqlite_db, '_CLOCK', f"'now', 'localtime', '{skew}'")
+    sqlite_db.translate.cache_clear()
+    try:
+        fresh = _enqueue(app, fail=False)
+        seed.query("UPDATE jobs SET status = 'running', locked_by = 'other:1', locked_at = CURRENT_TIMESTAMP, "
+                   "attempts = 1 WHERE id = %s", (fresh,))
+        failing = _enqueue(app, fail=True)
+        # Column defaults are not skewed here
+        seed.query("UPDATE jobs SET run_after = CURRENT_TIMESTAMP")
+        assert _run(app, runner)
+        # The other runner's lease has not expired, and the retry is not due
+        assert _job(seed, fresh)['status'] == 'running'
+        assert _job(seed, failing)['status'] == 'queued'
+        assert not _run(app, runner)
+    finally:
+        sqlite_db.translate.cache_clear()
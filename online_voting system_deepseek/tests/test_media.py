@@ -0,0 +1,114 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+import media
+from conftest import login_admin
+
+PIL = pytest.importorskip('PIL.Image')
+
+
+def _png(size=(800, 600), color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    PIL.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _add(client, election, photo, filename='photo.png'):
+    return client.post(f'/admin/candidate/add/{election}', data={
+        'candidate_name': 'Pictured', 'party_name': 'Party',
+        'photo': (io.BytesIO(photo), filename), 'symbol': (io.BytesIO(), '')})
+
+
+def test_upload_stored_by_content_hash(app, seed, client):
+    election = seed.election()
+    login_admin(client)
+    data = _png()
+    assert _add(client, election, data).status_code == 302
+    digest = hashlib.sha256(data).hexdigest()
+    assert seed.query("SELECT photo_path FROM candidates")[0][0] == f'{digest}.png'
+    assert sorted(os.listdir(app.config['UPLOAD_FOLDER'])) == sorted(
+        [f'{digest}.png'] + [f'{digest}.{variant}.{fmt}' for variant in app.config['MEDIA_VARIANTS']
+                             for fmt in ('png', 'webp')])
+
+    # The same bytes under another name add nothing
+    _add(client, election, data, 'again.png')
+    assert len(os.listdir(app.config['UPLOAD_FOLDER'])) == 5
+
+
+@pytest.mark.parametrize('data', [b'not an image at all', b'\x89PNG\r\n\x1a\n' + b'\x00' * 64],
+                         ids=['text', 'bad-png'])
+def test_non_image_rejected(app, seed, client, data):
+    election = seed.election()
+    login_admin(client)
+    response = _add(client, election, data)
+    assert response.status_code == 200
+    assert b'image' in response.data
+    assert seed.query("SELECT COUNT(*) FROM candidates")[0][0] == 0
+    assert os.listdir(app.config['UPLOAD_FOLDER']) == []
+
+
+def test_truncated_image_leaves_nothing(app, seed, client):
+    election = seed.election()
+    login_admin(client)
+    data = _png()
+    response = _add(client, election, data[:len(data) // 2])
+    assert response.status_code == 200
+    assert os.listdir(app.config['UPLOAD_FOLDER']) == []
+
+
+def test_edit_rejects_non_image(app, seed, client):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    login_admin(client)
+    response = client.post(f'/admin/candidate/edit/{candidate}', data={
+        'candidate_name': 'Renamed', 'party_name': 'Party',
+        'photo': (io.BytesIO(b'GIF89a'), 'photo.jpg'), 'symbol': (io.BytesIO(), '')})
+    assert response.status_code == 200
+    assert seed.query("SELECT candidate_name, photo_path FROM candidates")[0] == ('Candidate 1', None)
+
+
+def test_media_cached_for_good(app, seed, client):
+    election = seed.election()
+    login_admin(client)
+    _add(client, election, _png())
+    name = seed.query("SELECT photo_path FROM candidates")[0][0]
+
+    response = client.get(f'/media/{name}')
+    assert response.status_code == 200
+    cache_control = response.headers['Cache-Control']
+    assert 'no-cache' not in cache_control
+    assert 'immutable' in cache_control and 'public' in cache_control
+    assert f'max-age={app.config["MEDIA_MAX_AGE"]}' in cache_control
+    assert client.get(f'/media/{name}', headers={'If-None-Match': f'"{name}"'}).status_code == 304
+
+
+def test_media_url_prefers_variant(app, seed, client):
+    election = seed.election()
+    login_admin(client)
+    _add(client, election, _png())
+    name = seed.query("SELECT photo_path FROM candidates")[0][0]
+    digest = name.split('.')[0]
+    with app.test_request_context():
+        assert media.media_url(name, 'thumb', 'webp') == f'/media/{digest}.thumb.webp'
+        assert media.media_url(name, 'missing', 'webp') is None
+        assert media.media_url(name, 'missing') == f'/media/{name}'
+
+
+def test_rehash_moves_legacy_uploads(app, seed):
+    election = seed.election()
+    seed.candidates(election, 2)
+    folder = app.config['UPLOAD_FOLDER']
+    data = _png()
+    with open(os.path.join(folder, 'legacy.png'), 'wb') as f:
+        f.write(data)
+    seed.query("UPDATE candidates SET photo_path = 'legacy.png', symbol_path = 'legacy.png'")
+
+    result = app.test_cli_runner().invoke(args=['media', 'rehash'])
+    assert 'Rehashed 4 upload(s); removed 1 original(s).' in result.output
+    name = f'{hashlib.sha256(data).hexdigest()}.png'
+    assert seed.query("SELECT DISTINCT photo_path, symbol_path FROM candidates") == [(name, name)]
+    assert 'legacy.png' not in os.listdir(folder)
+    assert not [f for f in os.listdir(folder) if f.endswith('.tmp')]
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from conftest import PASSWORD
+from db import get_pool
+from passwords import KdfBusy, PasswordHasher
+
+
+@pytest.mark.parametrize('method', ['pbkdf2:sha256', 'pbkdf2:sha256:1000', 'scrypt', 'scrypt:16384:8:1'])
+def test_fresh_hash_needs_no_rehash(method):
+    hasher = PasswordHasher(method, workers=1)
+    pwhash = hasher.hash('secret')
+    assert hasher.verify(pwhash, 'secret')
+    assert not hasher.verify(pwhash, 'wrong')
+    assert not hasher.needs_rehash(pwhash)
+
+
+def test_other_settings_need_rehash():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1)
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:2000'))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'scrypt:16384:8:1'))
+
+
+def test_full_queue_fails_fast():
+    hasher = PasswordHasher('pbkdf2:sha256:1000', workers=1, max_queue=1)
+    release = threading.Event()
+    blocker = hasher._submit('hash', release.wait)
+    with pytest.raises(KdfBusy):
+        hasher.hash('secret')
+    release.set()
+    blocker.result()
+    assert hasher.stats()['rejected'] == 1
+    assert hasher.hash('secret')
+
+
+def _login(client, identifier):
+    return client.post('/voter/login', data={'identifier': identifier, 'password': PASSWORD})
+
+
+def test_login_keeps_current_hash(app, seed, client):
+    voter, = seed.voters()
+    stored = seed.query("SELECT password FROM voters WHERE id = %s", (voter,))[0][0]
+    assert _login(client, f'V{voter:06d}').headers['Location'] == '/voter/dashboard'
+    assert seed.query("SELECT password FROM voters WHERE id = %s", (voter,))[0][0] == stored
+    assert app.extensions['password_hasher'].stats()['rehashed'] == 0
+
+
+def test_login_upgrades_old_hash_once(app, seed, client):
+    voter, = seed.voters(method='pbkdf2:sha256:2000')
+    assert _login(client, f'voter{voter}@example.test').headers['Location'] == '/voter/dashboard'
+    assert _login(client, f'voter{voter}@example.test').headers['Location'] == '/voter/dashboard'
+    stored = seed.query("SELECT password FROM voters WHERE id = %s", (voter,))[0][0]
+    assert stored.startswith('pbkdf2:sha256:1000$')
+    assert app.extensions['password_hasher'].stats()['rehashed'] == 1
+
+
+def test_wrong_password(app, seed, client):
+    voter, = seed.voters()
+    response = client.post('/voter/login', data={'identifier': f'V{voter:06d}', 'password': 'wrong'})
+    assert response.status_code == 200
+    assert b'Invalid credentials' in response.data
+
+
+def test_no_connection_held_during_kdf(app, seed, client, monkeypatch):
+    voter, = seed.voters(method='pbkdf2:sha256:2000')
+    hasher = app.extensions['password_hasher']
+    in_use = []
+    for name in ('verify', 'hash'):
+        def spy(*args, _original=getattr(hasher, name)):
+            in_use.append(get_pool().stats()['in_use'])
+            return _original(*args)
+        monkeypatch.setattr(hasher, name, spy)
+    _login(client, f'V{voter:06d}')
+    assert in_use == [0, 0]
@@ -0,0 +1,127 @@
+import time
+
+import pytest
+
+import db
+from conftest import login_admin
+from db import ReplicaSet, MySQLdb
+
+
+class StandInPool:
+    """Takes the place of a replica's ConnectionPool."""
+
+    def __init__(self, name):
+        self.name = name
+        self.checked_out = 0
+
+    def checkout(self):
+        self.checked_out += 1
+        return f'{self.name}-connection'
+
+    def checkin(self, conn):
+        self.checked_out -= 1
+
+    def dispose(self, close=True):
+        pass
+
+    def stats(self):
+        return {'in_use': self.checked_out}
+
+
+def _replica_set(app, lags, monkeypatch, max_lag=5):
+    """A ReplicaSet whose replicas report ``lags`` (an exception is raised)."""
+    pools = {name: StandInPool(name) for name in lags}
+    replicas = ReplicaSet(app, {name: (pool, True) for name, pool in pools.items()},
+                          max_lag=max_lag, check_interval=3600)
+
+    def lag_of(pool):
+        lag = lags[pool.name]
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+    monkeypatch.setattr(replicas, '_lag_of', lag_of)
+    return replicas, pools
+
+
+def test_round_robin_over_healthy(app, monkeypatch):
+    replicas, pools = _replica_set(app, {'a': 0, 'b': 1}, monkeypatch)
+    assert [replicas.choose().name for _ in range(4)] == ['a', 'b', 'a', 'b']
+    assert replicas.stats()['replicas']['a']['reads'] == 2
+
+
+@pytest.mark.parametrize('lag', [6, None, MySQLdb.OperationalError(2003, 'unreachable')],
+                         ids=['lagging', 'not-replicating', 'unreachable'])
+def test_unhealthy_replica_left_out(app, monkeypatch, lag):
+    lags = {'good': 2, 'bad': lag}
+    replicas, _ = _replica_set(app, lags, monkeypatch)
+    assert {replicas.choose().name for _ in range(4)} == {'good'}
+    assert not replicas.stats()['replicas']['bad']['healthy']
+
+    # Back once it catches up
+    lags['bad'] = 0
+    replicas._refresh()
+    assert {replicas.choose().name for _ in range(4)} == {'good', 'bad'}
+
+
+def test_lag_check_can_be_skipped(app):
+    replicas = ReplicaSet(app, {'local': (StandInPool('local'), False)}, check_interval=3600)
+    assert replicas.choose().name == 'local'
+
+
+def test_primary_when_none_healthy(app, monkeypatch):
+    replicas, _ = _replica_set(app, {'a': 60}, monkeypatch)
+    assert replicas.choose() is None
+    assert replicas.stats()['primary_reads'] == 1
+
+
+@pytest.fixture
+def replica(app, monkeypatch):
+    replicas, pools = _replica_set(app, {'replica': 0}, monkeypatch)
+    monkeypatch.setitem(app.extensions, 'db_replicas', replicas)
+    return pools['replica']
+
+
+def test_reads_go_to_replica_unless_pinned(app, replica):
+    with app.test_request_context():
+        assert db.get_read_db() == 'replica-connection' and db.read_from_replica()
+        db.release_db()
+        assert replica.checked_out == 0
+
+        db.session['_primary_until'] = time.time() + 10
+        assert db.get_read_db() is db.get_db() and not db.read_from_replica()
+        db.release_db()
+
+        db.session['_primary_until'] = time.time() - 1
+        assert db.get_read_db() == 'replica-connection'
+        db.release_db()
+
+
+def _pinned_until(client):
+    with client.session_transaction() as session:
+        return session.get('_primary_until', 0)
+
+
+def test_get_route_that_writes_pins_session(app, seed, client, replica):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    login_admin(client)
+    client.get('/admin/dashboard')
+    assert _pinned_until(client) == 0
+
+    # delete_candidate is a GET that commits (it enqueues a job)
+    client.get(f'/admin/candidate/delete/{candidate}')
+    until = _pinned_until(client)
+    assert until - time.time() == pytest.approx(app.config['READ_YOUR_WRITES_SECONDS'], abs=5)
+
+
+def test_failed_post_does_not_pin(app, client, replica):
+    client.post('/voter/login', data={'identifier': 'nobody', 'password': 'wrong'})
+    assert _pinned_until(client) == 0
+
+
+def test_no_pin_without_replicas(app, seed, client):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    login_admin(client)
+    client.get(f'/admin/candidate/delete/{candidate}')
+    assert _pinned_until(client) == 0
@@ -0,0 +1,111 @@
+import pytest
+
+from conftest import login_admin, login_voter, run_jobs
+from results_cache import ResultsCache
+from shared_store import SharedStore
+
+RESULTS = [{'id': 1, 'candidate_name': 'A', 'party_name': 'P', 'photo_path': None, 'symbol_path': None,
+            'vote_count': 2, 'percentage': 100.0}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SharedStore(str(tmp_path / 'shared'), 'test-secret', slots=64)
+    store.reset()
+    return store
+
+
+def test_live_entry_served_until_invalidated(store):
+    cache = ResultsCache(store)
+    assert cache.get(1) is None
+    cache.put(1, cache.version(1), RESULTS, 2)
+    assert cache.get(1)['total_votes'] == 2
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert cache.stats()['hits'] == 1
+
+
+def test_put_after_racing_invalidate_is_dropped(store):
+    cache = ResultsCache(store)
+    version = cache.version(1)
+    cache.invalidate(1)
+    cache.put(1, version, RESULTS, 2)
+    assert cache.get(1) is None
+
+
+def test_lru_bound(store):
+    cache = ResultsCache(store, max_entries=2)
+    for election_id in (1, 2, 3):
+        cache.put(election_id, cache.version(election_id), RESULTS, 2)
+    assert cache.stats()['live_entries'] == 2
+    assert cache.get(1) is None
+
+
+def test_frozen_snapshot_shared_between_processes(store):
+    writer = ResultsCache(store)
+    # A second store on the same directory stands in for another worker
+    reader = ResultsCache(SharedStore(store.directory, 'test-secret', slots=64))
+    writer.freeze(1, writer.version(1), RESULTS, 2)
+    entry = reader.get(1)
+    assert entry['frozen'] and entry['etag'] == writer.get(1)['etag']
+
+    # A live entry stays in the process that read it
+    writer.put(2, writer.version(2), RESULTS, 2)
+    assert reader.get(2) is None
+
+    reader.invalidate(1)
+    assert writer.get(1) is None
+
+
+def test_etag_follows_content(store):
+    cache = ResultsCache(store)
+    first = cache.put(1, cache.version(1), RESULTS, 2)['etag']
+    changed = [dict(RESULTS[0], vote_count=3)]
+    cache.invalidate(1)
+    assert cache.put(1, cache.version(1), changed, 3)['etag'] != first
+
+
+def test_published_flag(store):
+    cache = ResultsCache(store)
+    other = ResultsCache(SharedStore(store.directory, 'test-secret', slots=64))
+    assert cache.published() is None
+    cache.set_published(False, cache.published_version())
+    assert other.published() is False
+    other.set_published(True)
+    assert cache.published() is True
+
+
+def test_vote_invalidates_admin_results(app, seed, client):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voter, = seed.voters()
+    login_admin(client)
+    client.get(f'/admin/results/{election}')
+    cache = app.extensions['results_cache']
+    assert cache.get(election)['total_votes'] == 0
+
+    login_voter(client, voter)
+    client.post(f'/vote/{candidate}', data={'election_id': election})
+    assert cache.get(election) is None
+    login_admin(client)
+    client.get(f'/admin/results/{election}')
+    assert cache.get(election)['total_votes'] == 1
+
+
+def test_completed_election_is_frozen(app, seed, client):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voter, = seed.voters()
+    seed.vote(voter, candidate, election)
+    seed.query("UPDATE admin_settings SET results_published = TRUE")
+    login_admin(client)
+    client.post(f'/admin/election/complete/{election}')
+    run_jobs(app)
+
+    entry = app.extensions['results_cache'].get(election)
+    assert entry['frozen'] and entry['total_votes'] == 1
+    login_voter(client, voter)
+    response = client.get(f'/voter/results/{election}')
+    assert response.status_code == 200
+    assert client.get(f'/voter/results/{election}',
+                      headers={'If-None-Match': f'"{entry["etag"]}"'}).status_code == 304
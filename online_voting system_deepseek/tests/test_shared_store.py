@@ -0,0 +1,97 @@
+import errno
+import os
+import subprocess
+import sys
+
+import pytest
+
+import wsgi
+from conftest import APP_DIR
+from shared_store import SharedStore, SharedStoreError
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SharedStore(str(tmp_path / 'shared'), 'test-secret', slots=64)
+    store.reset()
+    return store
+
+
+def _fresh(store, secret='test-secret'):
+    # Another process: nothing unpickled yet
+    return SharedStore(store.directory, secret, slots=64)
+
+
+def test_value_shared_until_bumped(store):
+    assert store.set('index', store.version('index'), {'open': [1, 2]})
+    other = _fresh(store)
+    assert other.get('index') == {'open': [1, 2]}
+    other.bump('index')
+    assert store.get('index') is None
+    assert not store.set('index', (1, 0), 'stale')
+
+
+@pytest.mark.parametrize('tamper', ['payload', 'secret'])
+def test_unsigned_value_not_unpickled(store, tamper):
+    store.set('index', store.version('index'), 'value')
+    if tamper == 'payload':
+        with open(store._path('index'), 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+        reader = _fresh(store)
+    else:
+        reader = _fresh(store, 'another-secret')
+    assert reader.get('index') is None
+    assert reader.stats()['rejected'] == 1
+
+
+def test_value_of_another_key_rejected(store):
+    store.set('a', store.version('a'), 'for a')
+    os.replace(store._path('a'), store._path('b'))
+    reader = _fresh(store)
+    # Neither key was bumped, so the version tag matches; the signature does not
+    assert reader.get('b') is None
+    assert reader.stats()['rejected'] == 1
+
+
+def test_symlinks_not_followed(store, tmp_path):
+    target = tmp_path / 'elsewhere'
+    target.write_bytes(b'')
+    os.symlink(target, store._path('index'))
+    assert store.get('index') is None and store.stats()['rejected'] == 1
+    # set() puts a real file in its place
+    assert store.set('index', store.version('index'), 'value')
+    assert not os.path.islink(store._path('index')) and target.read_bytes() == b''
+
+    os.symlink(target, store._claims_path('election:1'))
+    with pytest.raises(OSError) as e:
+        store.claim('election:1', 7)
+    assert e.value.errno == errno.ELOOP
+
+
+def test_refuses_open_directory(tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir(mode=0o755)
+    os.chmod(directory, 0o755)
+    with pytest.raises(SharedStoreError, match='mode 0700'):
+        SharedStore(str(directory), 'test-secret').reset()
+
+
+def test_refuses_symlinked_directory(tmp_path):
+    real = tmp_path / 'real'
+    real.mkdir(mode=0o700)
+    os.symlink(real, tmp_path / 'shared')
+    with pytest.raises(SharedStoreError, match='not a directory'):
+        SharedStore(str(tmp_path / 'shared'), 'test-secret').reset()
+
+
+def test_only_server_startup_resets(app):
+    store = app.extensions['shared_store']
+    epoch, _ = store.version('index')
+    # What a `flask` command does next to running workers
+    subprocess.run([sys.executable, '-c', 'import app'], cwd=APP_DIR, check=True)
+    assert store.version('index')[0] == epoch
+    assert wsgi.load_app(warm_up=False) is app
+    assert store.version('index')[0] == epoch + 1
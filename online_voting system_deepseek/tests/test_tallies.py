@@ -0,0 +1,124 @@
+import io
+
+import tallies
+from conftest import login_admin, login_voter
+from db import get_db, DictCursor
+
+
+def _results(app, election_id):
+    with app.app_context():
+        cursor = get_db().cursor(DictCursor)
+        results, total = tallies.fetch_results(cursor, election_id)
+        cursor.close()
+    return {c['id']: (c['vote_count'], c['percentage']) for c in results}, total
+
+
+def _drift(app, election_id=None):
+    with app.app_context():
+        cursor = get_db().cursor()
+        drift = tallies.find_drift(cursor, election_id)
+        cursor.close()
+    return drift
+
+
+def test_results_come_from_tallies(app, seed):
+    election = seed.election()
+    first, second, third = seed.candidates(election)
+    voters = seed.voters(4)
+    for voter, candidate in zip(voters, (first, first, first, second)):
+        assert seed.vote(voter, candidate, election)
+
+    results, total = _results(app, election)
+    assert total == 4
+    assert results == {first: (3, 75.0), second: (1, 25.0), third: (0, 0)}
+    assert _drift(app) == []
+
+
+def test_no_votes_no_division_by_zero(app, seed):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    assert _results(app, election) == ({candidate: (0, 0)}, 0)
+
+
+def test_inactive_election_gains_no_votes(app, seed):
+    election = seed.election(active=False)
+    candidate, = seed.candidates(election, 1)
+    voter, = seed.voters()
+    assert not seed.vote(voter, candidate, election)
+    assert _results(app, election) == ({candidate: (0, 0)}, 0)
+
+
+def test_candidate_of_another_election_is_refused(app, seed):
+    election, other = seed.election(), seed.election()
+    seed.candidates(election, 1)
+    stranger, = seed.candidates(other, 1)
+    voter, = seed.voters()
+    assert not seed.vote(voter, stranger, election)
+
+
+def test_cast_vote_counts_once(app, seed, client):
+    election = seed.election()
+    candidate, _ = seed.candidates(election, 2)
+    voter, = seed.voters()
+    login_voter(client, voter)
+    client.post(f'/vote/{candidate}', data={'election_id': election})
+    response = client.post(f'/vote/{candidate}', data={'election_id': election})
+    assert response.headers['Location'] == '/voter/dashboard'
+    assert _results(app, election)[1] == 1
+
+
+def test_drift_found_and_rebuilt(app, seed):
+    election = seed.election()
+    candidate, other = seed.candidates(election, 2)
+    voter, = seed.voters()
+    seed.vote(voter, candidate, election)
+    seed.query("UPDATE vote_tallies SET vote_count = 5 WHERE candidate_id = %s", (candidate,))
+    seed.query("INSERT INTO vote_tallies (election_id, candidate_id, vote_count) VALUES (%s, %s, 2)",
+               (election, other))
+
+    assert _drift(app, election) == [(election, candidate, 5, 1), (election, other, 2, 0)]
+    with app.app_context():
+        conn = get_db()
+        cursor = conn.cursor()
+        tallies.rebuild(cursor, election)
+        conn.commit()
+        cursor.close()
+    assert _drift(app) == []
+    assert _results(app, election)[1] == 1
+
+
+def test_archived_votes_still_counted(app, seed):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voter, = seed.voters()
+    seed.vote(voter, candidate, election)
+    seed.query("INSERT INTO votes_archive (id, voter_id, candidate_id, election_id, voted_at) "
+               "SELECT id, voter_id, candidate_id, election_id, voted_at FROM votes")
+    seed.query("DELETE FROM votes")
+    assert _drift(app) == []
+
+
+def test_site_counters(app, seed, client):
+    seed.voters(3)
+    with app.app_context():
+        conn = get_db()
+        cursor = conn.cursor()
+        assert tallies.counter_drift(cursor) == [('voters', 0, 3)]
+        tallies.rebuild_counters(cursor)
+        conn.commit()
+        assert tallies.counter_drift(cursor) == []
+        cursor.close()
+
+    client.post('/voter/register', data={'full_name': 'New Voter', 'voter_id': 'NEW1',
+                                         'email': 'new@example.test', 'password': 'secret'})
+    login_admin(client)
+    election = seed.election()
+    client.post(f'/admin/candidate/add/{election}', data={
+        'candidate_name': 'C', 'party_name': 'P',
+        'photo': (io.BytesIO(), ''), 'symbol': (io.BytesIO(), '')})
+    with app.app_context():
+        cursor = get_db().cursor()
+        assert tallies.counter_drift(cursor) == []
+        cursor.execute("SELECT name, value FROM site_counters ORDER BY name")
+        assert cursor.fetchall() == [('candidates', 1), ('voters', 4)]
+        cursor.close()
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import login_admin
+from turnout import TurnoutMonitor
+
+
+@pytest.fixture
+def monitor(app):
+    # No sampler interval inside a test: refreshes are explicit
+    monitor = TurnoutMonitor(app, interval=3600, max_streams=1)
+    app.extensions['turnout'] = monitor
+    return monitor
+
+
+def _event(chunk):
+    name, data = chunk.strip().split('\n')
+    return name.split(': ')[1], json.loads(data.split(': ', 1)[1])
+
+
+def test_streams_capped(app, client, monitor):
+    login_admin(client)
+    first = client.get('/admin/turnout/stream', buffered=False)
+    assert first.status_code == 200
+    assert client.get('/admin/turnout/stream').status_code == 503
+    assert monitor.stats()['streams_rejected'] == 1
+
+    first.close()
+    assert monitor.stats()['streams_open'] == 0
+    second = client.get('/admin/turnout/stream', buffered=False)
+    assert second.status_code == 200
+    assert _event(next(second.response).decode())[0] == 'snapshot'
+    second.close()
+
+
+def test_stream_requires_admin(client, monitor):
+    assert client.get('/admin/turnout/stream').status_code == 302
+    assert monitor.stats()['streams_open'] == 0
+
+
+def test_async_stream_sends_deltas(app, seed, monitor):
+    election = seed.election('Open')
+
+    async def read():
+        events = monitor.stream_async(keepalive=30)
+        first = _event(await events.__anext__())
+        seed.query("UPDATE site_counters SET value = 7 WHERE name = 'voters'")
+        await asyncio.to_thread(monitor._refresh)
+        second = _event(await asyncio.wait_for(events.__anext__(), 5))
+        await events.aclose()
+        return first, second
+
+    (kind, snapshot), delta = asyncio.run(read())
+    assert kind == 'snapshot' and str(election) in snapshot['elections']
+    assert delta == ('delta', {'voters': 7})
+    assert monitor.stats()['async_waiters'] == 0
+
+
+def test_async_wait_times_out_to_keepalive(app, monitor):
+    async def read():
+        events = monitor.stream_async(keepalive=0.01)
+        await events.__anext__()
+        chunk = await events.__anext__()
+        await events.aclose()
+        return chunk
+
+    assert asyncio.run(read()) == ': keepalive\n\n'
+
+
+def test_asgi_serves_stream_without_a_thread(app, client, monitor):
+    asgi = pytest.importorskip('asgi')
+    login_admin(client)
+    cookie = client.get_cookie('session').value
+    scope = {'type': 'http', 'method': 'GET', 'path': '/admin/turnout/stream', 'query_string': b'',
+             'http_version': '1.1', 'headers': [(b'cookie', f'session={cookie}'.encode())]}
+
+    async def run():
+        sent = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            if not sent:
+                return {'type': 'http.request', 'body': b''}
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if message.get('more_body'):
+                disconnect.set()
+
+        await asyncio.wait_for(asgi.application(scope, receive, send), 5)
+        return sent
+
+    sent = asyncio.run(run())
+    assert sent[0]['status'] == 200
+    assert (b'content-type', b'text/event-stream; charset=utf-8') in sent[0]['headers']
+    assert _event(sent[1]['body'].decode())[0] == 'snapshot'
+    assert monitor.stats()['streams_open'] == 0
@@ -0,0 +1,114 @@
+import pytest
+
+import wsgi
+from conftest import login_voter
+from vote_guard import VoteGuard, VoterBitmap
+
+
+def test_bitmap_membership_and_count():
+    bitmap = VoterBitmap()
+    for voter_id in (1, 9, 9, 1000):
+        bitmap.add(voter_id)
+    assert bitmap.count == 3
+    assert 9 in bitmap and 1000 in bitmap
+    assert 8 not in bitmap and 10 not in bitmap and 10 ** 6 not in bitmap
+
+    bitmap.discard(9)
+    bitmap.discard(9)
+    bitmap.discard(5)
+    assert 9 not in bitmap and bitmap.count == 2
+
+
+def test_bitmap_update_merges():
+    first, second = VoterBitmap(), VoterBitmap()
+    first.add(3)
+    second.add(3)
+    second.add(5000)
+    first.update(second)
+    assert 3 in first and 5000 in first and first.count == 2
+
+
+def _guard(app):
+    return app.extensions['vote_guard']
+
+
+def _loads(monkeypatch, guard):
+    calls = []
+    original = guard._load
+
+    def load(election_id):
+        calls.append(election_id)
+        return original(election_id)
+    monkeypatch.setattr(guard, '_load', load)
+    return calls
+
+
+def test_loaded_once_from_votes(app, seed, monkeypatch):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voter, other = seed.voters(2)
+    seed.vote(voter, candidate, election)
+    guard = _guard(app)
+    loads = _loads(monkeypatch, guard)
+    with app.app_context():
+        assert guard.has_voted(voter, election)
+        assert not guard.has_voted(other, election)
+    assert loads == [election]
+    assert guard.stats()['duplicates_rejected'] == 1
+
+
+def test_claim_and_release(app, seed):
+    election = seed.election()
+    voter, = seed.voters()
+    guard = _guard(app)
+    with app.app_context():
+        assert guard.claim(voter, election)
+        assert not guard.claim(voter, election)
+        guard.release(voter, election)
+        assert guard.claim(voter, election)
+
+
+def test_forget_reaches_other_processes(app, seed):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voter, = seed.voters()
+    seed.vote(voter, candidate, election)
+    guard = _guard(app)
+    # A second guard on the same shared store stands in for another worker
+    other = VoteGuard(app.extensions['shared_store'])
+    with app.app_context():
+        assert guard.has_voted(voter, election) and other.has_voted(voter, election)
+        seed.query("DELETE FROM votes")
+        guard.forget_election(election)
+        assert not other.has_voted(voter, election)
+
+
+def test_startup_warms_open_elections(app, seed, monkeypatch):
+    election = seed.election()
+    closed = seed.election(active=False)
+    candidate, = seed.candidates(election, 1)
+    voter, = seed.voters()
+    seed.vote(voter, candidate, election)
+    guard = _guard(app)
+
+    wsgi.warm(app)
+    assert guard.stats()['elections'] == 1
+
+    # Voting needs no further load
+    def load(election_id):
+        pytest.fail(f'election {election_id} loaded during a request')
+    monkeypatch.setattr(guard, '_load', load)
+    with app.app_context():
+        assert guard.has_voted(voter, election)
+    assert closed not in guard._bitmaps
+
+
+def test_no_bitmap_for_elections_not_open(app, seed, client):
+    closed = seed.election(active=False)
+    candidate, = seed.candidates(closed, 1)
+    voter, = seed.voters()
+    login_voter(client, voter)
+    for election_id in (closed, closed + 1, 10 ** 9):
+        response = client.post(f'/vote/{candidate}', data={'election_id': election_id})
+        assert response.headers['Location'] == '/voter/elections'
+    assert _guard(app).stats()['elections'] == 0
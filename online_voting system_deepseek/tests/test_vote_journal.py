@@ -0,0 +1,171 @@
+import json
+import os
+import time
+
+import pytest
+
+from vote_guard import VoteGuard
+from vote_journal import VoteJournal
+
+
+@pytest.fixture
+def journal_dir(tmp_path):
+    return str(tmp_path / 'journal')
+
+
+def _journal(app, directory, writer=True):
+    journal = VoteJournal(app, directory, batch_size=100, flush_interval=0.01)
+    if not writer:
+        # Accept votes but never write them, as if the process died
+        journal._run = lambda: None
+    return journal
+
+
+def _drain(journal, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = journal.stats()
+        if not stats['lag_votes'] and stats['checkpoint_seq'] == stats['last_seq']:
+            return stats
+        time.sleep(0.01)
+    pytest.fail(f'journal did not drain: {journal.stats()}')
+
+
+def _dead_letters(directory):
+    path = os.path.join(directory, 'dead-letter.journal')
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_votes_written_with_tallies_and_checkpoint(app, seed, journal_dir):
+    election = seed.election()
+    first, second = seed.candidates(election, 2)
+    voters = seed.voters(3)
+    journal = _journal(app, journal_dir)
+    with app.app_context():
+        for voter, candidate in zip(voters, (first, first, second)):
+            journal.append(voter, candidate, election)
+    stats = _drain(journal)
+
+    assert stats['inserted'] == 3 and stats['failed'] == 0
+    assert seed.query("SELECT candidate_id, vote_count FROM vote_tallies ORDER BY candidate_id") == \
+        [(first, 2), (second, 1)]
+    assert seed.query("SELECT journal, last_seq FROM vote_journal_checkpoints") == [('votes-0', 3)]
+
+
+def test_replay_after_crash_inserts_once(app, seed, journal_dir):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voters = seed.voters(2)
+    crashed = _journal(app, journal_dir, writer=False)
+    with app.app_context():
+        for voter in voters:
+            crashed.append(voter, candidate, election)
+    crashed._file.close()
+    # A torn write from the crash was never acknowledged
+    with open(os.path.join(journal_dir, 'votes-0.journal'), 'a', encoding='utf-8') as f:
+        f.write('{"seq": 3, "voter')
+
+    restarted = _journal(app, journal_dir)
+    with app.app_context():
+        restarted.start()
+    assert restarted.name == 'votes-0'
+    assert _drain(restarted)['inserted'] == 2
+
+    # The checkpoint covers both: replaying the file again queues nothing
+    again = _journal(app, journal_dir)
+    again._file = open(os.path.join(journal_dir, 'votes-0.journal'), 'a+', encoding='utf-8')
+    again.name = 'votes-0'
+    with app.app_context():
+        again._replay()
+    again._file.close()
+    assert not again._pending and again._seq == 2
+    assert seed.query("SELECT COUNT(*) FROM votes")[0][0] == 2
+
+
+def test_duplicates_dropped_quietly(app, seed, journal_dir):
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voter, other = seed.voters(2)
+    seed.vote(voter, candidate, election)
+    journal = _journal(app, journal_dir)
+    with app.app_context():
+        journal.append(voter, candidate, election)
+        journal.append(other, candidate, election)
+    stats = _drain(journal)
+    assert (stats['inserted'], stats['duplicates_dropped'], stats['failed']) == (1, 1, 0)
+    assert _dead_letters(journal_dir) == []
+
+
+def test_refused_votes_go_to_dead_letter(app, seed, journal_dir):
+    election = seed.election()
+    other_election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    stranger, = seed.candidates(other_election, 1)
+    voters = seed.voters(3)
+    journal = _journal(app, journal_dir, writer=False)
+    with app.app_context():
+        journal.append(voters[0], candidate, election)
+        journal.append(voters[1], stranger, election)
+        journal.append(voters[2], candidate, election)
+    seed.query("UPDATE elections SET is_active = FALSE WHERE id = %s", (other_election,))
+    journal._file.close()
+
+    restarted = _journal(app, journal_dir)
+    with app.app_context():
+        restarted.start()
+    stats = _drain(restarted)
+    assert (stats['inserted'], stats['failed']) == (2, 1)
+    letter, = _dead_letters(journal_dir)
+    assert (letter['journal'], letter['seq'], letter['voter_id'], letter['candidate_id']) == \
+        ('votes-0', 2, voters[1], stranger)
+    assert letter['reason']
+
+    # Votes for an election completed while they were queued are not
+    # counted, but not lost either
+    seed.query("UPDATE elections SET is_active = FALSE WHERE id = %s", (election,))
+    late, = seed.voters()
+    with app.app_context():
+        restarted.append(late, candidate, election)
+    assert _drain(restarted)['failed'] == 2
+    assert _dead_letters(journal_dir)[-1]['voter_id'] == late
+    assert seed.query("SELECT COUNT(*) FROM votes")[0][0] == 2
+
+
+def test_claim_holds_across_processes(app, seed):
+    election = seed.election()
+    voter, = seed.voters()
+    guard = app.extensions['vote_guard']
+    # A second guard on the same shared store stands in for another worker
+    other = VoteGuard(app.extensions['shared_store'])
+    with app.app_context():
+        assert guard.claim(voter, election)
+        assert not other.claim(voter, election)
+        guard.release(voter, election)
+        other.release(voter, election)
+        assert other.claim(voter, election)
+
+        guard.forget_election(election)
+        assert VoteGuard(app.extensions['shared_store']).claim(voter, election)
+
+
+def test_journal_mode_acknowledges_once(app, seed, client, journal_dir, monkeypatch):
+    from conftest import login_voter
+    election = seed.election()
+    candidate, = seed.candidates(election, 1)
+    voter, = seed.voters()
+    journal = _journal(app, journal_dir)
+    monkeypatch.setitem(app.extensions, 'vote_journal', journal)
+    other = VoteGuard(app.extensions['shared_store'])
+
+    login_voter(client, voter)
+    response = client.post(f'/vote/{candidate}', data={'election_id': election})
+    assert response.headers['Location'] == f'/voter/results/{election}'
+    # Another worker turns the second attempt away before the writer has run
+    monkeypatch.setitem(app.extensions, 'vote_guard', other)
+    response = client.post(f'/vote/{candidate}', data={'election_id': election})
+    assert response.headers['Location'] == '/voter/dashboard'
+    assert journal.stats()['accepted'] == 1
+    _drain(journal)
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import threading
+import time
+
+from flask import current_app
+
+from db import get_read_db
+
+
+def _load():
+    # Everything here reads maintained counters: site_counters and
+    # vote_tallies are O(candidates), never O(votes) or O(voters). A
+    # replica is fine: the dashboard already lags by one interval
+    cursor = get_read_db().cursor()
+    cursor.execute("SELECT name, value FROM site_counters")
+    counters = {row[0]: int(row[1]) for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT e.id, e.name, COALESCE(SUM(t.vote_count), 0)
+        FROM elections e
+        LEFT JOIN vote_tallies t ON t.election_id = e.id
+        WHERE e.is_active = TRUE
+        GROUP BY e.id, e.name
+    """)
+    active = cursor.fetchall()
+    cursor.execute("SELECT COALESCE(SUM(vote_count), 0) FROM vote_tallies")
+    votes = int(cursor.fetchone()[0])
+    cursor.close()
+
+    voters = counters.get('voters', 0)
+    elections = {}
+    for election_id, name, election_votes in active:
+        election_votes = int(election_votes)
+        elections[str(election_id)] = {
+            'name': name,
+            'votes': election_votes,
+            'turnout': round(election_votes / voters * 100, 2) if voters else 0,
+        }
+    return {
+        'voters': voters,
+        'candidates': counters.get('candidates', 0),
+        'votes': votes,
+        'elections': elections,
+    }
+
+
+KEEPALIVE = ': keepalive\n\n'
+TURNOUT_STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def _event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+def _delta(old, new):
+    """Fields of ``new`` that differ from ``old``; removed elections map to None."""
+    delta = {key: new[key] for key in ('voters', 'candidates', 'votes') if old.get(key) != new[key]}
+    elections = {}
+    old_elections = old.get('elections', {})
+    for election_id, stats in new['elections'].items():
+        if old_elections.get(election_id) != stats:
+            elections[election_id] = stats
+    for election_id in old_elections:
+        if election_id not in new['elections']:
+            elections[election_id] = None
+    if elections:
+        delta['elections'] = elections
+    return delta
+
+
+class TurnoutMonitor:
+    """Samples the dashboard counters once per ``interval`` for all viewers.
+
+    The database cost is one small read per interval, however many admin
+    dashboards are open. Streams wait on the monitor for a new version; at
+    most ``max_streams`` are open at once in this process, since under WSGI
+    each one holds a worker thread for as long as the viewer stays.
+    """
+
+    def __init__(self, app, interval=2.0, max_streams=4):
+        self.app = app
+        self.interval = interval
+        self.max_streams = max_streams
+        self._cond = threading.Condition()
+        self._snapshot = None
+        self._version = 0
+        self._thread = None
+        self._slots = threading.BoundedSemaphore(max_streams)
+        self._open = 0
+        self._rejected = 0
+        # (loop, event) of coroutines in wait_async, set on each new version
+        self._async_waiters = set()
+
+    def _refresh(self):
+        with self.app.app_context():
+            data = _load()
+        with self._cond:
+            if data != self._snapshot:
+                self._snapshot = data
+                self._version += 1
+                self._cond.notify_all()
+                for loop, event in self._async_waiters:
+                    loop.call_soon_threadsafe(event.set)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self._refresh()
+            except Exception:
+                self.app.logger.exception('Turnout sampling failed')
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='turnout-sampler', daemon=True)
+        self._refresh()
+        self._thread.start()
+
+    def snapshot(self):
+        self._ensure_started()
+        with self._cond:
+            return self._version, self._snapshot
+
+    def wait(self, version, timeout):
+        """Block until the snapshot is newer than ``version`` or ``timeout`` passes."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version != version, timeout)
+            return self._version, self._snapshot
+
+    async def wait_async(self, version, timeout):
+        """wait() for the event loop: nothing blocks while the snapshot is unchanged."""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._cond:
+            if self._version != version:
+                return self._version, self._snapshot
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+        with self._cond:
+            return self._version, self._snapshot
+
+    def acquire_stream(self):
+        """Take a stream slot; False when max_streams are already open."""
+        if not self._slots.acquire(blocking=False):
+            with self._cond:
+                self._rejected += 1
+            return False
+        with self._cond:
+            self._open += 1
+        return True
+
+    def release_stream(self):
+        with self._cond:
+            self._open -= 1
+        self._slots.release()
+
+    def stream(self, keepalive=15.0):
+        """Server-sent events: a full snapshot first, then deltas as they happen."""
+        version, current = self.snapshot()
+        yield _event('snapshot', current)
+        while True:
+            new_version, new = self.wait(version, keepalive)
+            if new_version == version:
+                yield KEEPALIVE
+                continue
+            delta = _delta(current, new)
+            version, current = new_version, new
+            if delta:
+                yield _event('delta', delta)
+
+    async def stream_async(self, keepalive=15.0):
+        """stream() as an async generator, for asgi.py."""
+        # The first snapshot may load from the database
+        version, current = await asyncio.to_thread(self.snapshot)
+        yield _event('snapshot', current)
+        while True:
+            new_version, new = await self.wait_async(version, keepalive)
+            if new_version == version:
+                yield KEEPALIVE
+                continue
+            delta = _delta(current, new)
+            version, current = new_version, new
+            if delta:
+                yield _event('delta', delta)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'streams_open': self._open,
+                'streams_max': self.max_streams,
+                'streams_rejected': self._rejected,
+                'async_waiters': len(self._async_waiters),
+                'version': self._version,
+            }
+
+
+def init_turnout(app):
+    app.extensions['turnout'] = TurnoutMonitor(app, app.config['TURNOUT_INTERVAL'],
+                                                app.config['TURNOUT_MAX_STREAMS'])
+
+
+def get_turnout():
+    return current_app.extensions['turnout']
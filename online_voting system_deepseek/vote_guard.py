@@ -0,0 +1,194 @@
+import threading
+
+from flask import current_app
+
+from db import get_db, SSCursor
+
+
+class VoterBitmap:
+    """Set of voters.id values stored one bit per id."""
+
+    __slots__ = ('bits', 'count')
+
+    def __init__(self):
+        self.bits = bytearray()
+        self.count = 0
+
+    def add(self, voter_id):
+        index, mask = voter_id >> 3, 1 << (voter_id & 7)
+        if index >= len(self.bits):
+            # Grow by half again so a rising id sequence is amortised O(1)
+            self.bits.extend(bytes(max(index + 1, len(self.bits) * 3 // 2) - len(self.bits)))
+        if not self.bits[index] & mask:
+            self.bits[index] |= mask
+            self.count += 1
+
+    def discard(self, voter_id):
+        if voter_id in self:
+            self.bits[voter_id >> 3] &= ~(1 << (voter_id & 7)) & 0xFF
+            self.count -= 1
+
+    def update(self, other):
+        if len(other.bits) > len(self.bits):
+            self.bits.extend(bytes(len(other.bits) - len(self.bits)))
+        for index, byte in enumerate(other.bits):
+            if byte:
+                self.bits[index] |= byte
+        self.count = bin(int.from_bytes(self.bits, 'little')).count('1')
+
+    def __contains__(self, voter_id):
+        index = voter_id >> 3
+        return index < len(self.bits) and bool(self.bits[index] & (1 << (voter_id & 7)))
+
+
+def _key(election_id):
+    return f'vote_guard:{election_id}'
+
+
+class VoteGuard:
+    """Per-election bitmaps of voters who have already voted.
+
+    Each election's bitmap is loaded from votes by warm() at startup, or
+    else the first time it is needed, and updated after every successful vote, so repeat attempts are turned
+    away without a database round trip. A voter missing from the bitmap
+    still goes to the INSERT, where UNIQUE (voter_id, election_id) has the
+    final say. Memory is one bit per voters.id per election, about 125 KB
+    per million voters. forget_election() bumps the election's version in
+    the shared store, so every process drops its bitmap, including the web
+    workers when a background job deleted the votes.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._bitmaps = {}
+        # election id -> shared version its bitmap was loaded at
+        self._loaded = {}
+        self._loading = {}
+        self.hits = 0
+
+    def _load(self, election_id):
+        bitmap = VoterBitmap()
+        # Unbuffered cursor: voter ids stream in without holding the result set
+        cursor = get_db().cursor(SSCursor)
+        cursor.execute("SELECT voter_id FROM votes WHERE election_id = %s", (election_id,))
+        for (voter_id,) in cursor:
+            bitmap.add(voter_id)
+        cursor.close()
+        return bitmap
+
+    def _bitmap(self, election_id):
+        version = self.store.version(_key(election_id))
+        with self._lock:
+            loaded = self._loaded.get(election_id)
+            if loaded == version:
+                return self._bitmaps[election_id]
+            if loaded is not None:
+                # Forgotten by another process
+                del self._loaded[election_id]
+                self._bitmaps.pop(election_id, None)
+            loading = self._loading.get(election_id)
+            owner = loading is None
+            if owner:
+                loading = self._loading[election_id] = threading.Event()
+        if not owner:
+            loading.wait()
+            with self._lock:
+                return self._bitmaps.get(election_id) or VoterBitmap()
+        try:
+            bitmap = self._load(election_id)
+            with self._lock:
+                # Merge votes marked while the load was running
+                pending = self._bitmaps.get(election_id)
+                if pending is not None:
+                    bitmap.update(pending)
+                # A forget_election() during the load means it may be stale
+                if self.store.version(_key(election_id)) == version:
+                    self._bitmaps[election_id] = bitmap
+                    self._loaded[election_id] = version
+            return bitmap
+        finally:
+            with self._lock:
+                self._loading.pop(election_id, None)
+            loading.set()
+
+    def warm(self, election_ids):
+        """Load these elections' bitmaps now rather than in the first vote's request."""
+        for election_id in election_ids:
+            self._bitmap(election_id)
+
+    def has_voted(self, voter_id, election_id):
+        voted = voter_id in self._bitmap(election_id)
+        if voted:
+            self.hits += 1
+        return voted
+
+    def voted_in_any(self, voter_id):
+        # Only elections already loaded; a miss is not proof of not voting
+        with self._lock:
+            return any(voter_id in bitmap for bitmap in self._bitmaps.values())
+
+    def mark(self, voter_id, election_id):
+        with self._lock:
+            bitmap = self._bitmaps.get(election_id)
+            if bitmap is None:
+                bitmap = self._bitmaps[election_id] = VoterBitmap()
+            bitmap.add(voter_id)
+
+    def claim(self, voter_id, election_id):
+        """Mark the voter unless already marked; False means a repeat vote.
+
+        For votes acknowledged before they reach the table: besides this
+        process's bitmap, the claim is taken in a bitmap in the shared
+        store, so no two workers can both accept a vote from one voter.
+        """
+        bitmap = self._bitmap(election_id)
+        with self._lock:
+            bitmap = self._bitmaps.setdefault(election_id, bitmap)
+            if voter_id in bitmap:
+                self.hits += 1
+                return False
+            bitmap.add(voter_id)
+        if not self.store.claim(_key(election_id), voter_id):
+            # Accepted by another process; the local mark stays
+            with self._lock:
+                self.hits += 1
+            return False
+        return True
+
+    def release(self, voter_id, election_id):
+        # Undo a claim() whose vote was never recorded
+        self.store.unclaim(_key(election_id), voter_id)
+        with self._lock:
+            bitmap = self._bitmaps.get(election_id)
+            if bitmap is not None:
+                bitmap.discard(voter_id)
+
+    def forget_election(self, election_id):
+        # Votes were deleted; every process reloads from the table next time
+        self.store.drop_claims(_key(election_id))
+        self.store.bump(_key(election_id))
+        with self._lock:
+            self._bitmaps.pop(election_id, None)
+            self._loaded.pop(election_id, None)
+
+    def stats(self):
+        with self._lock:
+            voters = sum(bitmap.count for bitmap in self._bitmaps.values())
+            size = sum(len(bitmap.bits) for bitmap in self._bitmaps.values())
+        return {
+            'elections': len(self._bitmaps),
+            'voters_marked': voters,
+            'bytes': size,
+            # Includes growth headroom and gaps in the voters.id sequence
+            'bytes_per_million_voters': round(size / (voters / 1e6), 1) if voters else 0,
+            'duplicates_rejected': self.hits,
+        }
+
+
+def init_vote_guard(app):
+    app.extensions['vote_guard'] = VoteGuard(app.extensions['shared_store'])
+
+
+def get_vote_guard():
+    return current_app.extensions['vote_guard']
@@ -0,0 +1,344 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import current_app
+
+from db import get_db, IntegrityError, is_duplicate
+from tallies import add_to_tallies, insert_votes_sql
+
+
+class JournalBehind(Exception):
+    pass
+
+
+class VoteJournal:
+    """Write-behind vote ingestion.
+
+    Accepted votes are appended to a local journal file and fsync'd before
+    the voter is answered; a background writer then inserts them into votes
+    in group-committed batches. Each batch also stores the highest journal
+    sequence number it covers in vote_journal_checkpoints, in the same
+    transaction, so replaying the journal after a crash never inserts a
+    vote twice.
+
+    Every process locks its own journal file in ``directory`` (votes-0,
+    votes-1, ...), so several workers can ingest at once and a restarted
+    worker picks up whatever its predecessor left behind.
+
+    The writer inserts with the same check as a synchronous vote (the
+    candidate stands in the election and the election is still active, or
+    was completed after the vote was journaled).
+    A vote that fails it, or fails for any reason other than being a
+    duplicate, was already acknowledged, so it is never just dropped: it
+    is appended to the shared dead-letter file (dead-letter.journal) with
+    the reason, counted in stats()['failed'] and logged as an error.
+    """
+
+    def __init__(self, app, directory, batch_size=500, flush_interval=0.2, rotate_bytes=64 * 1024 * 1024):
+        self.app = app
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._file = None
+        self.name = None
+        self._seq = 0
+        self._synced_seq = 0
+        self._checkpoint = 0
+        self._thread = None
+
+        self.accepted = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.batches = 0
+
+    # --------------------- Startup and replay ---------------------
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        n = 0
+        while True:
+            path = os.path.join(self.directory, f'votes-{n}.journal')
+            f = open(path, 'a+', encoding='utf-8')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                n += 1
+                continue
+            self._file = f
+            self.name = f'votes-{n}'
+            return
+
+    def _replay(self):
+        cursor = get_db().cursor()
+        cursor.execute("SELECT last_seq FROM vote_journal_checkpoints WHERE journal = %s", (self.name,))
+        row = cursor.fetchone()
+        cursor.close()
+        self._checkpoint = self._seq = row[0] if row else 0
+
+        self._file.seek(0)
+        replayed = 0
+        # readline(), not iteration, which would leave tell() disabled for _maybe_rotate()
+        for line in iter(self._file.readline, ''):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn final write from a crash; it was never acknowledged
+                break
+            self._seq = max(self._seq, entry['seq'])
+            if entry['seq'] > self._checkpoint:
+                self._pending.append(entry)
+                replayed += 1
+        self._synced_seq = self._seq
+        if replayed:
+            self.app.logger.warning('Replaying %d journaled vote(s) from %s', replayed, self.name)
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._open()
+            self._replay()
+            self._thread = threading.Thread(target=self._run, name='vote-writer', daemon=True)
+            self._thread.start()
+
+    # --------------------- Accepting votes ---------------------
+
+    def append(self, voter_id, candidate_id, election_id):
+        """Durably journal one vote; returns once it is safe to acknowledge."""
+        self.start()
+        with self._write_lock:
+            self._seq += 1
+            entry = {
+                'seq': self._seq,
+                'voter_id': voter_id,
+                'candidate_id': candidate_id,
+                'election_id': election_id,
+                'voted_at': datetime.now().isoformat(sep=' ', timespec='seconds'),
+            }
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            seq = self._seq
+        self._sync(seq)
+        with self._cond:
+            self._pending.append(entry)
+            self.accepted += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _sync(self, seq):
+        # Group fsync: whoever gets the lock syncs every write made so far
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                return
+            with self._write_lock:
+                through = self._seq
+            os.fsync(self._file.fileno())
+            self._synced_seq = through
+
+    # --------------------- Background writer ---------------------
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            if not batch:
+                self._maybe_rotate()
+                continue
+            try:
+                with self.app.app_context():
+                    self._write(batch)
+            except Exception:
+                self.app.logger.exception('Vote batch failed; retrying')
+                with self._cond:
+                    self._pending.extendleft(reversed(batch))
+                time.sleep(self.flush_interval)
+
+    def _insert(self, conn, cursor, rows):
+        # Rows inserted, duplicates, (index, reason) of the rows that failed
+        try:
+            cursor.execute(insert_votes_sql(len(rows)), [value for row in rows for value in row])
+            if cursor.rowcount == len(rows):
+                return rows, 0, []
+        except IntegrityError:
+            pass
+        # Some row failed: undo the rest of the batch and go row by row to
+        # find out which, keeping the good ones
+        conn.rollback()
+        inserted, duplicates, failed = [], 0, []
+        for index, row in enumerate(rows):
+            try:
+                cursor.execute(insert_votes_sql(1), row)
+            except IntegrityError as e:
+                if is_duplicate(e):
+                    duplicates += 1
+                else:
+                    failed.append((index, str(e)))
+                continue
+            if cursor.rowcount:
+                inserted.append(row)
+            else:
+                failed.append((index, 'candidate not standing, or election completed before the vote'))
+        return inserted, duplicates, failed
+
+    def _dead_letter(self, batch, failed):
+        # Before the checkpoint commits, so a crash can only repeat entries
+        # (recognisable by journal and seq), never lose them
+        path = os.path.join(self.directory, 'dead-letter.journal')
+        with open(path, 'a', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            for index, reason in failed:
+                entry = dict(batch[index], journal=self.name, reason=reason)
+                self.app.logger.error('Journaled vote not recorded, moved to %s: %r', path, entry)
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write(self, batch):
+        from results_cache import get_results_cache
+        from vote_guard import get_vote_guard
+
+        conn = get_db()
+        cursor = conn.cursor()
+        rows = [(e['voter_id'], e['candidate_id'], e['election_id'], e['voted_at']) for e in batch]
+        inserted, duplicates, failed = self._insert(conn, cursor, rows)
+        if failed:
+            self._dead_letter(batch, failed)
+
+        counts = Counter((election_id, candidate_id) for _, candidate_id, election_id, _ in inserted)
+        add_to_tallies(cursor, counts)
+        cursor.execute(
+            "INSERT INTO vote_journal_checkpoints (journal, last_seq) VALUES (%s, %s) "
+            "ON DUPLICATE KEY UPDATE last_seq = VALUES(last_seq)",
+            (self.name, batch[-1]['seq'])
+        )
+        conn.commit()
+        cursor.close()
+
+        guard = get_vote_guard()
+        for voter_id, _, election_id, _ in inserted:
+            guard.mark(voter_id, election_id)
+        for election_id in {election_id for election_id, _ in counts}:
+            get_results_cache().invalidate(election_id)
+
+        with self._cond:
+            self._checkpoint = batch[-1]['seq']
+            self.inserted += len(inserted)
+            self.duplicates += duplicates
+            self.failed += len(failed)
+            self.batches += 1
+
+    def _maybe_rotate(self):
+        # Start a fresh file once everything in the current one is in the database
+        with self._write_lock:
+            if self._checkpoint < self._seq or self._file.tell() < self.rotate_bytes:
+                return
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+
+    def stats(self):
+        with self._cond:
+            oldest = self._pending[0]['voted_at'] if self._pending else None
+            return {
+                'journal': self.name,
+                'accepted': self.accepted,
+                'inserted': self.inserted,
+                'duplicates_dropped': self.duplicates,
+                'failed': self.failed,
+                'batches': self.batches,
+                'lag_votes': len(self._pending),
+                'lag_seconds': (datetime.now() - datetime.fromisoformat(oldest)).total_seconds() if oldest else 0,
+                'last_seq': self._seq,
+                'checkpoint_seq': self._checkpoint,
+            }
+
+
+def _last_seq(path):
+    # The seq of the last complete entry, reading only the end of the file
+    with open(path, 'rb') as f:
+        f.seek(max(0, f.seek(0, os.SEEK_END) - 4096))
+        lines = f.read().split(b'\n')
+    for line in reversed(lines):
+        try:
+            return json.loads(line)['seq']
+        except ValueError:
+            continue
+    return 0
+
+
+def journaled_seqs(directory):
+    """Journal name -> seq of its last entry, for each journal in ``directory`` holding any."""
+    seqs = {}
+    for path in glob.glob(os.path.join(directory, 'votes-*.journal')):
+        seq = _last_seq(path)
+        if seq:
+            seqs[os.path.basename(path)[:-len('.journal')]] = seq
+    return seqs
+
+
+def wait_for_writers(directory, timeout, heartbeat=None, interval=1.0):
+    """Wait until every vote journaled so far in ``directory`` is in the database.
+
+    For work that must see every acknowledged vote, such as archiving an
+    election just completed; votes journaled after it was completed are
+    refused by the writer anyway. ``heartbeat()`` is called on every poll. Raises
+    JournalBehind if the writers have not caught up after ``timeout``
+    seconds (a journal left by a dead process waits for its replacement).
+    """
+    marks = journaled_seqs(directory)
+    deadline = time.monotonic() + timeout
+    while marks:
+        conn = get_db()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT journal, last_seq FROM vote_journal_checkpoints "
+            f"WHERE journal IN ({', '.join(['%s'] * len(marks))})",
+            list(marks)
+        )
+        for name, last_seq in cursor.fetchall():
+            if last_seq >= marks[name]:
+                del marks[name]
+        cursor.close()
+        # A fresh snapshot for the next poll
+        conn.commit()
+        if not marks:
+            break
+        if time.monotonic() >= deadline:
+            raise JournalBehind(f'Journaled votes not yet in the database (journal: seq) {marks}')
+        if heartbeat is not None:
+            heartbeat()
+        time.sleep(interval)
+
+
+def journal_directory(app):
+    return os.path.join(app.root_path, app.config['VOTE_JOURNAL_DIR'])
+
+
+def init_vote_journal(app):
+    if app.config['VOTE_INGEST_MODE'] != 'journal':
+        return
+    app.extensions['vote_journal'] = VoteJournal(
+        app,
+        journal_directory(app),
+        batch_size=app.config['VOTE_BATCH_SIZE'],
+        flush_interval=app.config['VOTE_FLUSH_INTERVAL'],
+    )
+
+
+def get_vote_journal():
+    return current_app.extensions.get('vote_journal')
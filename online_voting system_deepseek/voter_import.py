@@ -0,0 +1,156 @@
+import csv
+import functools
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.security import generate_password_hash
+
+from db import get_db, IntegrityError
+from tallies import bump_counter
+
+FIELDS = ('full_name', 'voter_id', 'email', 'password')
+
+
+def read_roll(path, fmt):
+    """Yield (line_number, row) pairs from a CSV or JSONL voter roll, one at a time."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+
+
+def _existing(cursor, rows):
+    voter_ids = [row['voter_id'] for _, row in rows]
+    emails = [row['email'] for _, row in rows]
+    cursor.execute(
+        "SELECT voter_id, email FROM voters WHERE voter_id IN ({0}) OR email IN ({1})".format(
+            ', '.join(['%s'] * len(voter_ids)), ', '.join(['%s'] * len(emails))),
+        voter_ids + emails
+    )
+    taken_ids, taken_emails = set(), set()
+    for voter_id, email in cursor.fetchall():
+        taken_ids.add(voter_id)
+        taken_emails.add(email)
+    return taken_ids, taken_emails
+
+
+def _screen(cursor, chunk):
+    """Split a chunk into rows to insert and (line, reason) rejects."""
+    accepted, rejected = [], []
+    valid = []
+    for line_number, row in chunk:
+        row = {field: str(row.get(field) or '').strip() for field in FIELDS}
+        missing = [field for field in FIELDS if not row[field]]
+        if missing:
+            rejected.append((line_number, 'missing ' + ', '.join(missing)))
+        else:
+            valid.append((line_number, row))
+    if not valid:
+        return accepted, rejected
+
+    taken_ids, taken_emails = _existing(cursor, valid)
+    for line_number, row in valid:
+        if row['voter_id'] in taken_ids:
+            rejected.append((line_number, f"duplicate voter_id {row['voter_id']}"))
+        elif row['email'] in taken_emails:
+            rejected.append((line_number, f"duplicate email {row['email']}"))
+        else:
+            # Also catches duplicates inside the same chunk
+            taken_ids.add(row['voter_id'])
+            taken_emails.add(row['email'])
+            accepted.append((line_number, row))
+    return accepted, rejected
+
+
+def _insert(conn, cursor, rows, hashes):
+    sql = "INSERT INTO voters (full_name, voter_id, email, password) VALUES (%s, %s, %s, %s)"
+    params = [(row['full_name'], row['voter_id'], row['email'], pwhash)
+              for (_, row), pwhash in zip(rows, hashes)]
+    try:
+        cursor.executemany(sql, params)
+        bump_counter(cursor, 'voters', len(params))
+        conn.commit()
+        return len(params), []
+    except IntegrityError:
+        # Someone registered one of these voters meanwhile: fall back to
+        # row-by-row so only the clashing rows are rejected
+        conn.rollback()
+    inserted, rejected = 0, []
+    for (line_number, row), values in zip(rows, params):
+        try:
+            cursor.execute(sql, values)
+            inserted += 1
+        except IntegrityError as e:
+            rejected.append((line_number, f'duplicate ({e.args[-1]})'))
+    if inserted:
+        bump_counter(cursor, 'voters', inserted)
+    conn.commit()
+    return inserted, rejected
+
+
+# --------------------- CLI: flask voters ... ---------------------
+
+voters_cli = AppGroup('voters', help='Voter roll maintenance.')
+
+
+@voters_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Roll format; guessed from the file extension by default.')
+@click.option('--batch-size', type=int, default=1000, show_default=True,
+              help='Rows per INSERT batch and per transaction.')
+@click.option('--workers', type=int, default=os.cpu_count() or 1, show_default=True,
+              help='Processes used to hash initial passwords.')
+@click.option('--rejects', type=click.File('w'), default=None,
+              help='Write rejected rows here instead of to stderr.')
+def import_command(path, fmt, batch_size, workers, rejects):
+    """Import a voter roll with columns full_name, voter_id, email, password."""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+    hash_password = functools.partial(
+        generate_password_hash,
+        method=current_app.config['PASSWORD_HASH_METHOD'],
+        salt_length=current_app.config['PASSWORD_SALT_LENGTH'],
+    )
+    conn = get_db()
+    cursor = conn.cursor()
+    rows_in = inserted = rejected_count = 0
+    start = time.monotonic()
+    roll = read_roll(path, fmt)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            chunk = list(itertools.islice(roll, batch_size))
+            if not chunk:
+                break
+            rows_in += len(chunk)
+            accepted, rejected = _screen(cursor, chunk)
+            if accepted:
+                hashes = list(pool.map(hash_password, [row['password'] for _, row in accepted],
+                                       chunksize=max(1, len(accepted) // (workers * 4))))
+                count, clashes = _insert(conn, cursor, accepted, hashes)
+                inserted += count
+                rejected += clashes
+
+            for line_number, reason in rejected:
+                click.echo(f'line {line_number}: {reason}', file=rejects or sys.stderr)
+            rejected_count += len(rejected)
+
+            elapsed = time.monotonic() - start
+            click.echo(f'{rows_in} rows read, {inserted} inserted, {rejected_count} rejected '
+                       f'({rows_in / elapsed:.0f} rows/s)')
+
+    cursor.close()
+    elapsed = time.monotonic() - start
+    click.echo(f'Done in {elapsed:.1f}s: {inserted} voters imported, {rejected_count} rejected.')
@@ -0,0 +1,60 @@
+"""Production entry point: load_app() is what gunicorn loads.
+
+    gunicorn -c gunicorn.conf.py 'wsgi:load_app()'
+
+app.py builds the Flask app when it is imported (with any VOTING_SETTINGS
+overrides), so load_app() is not a factory. The import only configures:
+it opens no connection, starts no thread and leaves the shared store
+alone, so `flask` commands and benchmarks can import it next to running
+servers. load_app() is where a server starts: it resets the shared store
+(a new epoch, so nothing cached before a restart is trusted), loads the
+hot read-mostly state once (the active election index into the shared
+store, the results_published flag, the voted-set bitmaps of open
+elections, every compiled template) and returns the app. With
+preload_app, as in gunicorn.conf.py, that happens once in the master:
+workers fork with code, templates and caches already loaded, share those
+memory pages with the master until they write to them, and find the
+shared store warm instead of each querying the database for it.
+"""
+import logging
+from datetime import datetime
+
+from db import Error, dispose_pools
+
+log = logging.getLogger('voting.wsgi')
+
+
+def warm(app):
+    """Load the hot state and compile every template; leaves no connection open."""
+    from app import results_published
+    from election_index import get_election_index
+    from vote_guard import get_vote_guard
+
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    with app.app_context():
+        try:
+            elections = get_election_index().open_elections(datetime.now())
+            results_published()
+            # Otherwise the first vote in each election pays for a scan of its votes
+            get_vote_guard().warm([election['id'] for election in elections])
+        except Error:
+            # Workers load it on first use instead
+            log.warning('Could not warm the election index and vote guard', exc_info=True)
+        # Connections opened here must not be inherited by forked workers
+        dispose_pools()
+
+
+def after_fork(app):
+    """Reset per-process state a worker inherited from a preloading master."""
+    with app.app_context():
+        dispose_pools(close=False)
+
+
+def load_app(warm_up=True):
+    """The app built by app.py, started and warmed unless ``warm_up`` is False."""
+    from app import app
+    app.extensions['shared_store'].reset()
+    if warm_up:
+        warm(app)
+    return app